@@ -0,0 +1,306 @@
+import requests
+import argparse
+import time
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from test_pipeline import BASE_URL, get_video_duration, file_hash, lookup_video
+from prereduce import reduce_video, cleanup as cleanup_reduced
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.m4v', '.mkv', '.webm')
+DEFAULT_TIMEOUT = 300  # Used when ffprobe can't size a video
+UPLOAD_TIMEOUT = (10, 600)  # (connect, read) seconds; read covers the server hashing and queueing the upload
+POLL_TIMEOUT = (10, 30)
+QUEUE_TIMEOUT = 3600  # Longest a job may wait in the server's queue before it starts processing
+MAX_POLL_FAILURES = 10  # Consecutive failed status checks before giving up on a job
+
+_print_lock = threading.Lock()
+
+def log(message):
+    """Thread-safe print so concurrent uploads don't interleave lines."""
+    with _print_lock:
+        print(message, flush=True)
+
+def find_videos(directory):
+    """Recursively collects video files under a directory."""
+    videos = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.lower().endswith(VIDEO_EXTENSIONS):
+                videos.append(os.path.join(root, name))
+    return videos
+
+def plan_work(paths):
+    """
+    Probes every video and orders the work longest-first.
+    Scheduling long videos first keeps the tail of the batch short when
+    the in-flight limit is smaller than the number of videos.
+    """
+    items = []
+    for path in paths:
+        start = time.time()
+        duration = get_video_duration(path)
+        items.append({
+            "path": path,
+            "bytes": os.path.getsize(path),
+            "duration": duration,
+            # Same sizing rule as test_pipeline: 2x duration + 60s buffer
+            "timeout": int(duration * 2 + 60) if duration else DEFAULT_TIMEOUT,
+            "probe_seconds": time.time() - start
+        })
+    items.sort(key=lambda item: item["duration"] or 0, reverse=True)
+    return items
+
+def upload(avatar_id, path, audio_path=None, content_hash=None):
+    """Uploads one video (plus optional separate audio) and returns the job id (raises on failure)."""
+    url = f"{BASE_URL}/ingest/{avatar_id}"
+    with open(path, 'rb') as f:
+        files = {'video': (os.path.basename(path), f, 'video/mp4')}
+        if audio_path:
+            files['audio'] = (os.path.basename(audio_path), open(audio_path, 'rb'), 'audio/mpeg')
+        data = {'contentHash': content_hash} if content_hash else None
+        try:
+            response = requests.post(url, files=files, data=data, timeout=UPLOAD_TIMEOUT)
+        finally:
+            if audio_path:
+                files['audio'][1].close()
+    if response.status_code != 200:
+        raise RuntimeError(f"Upload failed: {response.text}")
+    return response.json().get('jobId')
+
+def wait_for_job(job_id, timeout, poll_interval, queue_timeout=QUEUE_TIMEOUT):
+    """
+    Polls a job until it completes (raises on failure or timeout).
+    `timeout` only starts once a worker picks the job up; time spent waiting in
+    the server's queue is bounded separately by `queue_timeout`.
+    A failed status check is retried rather than treated as a failed job.
+    """
+    url = f"{BASE_URL}/ingest/status/{job_id}"
+    queued_at = time.time()
+    processing_since = None
+    failures = 0
+    while True:
+        now = time.time()
+        if processing_since is not None and now - processing_since >= timeout:
+            raise TimeoutError(f"Ingestion did not complete within {timeout}s of processing")
+        if processing_since is None and now - queued_at >= queue_timeout:
+            raise TimeoutError(f"Job still queued after {queue_timeout}s")
+
+        try:
+            response = requests.get(url, timeout=POLL_TIMEOUT)
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+            job = response.json()
+        except (requests.RequestException, RuntimeError, ValueError) as e:
+            failures += 1
+            if failures >= MAX_POLL_FAILURES:
+                raise RuntimeError(f"Could not check status after {failures} attempts: {e}")
+            time.sleep(poll_interval)
+            continue
+        failures = 0
+
+        status = job.get('status')
+        if status == 'completed':
+            return
+        if status == 'failed':
+            raise RuntimeError(f"Ingestion failed: {job.get('error')}")
+        if status == 'processing' and processing_since is None:
+            processing_since = time.time()
+        time.sleep(poll_interval)
+
+def ingest_one(avatar_id, item, retries, poll_interval, reduce=False, split_streams=False):
+    """Uploads and tracks a single video, retrying the whole attempt on failure."""
+    name = os.path.basename(item["path"])
+    result = {
+        "path": item["path"],
+        "bytes": item["bytes"],
+        "uploaded_bytes": item["bytes"],
+        "duration": item["duration"],
+        "attempts": 0,
+        "success": False,
+        "job_id": None,
+        "deduplicated": False,
+        "error": None,
+        "stages": {"probe": item["probe_seconds"], "hash": 0.0, "reduce": 0.0, "upload": 0.0, "processing": 0.0}
+    }
+
+    # Skip the upload entirely when the server already has (or is processing) this content
+    hash_start = time.time()
+    content_hash = file_hash(item["path"])
+    result["stages"]["hash"] = time.time() - hash_start
+    try:
+        known = lookup_video(avatar_id, content_hash)
+    except Exception as e:
+        known = {"known": False}
+        log(f"    WARNING: {name}: duplicate lookup failed: {e}")
+    if known.get("known"):
+        result["job_id"] = known.get("jobId")
+        result["deduplicated"] = True
+        result["uploaded_bytes"] = 0
+        log(f"[*] {name} already known to server (job {result['job_id']}, {known.get('status')})")
+        if known.get("status") == "completed":
+            result["success"] = True
+            return result
+        return _track_existing(item, result, poll_interval)
+
+    upload_path, audio_path, reduced = item["path"], None, None
+    if reduce:
+        # Reduce once up front; retries re-send the same reduced files
+        reduce_start = time.time()
+        try:
+            reduced = reduce_video(item["path"], split_streams=split_streams)
+            upload_path, audio_path = reduced["video"], reduced["audio"]
+            result["uploaded_bytes"] = reduced["bytes"]
+        except Exception as e:
+            log(f"    WARNING: {name}: reduction failed, uploading original: {e}")
+        result["stages"]["reduce"] = time.time() - reduce_start
+
+    try:
+        return _attempt_ingest(avatar_id, item, result, upload_path, audio_path, content_hash, retries, poll_interval)
+    finally:
+        if reduced:
+            cleanup_reduced(reduced)
+
+def _track_existing(item, result, poll_interval):
+    """Waits on a job someone else already started for the same content."""
+    processing_start = time.time()
+    try:
+        wait_for_job(result["job_id"], item["timeout"], poll_interval)
+        result["success"] = True
+    except Exception as e:
+        result["error"] = str(e)
+    result["stages"]["processing"] = time.time() - processing_start
+    return result
+
+def _attempt_ingest(avatar_id, item, result, upload_path, audio_path, content_hash, retries, poll_interval):
+    """Retry loop for ingest_one."""
+    name = os.path.basename(item["path"])
+
+    for attempt in range(1, retries + 2):
+        result["attempts"] = attempt
+        try:
+            log(f"[*] Uploading {name} (attempt {attempt})...")
+            upload_start = time.time()
+            # Sending the hash makes retries of a flaky upload idempotent server-side
+            job_id = upload(avatar_id, upload_path, audio_path, content_hash)
+            result["stages"]["upload"] += time.time() - upload_start
+            result["job_id"] = job_id
+            log(f"    {name}: job {job_id} started")
+
+            processing_start = time.time()
+            try:
+                wait_for_job(job_id, item["timeout"], poll_interval)
+            finally:
+                result["stages"]["processing"] += time.time() - processing_start
+
+            result["success"] = True
+            result["error"] = None
+            log(f"    SUCCESS: {name} ingested")
+            return result
+        except Exception as e:
+            result["error"] = str(e)
+            log(f"    ERROR: {name}: {e}")
+            if attempt <= retries:
+                # Linear backoff keeps retries from stampeding a struggling server
+                time.sleep(poll_interval * attempt)
+
+    return result
+
+def stage_stats(values):
+    """Summarizes a list of stage durations in seconds."""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1]
+    }
+
+def summarize(results, wall_seconds, concurrency):
+    """Builds throughput and per-stage timing figures for a finished batch."""
+    succeeded = [r for r in results if r["success"]]
+    source_bytes = sum(r["bytes"] for r in succeeded)
+    uploaded_bytes = sum(r["uploaded_bytes"] for r in succeeded)
+    upload_seconds = sum(r["stages"]["upload"] for r in succeeded)
+    video_seconds = sum(r["duration"] or 0 for r in succeeded)
+
+    return {
+        "videos": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "retries": sum(max(r["attempts"] - 1, 0) for r in results),
+        "deduplicated": sum(1 for r in results if r["deduplicated"]),
+        "concurrency": concurrency,
+        "wall_seconds": wall_seconds,
+        "videos_per_hour": len(succeeded) / wall_seconds * 3600 if wall_seconds else 0,
+        "footage_seconds_per_hour": video_seconds / wall_seconds * 3600 if wall_seconds else 0,
+        # Effective rate across the whole batch vs. the rate of a single upload stream
+        "bytes_per_second": source_bytes / wall_seconds if wall_seconds else 0,
+        "uploaded_bytes": uploaded_bytes,
+        "reduction_ratio": source_bytes / uploaded_bytes if uploaded_bytes else 0,
+        "upload_bytes_per_second": uploaded_bytes / upload_seconds if upload_seconds else 0,
+        "stages": {
+            stage: stage_stats([r["stages"][stage] for r in succeeded])
+            for stage in ("probe", "hash", "reduce", "upload", "processing")
+        },
+        "results": results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest a directory of videos into one avatar")
+    parser.add_argument("directory", help="Directory to scan (recursively) for videos")
+    parser.add_argument("avatar_id", help="The UUID of the avatar to ingest into")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum videos in flight at once")
+    parser.add_argument("--retries", type=int, default=2, help="Retries per video after the first attempt")
+    parser.add_argument("--poll-interval", type=float, default=5, help="Seconds between job status checks")
+    parser.add_argument("--reduce", action="store_true", help="Downscale and drop frame rate with ffmpeg before uploading")
+    parser.add_argument("--split-streams", action="store_true", help="With --reduce, upload video-only and audio-only streams separately")
+    parser.add_argument("--summary", default="ingest_summary.json", help="Where to write the JSON summary")
+    args = parser.parse_args()
+
+    paths = find_videos(args.directory)
+    if not paths:
+        print(f"[!] No videos found in {args.directory}")
+        return
+
+    print(f"[*] Probing {len(paths)} videos...")
+    items = plan_work(paths)
+    total_bytes = sum(item["bytes"] for item in items)
+    print(f"[*] {len(items)} videos, {total_bytes / 1e6:.1f} MB, concurrency {args.concurrency}")
+
+    start = time.time()
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+        futures = [
+            pool.submit(ingest_one, args.avatar_id, item, args.retries, args.poll_interval,
+                        args.reduce, args.split_streams)
+            for item in items
+        ]
+        for future in as_completed(futures):
+            results.append(future.result())
+    wall_seconds = time.time() - start
+
+    summary = summarize(results, wall_seconds, args.concurrency)
+    with open(args.summary, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    print("\n[*] BATCH COMPLETE.")
+    print(f"    Succeeded: {summary['succeeded']}/{summary['videos']} "
+          f"(retries: {summary['retries']}, already ingested: {summary['deduplicated']})")
+    print(f"    Wall time: {wall_seconds:.1f}s")
+    print(f"    Throughput: {summary['videos_per_hour']:.1f} videos/hour, "
+          f"{summary['bytes_per_second'] / 1e6:.2f} MB/s")
+    if args.reduce:
+        print(f"    Upload reduction: {summary['reduction_ratio']:.1f}x")
+    for stage, stats in summary["stages"].items():
+        if stats["count"]:
+            print(f"    {stage}: mean {stats['mean']:.1f}s, p95 {stats['p95']:.1f}s, max {stats['max']:.1f}s")
+    print(f"[*] Summary written to {args.summary}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import os
+import subprocess
+import tempfile
+
+# The vision stage samples 1s clips at fps=30 with sampling_ratio=0.1, so it
+# never looks at more than ~3 frames per second. Audio only needs to be good
+# enough for Whisper, which resamples to 16kHz mono internally anyway.
+TARGET_HEIGHT = 360
+TARGET_FPS = 3
+AUDIO_SAMPLE_RATE = 16000
+AUDIO_BITRATE = "48k"
+
+def run_ffmpeg(args):
+    """Runs ffmpeg quietly, raising with its stderr on failure."""
+    result = subprocess.run(
+        ['ffmpeg', '-y', '-v', 'error'] + args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()}")
+
+def reduce_video(file_path, split_streams=False, out_dir=None, height=TARGET_HEIGHT, fps=TARGET_FPS):
+    """
+    Shrinks a video down to what the ingestion pipeline actually consumes.
+
+    Returns a dict with 'video', 'audio' (None unless split_streams) and
+    'bytes' (total size of the reduced files). When split_streams is set the
+    video is written without audio and the audio track is extracted to a
+    separate MP3, so each stage on the server only receives what it needs.
+    Container metadata (creation_time) is preserved since the server uses it
+    to place memories on the avatar's timeline.
+    """
+    owns_dir = out_dir is None
+    out_dir = out_dir or tempfile.mkdtemp(prefix="avatar_reduce_")
+    base = os.path.splitext(os.path.basename(file_path))[0]
+    video_out = os.path.join(out_dir, f"{base}_reduced.mp4")
+    audio_out = os.path.join(out_dir, f"{base}_audio.mp3") if split_streams else None
+
+    video_args = [
+        '-i', file_path,
+        '-map_metadata', '0',
+        '-vf', f"fps={fps},scale=-2:{height}",
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '28',
+    ]
+    if split_streams:
+        video_args += ['-an']
+    else:
+        video_args += ['-c:a', 'aac', '-ac', '1', '-ar', str(AUDIO_SAMPLE_RATE), '-b:a', AUDIO_BITRATE]
+    run_ffmpeg(video_args + ['-movflags', '+faststart', video_out])
+
+    if split_streams:
+        run_ffmpeg([
+            '-i', file_path,
+            '-map_metadata', '0',
+            '-vn', '-ac', '1', '-ar', str(AUDIO_SAMPLE_RATE),
+            '-c:a', 'libmp3lame', '-b:a', AUDIO_BITRATE,
+            audio_out
+        ])
+
+    total = os.path.getsize(video_out) + (os.path.getsize(audio_out) if audio_out else 0)
+    return {"video": video_out, "audio": audio_out, "bytes": total,
+            "dir": out_dir if owns_dir else None}
+
+def cleanup(reduced):
+    """Removes the files produced by reduce_video."""
+    for key in ("video", "audio"):
+        path = reduced.get(key)
+        if path and os.path.exists(path):
+            os.remove(path)
+    if reduced.get("dir"):
+        try:
+            os.rmdir(reduced["dir"])
+        except OSError:
+            pass
@@ -2,38 +2,78 @@ import ffmpeg from 'fluent-ffmpeg';
 import fs from 'fs';
 import path from 'path';
 import { AudioTranscript } from '../types';
+import { mapWithConcurrency } from '../concurrency';
 import OpenAI from 'openai';
 
 // Placeholder for OpenAI client
 // In a real app, inject this instance or key
 const openai = new OpenAI({ apiKey: process.env.OPENAI_API_KEY || 'mock-key' });
 
+// Chunks aim for TARGET seconds, cut at the nearest silence; MAX keeps each
+// upload well under Whisper's 25MB limit even at 128kbps.
+const TARGET_CHUNK_SECONDS = parseFloat(process.env.AUDIO_CHUNK_SECONDS || '300');
+const MAX_CHUNK_SECONDS = 900;
+const TRANSCRIBE_CONCURRENCY = parseInt(process.env.TRANSCRIBE_CONCURRENCY || '4', 10);
+const TRANSCRIBE_ATTEMPTS = parseInt(process.env.TRANSCRIBE_ATTEMPTS || '3', 10);
+const TRANSCRIBE_RETRY_MS = 2000; // Doubled after each failed attempt
+const SILENCE_NOISE = '-30dB';
+const SILENCE_MIN_SECONDS = 0.4;
+
+interface AudioChunk {
+    path: string;
+    start: number; // seconds from the start of the recording
+    duration: number;
+}
+
 export class AudioProcessor {
     constructor() { }
 
     /**
      * Extracts audio from video and transcribes it.
+     * If the client already uploaded an extracted MP3 (uploadedAudioPath), extraction is skipped.
+     * The upload itself is left in place (the job owns it until it completes, and a retried
+     * job needs it again).
+     * Long recordings are split at silences and transcribed concurrently; segment timestamps
+     * are offsets from startTime (the video's creation time).
      */
-    async processAudio(videoPath: string): Promise<AudioTranscript[]> {
+    async processAudio(videoPath: string, uploadedAudioPath?: string, startTime: Date = new Date()): Promise<AudioTranscript[]> {
         const audioPath = videoPath.replace(/\.[^/.]+$/, "") + "_extracted.mp3";
 
-        console.log(`[Audio] Extracting audio to ${audioPath}...`);
-        await this.extractAudio(videoPath, audioPath);
+        if (uploadedAudioPath) {
+            // Multer drops the extension; Whisper needs it to detect the format.
+            // Link (or copy) rather than move, so a retry of this job still finds the upload.
+            console.log(`[Audio] Using pre-extracted audio track ${uploadedAudioPath}`);
+            if (fs.existsSync(audioPath)) fs.unlinkSync(audioPath); // Left behind by a crashed attempt
+            try {
+                fs.linkSync(uploadedAudioPath, audioPath);
+            } catch {
+                fs.copyFileSync(uploadedAudioPath, audioPath);
+            }
+        } else {
+            console.log(`[Audio] Extracting audio to ${audioPath}...`);
+            await this.extractAudio(videoPath, audioPath);
+        }
 
-        console.log(`[Audio] Transcribing...`);
-        const transcripts = await this.transcribe(audioPath);
+        let chunks: AudioChunk[] = [];
+        try {
+            chunks = await this.segment(audioPath);
+            console.log(`[Audio] Transcribing ${chunks.length} chunk(s), ${TRANSCRIBE_CONCURRENCY} at a time...`);
 
-        console.log(`[Audio] Transcription complete. Found ${transcripts.length} segments.`);
-        if (transcripts.length > 0) {
-            console.log(`[Audio] Sample: "${transcripts[0].text}"`);
-        }
+            const perChunk = await mapWithConcurrency(chunks, TRANSCRIBE_CONCURRENCY,
+                chunk => this.transcribe(chunk, startTime));
+            const transcripts = perChunk.flat();
 
-        // Cleanup
-        if (fs.existsSync(audioPath)) {
-            fs.unlinkSync(audioPath);
+            console.log(`[Audio] Transcription complete. Found ${transcripts.length} segments.`);
+            if (transcripts.length > 0) {
+                console.log(`[Audio] Sample: "${transcripts[0].text}"`);
+            }
+            return transcripts;
+        } finally {
+            // Cleanup
+            for (const file of new Set([audioPath, ...chunks.map(c => c.path)])) {
+                if (fs.existsSync(file)) fs.unlinkSync(file);
+            }
         }
-
-        return transcripts;
     }
 
     private extractAudio(inputPath: string, outputPath: string): Promise<void> {
@@ -48,38 +88,148 @@ export class AudioProcessor {
         });
     }
 
-    private async transcribe(audioPath: string): Promise<AudioTranscript[]> {
+    private getDuration(audioPath: string): Promise<number> {
+        return new Promise((resolve, reject) => {
+            ffmpeg.ffprobe(audioPath, (err, metadata) => {
+                if (err) return reject(err);
+                resolve(parseFloat(String(metadata.format.duration || 0)));
+            });
+        });
+    }
+
+    /**
+     * Midpoints of detected silences, in seconds. These are safe places to cut
+     * without splitting a word between two Whisper requests.
+     */
+    private detectSilences(audioPath: string): Promise<number[]> {
+        return new Promise((resolve, reject) => {
+            const cuts: number[] = [];
+            let silenceStart: number | null = null;
+            ffmpeg(audioPath)
+                .audioFilters(`silencedetect=noise=${SILENCE_NOISE}:d=${SILENCE_MIN_SECONDS}`)
+                .format('null')
+                .output('-')
+                .on('stderr', (line: string) => {
+                    const start = line.match(/silence_start: ([\d.]+)/);
+                    const end = line.match(/silence_end: ([\d.]+)/);
+                    if (start) silenceStart = parseFloat(start[1]);
+                    if (end && silenceStart !== null) {
+                        cuts.push((silenceStart + parseFloat(end[1])) / 2);
+                        silenceStart = null;
+                    }
+                })
+                .on('end', () => resolve(cuts))
+                .on('error', (err) => reject(err))
+                .run();
+        });
+    }
+
+    /**
+     * Picks cut points: the last silence before each TARGET boundary, or a hard cut at
+     * MAX when a stretch has no usable silence.
+     */
+    private planCuts(duration: number, silences: number[]): number[] {
+        const cuts: number[] = [];
+        let chunkStart = 0;
+        while (duration - chunkStart > TARGET_CHUNK_SECONDS) {
+            const target = chunkStart + TARGET_CHUNK_SECONDS;
+            const limit = chunkStart + MAX_CHUNK_SECONDS;
+            const candidates = silences.filter(s => s > chunkStart + TARGET_CHUNK_SECONDS / 2 && s <= limit);
+            // Prefer the silence closest to the target length
+            const cut = candidates.length
+                ? candidates.reduce((best, s) => Math.abs(s - target) < Math.abs(best - target) ? s : best)
+                : Math.min(limit, duration);
+            if (cut >= duration) break;
+            cuts.push(cut);
+            chunkStart = cut;
+        }
+        return cuts;
+    }
+
+    private async segment(audioPath: string): Promise<AudioChunk[]> {
+        const duration = await this.getDuration(audioPath).catch(() => 0);
+        if (!duration || duration <= TARGET_CHUNK_SECONDS) {
+            return [{ path: audioPath, start: 0, duration }];
+        }
+
+        const cuts = this.planCuts(duration, await this.detectSilences(audioPath));
+        const bounds = [0, ...cuts, duration];
+        const base = audioPath.replace(/\.mp3$/, '');
+
+        // The caller only learns chunk paths on success, so a failed cut cleans up here:
+        // every cut settles (the rest are skipped once one fails), then all written parts go
+        const written: string[] = [];
+        let failure: Error | null = null;
+        const chunks = await mapWithConcurrency(bounds.slice(0, -1), TRANSCRIBE_CONCURRENCY, async (start, i) => {
+            const chunk = { path: `${base}_part${i}.mp3`, start, duration: bounds[i + 1] - start };
+            if (failure) return chunk;
+            written.push(chunk.path);
+            try {
+                await new Promise<void>((resolve, reject) => {
+                    ffmpeg(audioPath)
+                        .setStartTime(chunk.start)
+                        .setDuration(chunk.duration)
+                        .audioCodec('copy')
+                        .output(chunk.path)
+                        .on('end', () => resolve())
+                        .on('error', (err) => reject(err))
+                        .run();
+                });
+            } catch (e) {
+                failure = failure || (e as Error);
+            }
+            return chunk;
+        });
+
+        if (failure) {
+            for (const file of written) {
+                if (fs.existsSync(file)) fs.unlinkSync(file);
+            }
+            throw failure;
+        }
+        return chunks;
+    }
+
+    private async transcribe(chunk: AudioChunk, startTime: Date): Promise<AudioTranscript[]> {
+        const at = (offsetSeconds: number) =>
+            new Date(startTime.getTime() + (chunk.start + offsetSeconds) * 1000).toISOString();
+
         // Check if we are running with a mock key
         if (process.env.OPENAI_API_KEY === 'mock-key' || !process.env.OPENAI_API_KEY) {
             console.log("[Audio] Using MOCK transcription (no API key provided).");
             return [
-                { timestamp: new Date().toISOString(), text: "Um, hi, I'm just walking to the store.", fillerWords: ["Um"], dialect: "General American", sentiment: "Neutral" },
-                { timestamp: new Date().toISOString(), text: "It's pretty sunny out here, you know?", fillerWords: ["you know"], dialect: "General American", sentiment: "Positive" }
+                { timestamp: at(0), text: "Um, hi, I'm just walking to the store.", duration: 2.5, fillerWords: ["Um"], dialect: "General American", sentiment: "Neutral" },
+                { timestamp: at(3), text: "It's pretty sunny out here, you know?", duration: 2.5, fillerWords: ["you know"], dialect: "General American", sentiment: "Positive" }
             ];
         }
 
         // Real OpenAI Whisper implementation (simplified)
-        try {
-            const fileStream = fs.createReadStream(audioPath);
-            const transcript = await openai.audio.transcriptions.create({
-                file: fileStream,
-                model: "whisper-1",
-                response_format: "verbose_json", // Gives segments with time
-                timestamp_granularities: ["segment"] // or word
-            });
+        // A missing chunk would leave a hole in the transcript: retry it, then fail the stage
+        for (let attempt = 1; ; attempt++) {
+            try {
+                const fileStream = fs.createReadStream(chunk.path);
+                const transcript = await openai.audio.transcriptions.create({
+                    file: fileStream,
+                    model: "whisper-1",
+                    response_format: "verbose_json", // Gives segments with time
+                    timestamp_granularities: ["segment"] // or word
+                });
+
+                // Map Whisper result to our AudioTranscript format
+                // seg.start is relative to this chunk, which starts chunk.start into the recording
+                return (transcript as any).segments?.map((seg: any) => ({
+                    timestamp: at(seg.start),
+                    text: seg.text,
+                    duration: Math.max(0, seg.end - seg.start),
+                    // We'll need a secondary pass for dialect/filler words if Whisper cleans them up too much.
+                    // But strict prompt can help.
+                })) || [];
 
-            // Map Whisper result to our AudioTranscript format
-            // This is a rough mapping
-            return (transcript as any).segments?.map((seg: any) => ({
-                timestamp: new Date(Date.now() + seg.start * 1000).toISOString(), // Relative to start
-                text: seg.text,
-                // We'll need a secondary pass for dialect/filler words if Whisper cleans them up too much.
-                // But strict prompt can help. 
-            })) || [];
-
-        } catch (e) {
-            console.error("Transcribe error:", e);
-            return [];
+            } catch (e: any) {
+                console.error(`Transcribe error (chunk at ${chunk.start.toFixed(1)}s, attempt ${attempt}/${TRANSCRIBE_ATTEMPTS}):`, e?.message || e);
+                if (attempt >= TRANSCRIBE_ATTEMPTS) throw e;
+                await new Promise(resolve => setTimeout(resolve, TRANSCRIBE_RETRY_MS * 2 ** (attempt - 1)));
+            }
         }
     }
 }
@@ -0,0 +1,282 @@
+import fs from 'fs';
+import os from 'os';
+import path from 'path';
+
+// Rough resident cost of one Chromium page playing a video through the SDK
+const PAGE_MEMORY_BYTES = 300 * 1024 * 1024;
+// Upper bound on one job's use of a page; callers with a known video length pass their own
+const RUN_TIMEOUT_MS = parseInt(process.env.VISION_RUN_TIMEOUT_MS || '600000', 10);
+
+let sdkSourceCache: string | null = null;
+
+/**
+ * Reads the @overshoot/sdk ESM bundle once per process and rewrites it to expose
+ * RealtimeVision globally (the browser page loads it as an inline module).
+ */
+function loadSdkSource(): string {
+    if (sdkSourceCache === null) {
+        const sdkPath = path.resolve(process.cwd(), 'node_modules/@overshoot/sdk/dist/index.mjs');
+        const source = fs.readFileSync(sdkPath, 'utf-8');
+        // Hacky transformation: remove export, expose to window
+        sdkSourceCache = source.replace(/export\s*\{[^}]+\};/g, "window.RealtimeVision = RealtimeVision;");
+    }
+    return sdkSourceCache;
+}
+
+/**
+ * Page template with the SDK injected. runVision(apiKey, durationSeconds) can be
+ * called repeatedly on the same page; it resets its result buffers on each run.
+ */
+function pageHtml(sdkSource: string): string {
+    return `
+        <html>
+            <body>
+                <input type="file" id="video-upload" />
+                <script type="module">
+                    ${sdkSource}
+                </script>
+                <script>
+                    window.processResults = [];
+                    window.processingDone = false;
+
+                    window.runVision = async (apiKey, videoDuration) => {
+                        window.processResults = [];
+                        window.processingDone = false;
+                        try {
+                            const fileInput = document.getElementById('video-upload');
+                            if (!fileInput.files.length) throw new Error("No file selected in browser");
+
+                            const videoFile = fileInput.files[0];
+                            console.log('[Vision Stream] Browser loaded file: ' + videoFile.name);
+
+                            const vision = new window.RealtimeVision({
+                                apiUrl: 'https://cluster1.overshoot.ai/api/v0.2',
+                                apiKey: apiKey,
+                                prompt: 'The video is a First-Person View (Ego-centric) from the user\\'s smart glasses. Describe what the user is DOING (e.g., "User is typing", "User is holding a cup"). Do NOT describe people facing the camera as the user. Focus on the user\\'s hands, interactions, and environment.',
+                                source: { type: 'video', file: videoFile },
+                                processing: {
+                                    clip_length_seconds: 1,
+                                    delay_seconds: 1,
+                                    fps: 30,
+                                    sampling_ratio: 0.1
+                                },
+                                onResult: (result) => {
+                                    if (result.ok) {
+                                        const video = document.querySelector('video');
+                                        const timeStr = video ? (video.currentTime.toFixed(2) + 's') : '0s';
+
+                                        window.processResults.push({
+                                            timestamp: timeStr,
+                                            description: result.result
+                                        });
+                                        console.log('[Vision Stream] [' + timeStr + '] Result: ' + result.result.substring(0, 100) + '...');
+                                    }
+                                },
+                                onError: (err) => {
+                                    console.error('[Vision Stream] Error: ' + err.message);
+                                }
+                            });
+
+                            await vision.start();
+
+                            // Hard timer: stop processing based on video length
+                            console.log('[Vision Stream] Processing started. Timer set for ' + videoDuration + ' seconds...');
+                            setTimeout(() => {
+                                console.log('[Vision Stream] ' + videoDuration + 's reached. Stopping SDK...');
+                                vision.stop().then(() => {
+                                    // The SDK leaves its <video> element behind; drop it so the page stays reusable
+                                    document.querySelectorAll('video').forEach(v => v.remove());
+                                    window.processingDone = true;
+                                    console.log('[Vision Stream] Stream stopped. Processing complete.');
+                                }).catch(err => {
+                                    console.error('[Vision Stream] Error stopping vision:', err);
+                                    window.processingDone = true; // Still finish
+                                });
+                            }, videoDuration * 1000);
+
+                        } catch (e) {
+                            console.error(e.message);
+                            window.processingDone = true; // Exit
+                        }
+                    };
+                </script>
+            </body>
+        </html>
+    `;
+}
+
+/**
+ * Default pool size: the host's budget (Chromium decode + SDK capture is roughly half a core
+ * per page, plus free memory) split across the INGEST_WORKERS processes that each run a pool,
+ * and never more than the INGEST_JOB_CONCURRENCY jobs one process runs at a time.
+ * VISION_POOL_SIZE overrides all of it.
+ */
+export function defaultPoolSize(): number {
+    const configured = parseInt(process.env.VISION_POOL_SIZE || '', 10);
+    if (configured > 0) return configured;
+
+    const workers = Math.max(1, parseInt(process.env.INGEST_WORKERS || '1', 10) || 1);
+    const jobConcurrency = Math.max(1, parseInt(process.env.INGEST_JOB_CONCURRENCY || '2', 10) || 1);
+    const byCpu = Math.floor(os.cpus().length / 2 / workers);
+    const byMemory = Math.floor(os.freemem() / PAGE_MEMORY_BYTES / workers);
+    return Math.max(1, Math.min(byCpu, byMemory, jobConcurrency));
+}
+
+/**
+ * A single headless browser with a fixed number of warm pages that already have the
+ * Overshoot SDK loaded. Jobs wait in a FIFO queue for a free page.
+ */
+export class VisionBrowserPool {
+    readonly size: number;
+    private browser: any = null;
+    private launching: Promise<any> | null = null;
+    private pages = new Set<any>();
+    private creating = 0;
+    private idle: any[] = [];
+    private waiters: { resolve: (page: any) => void, reject: (e: Error) => void }[] = [];
+
+    constructor(size: number = defaultPoolSize()) {
+        this.size = size;
+    }
+
+    get queueDepth(): number {
+        return this.waiters.length;
+    }
+
+    /**
+     * Runs fn with exclusive use of a warm page, failing after timeoutMs (the wait for a
+     * free page isn't counted). A page that throws or times out is discarded rather than
+     * returned to the pool, since its state is unknown; closing it also aborts whatever
+     * fn was still waiting on.
+     */
+    async run<T>(fn: (page: any) => Promise<T>, timeoutMs: number = RUN_TIMEOUT_MS): Promise<T> {
+        const page = await this.acquire();
+        let timer: NodeJS.Timeout | undefined;
+        const timeout = new Promise<never>((_, reject) => {
+            timer = setTimeout(() => reject(new Error(`Vision page timed out after ${Math.round(timeoutMs / 1000)}s`)), timeoutMs);
+        });
+        try {
+            const result = await Promise.race([fn(page), timeout]);
+            this.release(page);
+            return result;
+        } catch (e) {
+            this.discard(page);
+            throw e;
+        } finally {
+            clearTimeout(timer);
+        }
+    }
+
+    async close(): Promise<void> {
+        const browser = this.browser;
+        this.browser = null;
+        this.pages.clear();
+        this.idle = [];
+        for (const waiter of this.waiters.splice(0)) waiter.reject(new Error('Vision pool closed'));
+        if (browser) await browser.close();
+    }
+
+    private async acquire(): Promise<any> {
+        while (this.idle.length) {
+            const page = this.idle.pop();
+            if (!page.isClosed()) return page;
+            this.pages.delete(page);
+        }
+
+        if (this.pages.size + this.creating < this.size) {
+            return this.createPage();
+        }
+
+        return new Promise((resolve, reject) => this.waiters.push({ resolve, reject }));
+    }
+
+    private release(page: any) {
+        const waiter = this.waiters.shift();
+        if (waiter) waiter.resolve(page);
+        else this.idle.push(page);
+    }
+
+    private discard(page: any) {
+        this.pages.delete(page);
+        page.close().catch(() => { });
+        this.fillFreeSlot();
+    }
+
+    /**
+     * Hands a free slot (a page that was discarded or never got created) to the next queued
+     * job by opening a page for it. If that fails too, the job is rejected and the slot
+     * passes on to the one after it, so no waiter is left hanging.
+     */
+    private fillFreeSlot() {
+        if (!this.waiters.length || this.pages.size + this.creating >= this.size) return;
+        const waiter = this.waiters.shift()!;
+        this.createPage().then(waiter.resolve, (e) => {
+            console.error('[VisionPool] Could not open page for queued job:', e.message);
+            waiter.reject(e);
+        });
+    }
+
+    private async getBrowser(): Promise<any> {
+        if (this.browser && this.browser.connected !== false) return this.browser;
+        if (!this.launching) {
+            // Dynamic Import Puppeteer (to avoid build-time issues if strict)
+            const puppeteer = require('puppeteer');
+            this.launching = puppeteer.launch({
+                headless: "new", // or true
+                args: ['--no-sandbox', '--disable-setuid-sandbox'] // Required for some environments like Render/Docker
+            }).then((browser: any) => {
+                browser.on('disconnected', () => {
+                    console.warn('[VisionPool] Browser disconnected, pool will relaunch on next job');
+                    if (this.browser === browser) {
+                        this.browser = null;
+                        this.pages.clear();
+                        this.idle = [];
+                        // Queued jobs would otherwise wait for pages that are gone
+                        while (this.waiters.length && this.creating < this.size) this.fillFreeSlot();
+                    }
+                });
+                this.browser = browser;
+                return browser;
+            }).finally(() => {
+                this.launching = null;
+            });
+        }
+        return this.launching;
+    }
+
+    private async createPage(): Promise<any> {
+        this.creating++;
+        let page: any;
+        try {
+            page = await this.openPage();
+        } catch (e) {
+            this.creating--;
+            // The slot this page was meant for is free again
+            this.fillFreeSlot();
+            throw e;
+        }
+        this.creating--;
+        this.pages.add(page);
+        console.log(`[VisionPool] Warm page ready (${this.pages.size}/${this.size})`);
+        return page;
+    }
+
+    private async openPage(): Promise<any> {
+        const browser = await this.getBrowser();
+        const page = await browser.newPage();
+
+        // Log Forwarding
+        page.on('console', (msg: any) => {
+            const text = msg.text();
+            if (text.startsWith('[Vision Stream]')) console.log(text);
+            else if (text.startsWith('[RealtimeVision]')) { /* Ignore noisy debug */ }
+            else if (msg.type() === 'error') console.error('[Browser Error]', text);
+        });
+
+        await page.setContent(pageHtml(loadSdkSource()));
+        return page;
+    }
+}
+
+// One pool per process, shared by every VisionProcessor
+export const visionPool = new VisionBrowserPool();
@@ -0,0 +1,87 @@
+import OpenAI from 'openai';
+
+const openai = new OpenAI({ apiKey: process.env.OPENAI_API_KEY || 'mock-key' });
+
+// Small vectors keep the per-avatar index cheap to hold in memory
+const DIMENSIONS = 256;
+const BATCH_SIZE = 256;
+
+export interface Embedder {
+    /** Stored next to each vector; vectors from different models are never compared */
+    readonly model: string;
+    readonly dimensions: number;
+    embed(texts: string[]): Promise<number[][]>;
+}
+
+function normalize(vector: number[]): number[] {
+    const norm = Math.sqrt(vector.reduce((sum, v) => sum + v * v, 0)) || 1;
+    return vector.map(v => v / norm);
+}
+
+/**
+ * OpenAI embeddings, batched and reduced to DIMENSIONS.
+ */
+export class OpenAIEmbedder implements Embedder {
+    readonly model = `text-embedding-3-small/${DIMENSIONS}`;
+    readonly dimensions = DIMENSIONS;
+
+    async embed(texts: string[]): Promise<number[][]> {
+        const vectors: number[][] = [];
+        for (let i = 0; i < texts.length; i += BATCH_SIZE) {
+            const response = await openai.embeddings.create({
+                model: 'text-embedding-3-small',
+                input: texts.slice(i, i + BATCH_SIZE).map(t => t || ' '),
+                dimensions: DIMENSIONS
+            });
+            vectors.push(...response.data.map(d => normalize(d.embedding)));
+        }
+        return vectors;
+    }
+}
+
+// 32-bit FNV-1a
+function fnv1a(text: string): number {
+    let hash = 0x811c9dc5;
+    for (let i = 0; i < text.length; i++) {
+        hash ^= text.charCodeAt(i);
+        hash = Math.imul(hash, 0x01000193);
+    }
+    return hash >>> 0;
+}
+
+/**
+ * Deterministic local stand-in: signed feature hashing of words and word bigrams.
+ * No network, same output every run, and texts sharing words land close together,
+ * which is enough for offline tests and MOCK runs.
+ */
+export class HashingEmbedder implements Embedder {
+    readonly model = `local-hashing/${DIMENSIONS}`;
+    readonly dimensions = DIMENSIONS;
+
+    async embed(texts: string[]): Promise<number[][]> {
+        return texts.map(text => this.embedOne(text));
+    }
+
+    private embedOne(text: string): number[] {
+        const vector = new Array(DIMENSIONS).fill(0);
+        const words = (text || '').toLowerCase().match(/[a-z0-9']+/g) || [];
+        const features = [...words, ...words.slice(1).map((w, i) => `${words[i]} ${w}`)];
+        for (const feature of features) {
+            const hash = fnv1a(feature);
+            vector[hash % DIMENSIONS] += (hash & 0x80000000) ? -1 : 1;
+        }
+        return normalize(vector);
+    }
+}
+
+/**
+ * EMBEDDING_PROVIDER=local forces the hashing stand-in; it is also used when
+ * no OpenAI key is configured.
+ */
+export function createEmbedder(): Embedder {
+    const mock = process.env.OPENAI_API_KEY === 'mock-key' || !process.env.OPENAI_API_KEY;
+    if (process.env.EMBEDDING_PROVIDER === 'local' || mock) {
+        return new HashingEmbedder();
+    }
+    return new OpenAIEmbedder();
+}
@@ -1,32 +1,233 @@
-import { AudioTranscript, VisualContext, PersonalityProfile } from '../types';
+import { AudioTranscript, VisualContext, PersonalityProfile, StyleDelta, StyleStats } from '../types';
+import { mapWithConcurrency } from '../concurrency';
 import OpenAI from 'openai';
 
 const openai = new OpenAI({ apiKey: process.env.OPENAI_API_KEY || 'mock-key' });
 
+// LLM input is bounded: at most MAX_WINDOWS windows per video, each with at most
+// WINDOW_SEGMENTS transcripts (+ visuals from the same stretch) and WINDOW_CHARS characters.
+// Fillers, phrases and speech rate are counted locally over everything.
+const WINDOW_SEGMENTS = parseInt(process.env.STYLE_WINDOW_SEGMENTS || '40', 10);
+const MAX_WINDOWS = parseInt(process.env.STYLE_MAX_WINDOWS || '3', 10);
+const WINDOW_CHARS = 8000;
+
+const FILLER_WORDS = ['um', 'uh', 'erm', 'hmm', 'like', 'you know', 'i mean', 'basically', 'actually', 'literally', 'kind of', 'sort of'];
+const PHRASE_MIN_COUNT = 2;   // A phrase must repeat within a video to count
+const PHRASES_KEPT = 50;      // Per-field stats are pruned to the most frequent entries
+const TOP_TRAITS = 8;
+const TOP_PHRASES = 8;
+// Segments without a duration (cached before durations were kept): speech is assumed to
+// run until the next segment, but no longer than this, so pauses don't count as speaking
+const MAX_SEGMENT_SECONDS = 8;
+// ...and this long for the last segment, whose end isn't known
+const LAST_SEGMENT_SECONDS = 5;
+
+const STOPWORDS = new Set(['the', 'a', 'an', 'and', 'or', 'to', 'of', 'in', 'on', 'it', 'is', 'i', 'you', 'that', 'this', 'was', 'for', 'at', 'with', 'be', 'so']);
+
+/**
+ * Counting key: case-insensitive, and Mongo field names can't contain '.' or start with '$'.
+ * The original wording is kept in `labels` for display.
+ */
+function statKey(key: string): string {
+    return key.toLowerCase().replace(/[.$]/g, '').trim();
+}
+
+function bump(counts: Record<string, number>, key: string, by = 1, labels?: Record<string, string>) {
+    const k = statKey(key);
+    if (!k) return;
+    counts[k] = (counts[k] || 0) + by;
+    if (labels && !labels[k]) labels[k] = key.trim();
+}
+
+function top(counts: Record<string, number>, n: number, labels: Record<string, string> = {}): string[] {
+    return Object.entries(counts).sort((a, b) => b[1] - a[1]).slice(0, n).map(([k]) => labels[k] || k);
+}
+
+function prune(counts: Record<string, number>, n: number): Record<string, number> {
+    return Object.fromEntries(Object.entries(counts).sort((a, b) => b[1] - a[1]).slice(0, n));
+}
+
+function emptyStats(): StyleStats {
+    return { wordCount: 0, speakingSeconds: 0, fillerCounts: {}, phraseCounts: {}, traitCounts: {}, dialectVotes: {}, labels: {} };
+}
+
 export class StyleAnalyzer {
 
-    async analyze(transcripts: AudioTranscript[], visuals: VisualContext[]): Promise<PersonalityProfile> {
+    /**
+     * Analyzes one video's worth of segments into a delta that mergeDelta folds
+     * into an avatar's running profile.
+     */
+    async analyze(transcripts: AudioTranscript[], visuals: VisualContext[]): Promise<StyleDelta> {
+        const delta: StyleDelta = { ...this.countLocally(transcripts), segments: transcripts.length + visuals.length, confidenceScore: 0 };
+
+        const windows = this.windows(transcripts, visuals);
+        const results = await mapWithConcurrency(windows, windows.length || 1, w => this.analyzeWindow(w.transcripts, w.visuals));
+        for (const result of results) {
+            if (!result) continue;
+            const weight = result.confidenceScore;
+            result.traits.forEach(t => bump(delta.traitCounts, t, weight, delta.labels));
+            if (result.dialect) bump(delta.dialectVotes, result.dialect, weight, delta.labels);
+            delta.confidenceScore = Math.max(delta.confidenceScore, weight);
+        }
+        return delta;
+    }
+
+    /**
+     * Folds a delta into a profile. Counts accumulate in profile.stats; the
+     * prompt-facing fields are derived from them, in each key's original wording.
+     */
+    mergeDelta(existing: Partial<PersonalityProfile> | null | undefined, delta: StyleDelta): PersonalityProfile {
+        const stats: StyleStats = { ...emptyStats(), ...(existing?.stats || this.seedStats(existing)) };
+        const merged: StyleStats = {
+            wordCount: stats.wordCount + delta.wordCount,
+            speakingSeconds: stats.speakingSeconds + delta.speakingSeconds,
+            fillerCounts: { ...stats.fillerCounts },
+            phraseCounts: { ...stats.phraseCounts },
+            traitCounts: { ...stats.traitCounts },
+            dialectVotes: { ...stats.dialectVotes }
+        };
+        for (const field of ['fillerCounts', 'phraseCounts', 'traitCounts', 'dialectVotes'] as const) {
+            for (const [key, count] of Object.entries(delta[field])) bump(merged[field], key, count);
+        }
+        merged.phraseCounts = prune(merged.phraseCounts, PHRASES_KEPT);
+        merged.traitCounts = prune(merged.traitCounts, PHRASES_KEPT);
+
+        // Earlier wording wins, so a profile's labels don't flip between videos; stats saved
+        // before labels existed get theirs from the profile's current fields. A key only ever
+        // seen lowercased (merged before labels existed) takes the delta's wording.
+        const labels = { ...this.profileLabels(existing), ...(stats.labels || {}) };
+        for (const [k, label] of Object.entries(delta.labels || {})) {
+            if (!labels[k] || labels[k] === k) labels[k] = label;
+        }
+        merged.labels = Object.fromEntries(Object.entries(labels)
+            .filter(([k]) => k in merged.traitCounts || k in merged.dialectVotes));
+
+        const fillers = Object.values(merged.fillerCounts).reduce((a, b) => a + b, 0);
+        const wordsPerMinute = merged.speakingSeconds ? merged.wordCount / (merged.speakingSeconds / 60) : 0;
+        const totalSessions = (existing?.consistencyMetrics?.totalSessions || 0) + 1;
+
+        return {
+            traits: top(merged.traitCounts, TOP_TRAITS, merged.labels),
+            commonPhrases: top(merged.phraseCounts, TOP_PHRASES),
+            // 1.0 = a filler every 10 words or more
+            fillerWordFrequency: merged.wordCount ? parseFloat(Math.min(1, fillers / merged.wordCount * 10).toFixed(2)) : 0,
+            speechRate: !wordsPerMinute ? (existing?.speechRate || "Moderate")
+                : wordsPerMinute < 110 ? "Slow" : wordsPerMinute > 160 ? "Fast" : "Moderate",
+            dialect: top(merged.dialectVotes, 1, merged.labels)[0] || existing?.dialect || "General American",
+            confidenceScore: Math.min((existing?.confidenceScore || 0) + 0.1 * delta.confidenceScore, 1.0), // Increase confidence with more data
+            consistencyMetrics: {
+                totalSessions: totalSessions,
+                lastUpdated: new Date().toISOString()
+            },
+            stats: merged
+        };
+    }
+
+    /**
+     * Profiles written before per-field stats existed: carry their traits,
+     * phrases and dialect over as a single observation.
+     */
+    private seedStats(existing: Partial<PersonalityProfile> | null | undefined): StyleStats {
+        const stats = emptyStats();
+        existing?.traits?.forEach(t => bump(stats.traitCounts, t, 1, stats.labels));
+        existing?.commonPhrases?.forEach(p => bump(stats.phraseCounts, p, PHRASE_MIN_COUNT));
+        if (existing?.dialect) bump(stats.dialectVotes, existing.dialect, 1, stats.labels);
+        return stats;
+    }
+
+    /**
+     * Display forms of the traits and dialect a profile currently shows.
+     */
+    private profileLabels(existing: Partial<PersonalityProfile> | null | undefined): Record<string, string> {
+        const labels: Record<string, string> = {};
+        for (const value of [...(existing?.traits || []), existing?.dialect]) {
+            if (value) bump({}, value, 1, labels);
+        }
+        return labels;
+    }
+
+    /**
+     * Word, filler and repeated-phrase counts, plus speaking time summed over segments.
+     */
+    private countLocally(transcripts: AudioTranscript[]): StyleStats {
+        const stats = emptyStats();
+        const phrases: Record<string, number> = {};
+
+        for (const t of transcripts) {
+            const words = (t.text || '').toLowerCase().replace(/[^a-z0-9' ]+/g, ' ').split(/\s+/).filter(Boolean);
+            stats.wordCount += words.length;
+
+            const padded = ` ${words.join(' ')} `;
+            for (const filler of FILLER_WORDS) {
+                const matches = padded.split(` ${filler} `).length - 1;
+                if (matches) bump(stats.fillerCounts, filler, matches);
+            }
+            for (let n = 2; n <= 3; n++) {
+                for (let i = 0; i + n <= words.length; i++) {
+                    const gram = words.slice(i, i + n);
+                    if (gram.every(w => STOPWORDS.has(w))) continue;
+                    bump(phrases, gram.join(' '));
+                }
+            }
+        }
+
+        for (const [phrase, count] of Object.entries(phrases)) {
+            if (count >= PHRASE_MIN_COUNT && !FILLER_WORDS.includes(phrase)) stats.phraseCounts[phrase] = count;
+        }
+        stats.phraseCounts = prune(stats.phraseCounts, PHRASES_KEPT);
+
+        const timed = transcripts
+            .map(t => ({ at: new Date(t.timestamp).getTime(), duration: t.duration }))
+            .filter(t => !isNaN(t.at))
+            .sort((a, b) => a.at - b.at);
+        timed.forEach((segment, i) => {
+            if (typeof segment.duration === 'number') {
+                stats.speakingSeconds += segment.duration;
+            } else {
+                const next = timed[i + 1];
+                stats.speakingSeconds += next ? Math.min((next.at - segment.at) / 1000, MAX_SEGMENT_SECONDS) : LAST_SEGMENT_SECONDS;
+            }
+        });
+        return stats;
+    }
+
+    /**
+     * Evenly spaced windows of consecutive segments, each paired with the visuals
+     * from the same stretch of the recording.
+     */
+    private windows(transcripts: AudioTranscript[], visuals: VisualContext[]) {
+        if (transcripts.length === 0) {
+            return visuals.length ? [{ transcripts: [], visuals: visuals.slice(0, WINDOW_SEGMENTS) }] : [];
+        }
+
+        const count = Math.min(MAX_WINDOWS, Math.ceil(transcripts.length / WINDOW_SEGMENTS));
+        const stride = count > 1 ? (transcripts.length - WINDOW_SEGMENTS) / (count - 1) : 0;
+        const visualsPerWindow = Math.ceil(visuals.length / count);
+
+        return Array.from({ length: count }, (_, i) => {
+            const start = Math.round(i * stride);
+            return {
+                transcripts: transcripts.slice(start, start + WINDOW_SEGMENTS),
+                visuals: visuals.slice(i * visualsPerWindow, (i + 1) * visualsPerWindow).slice(0, WINDOW_SEGMENTS)
+            };
+        });
+    }
+
+    private async analyzeWindow(transcripts: AudioTranscript[], visuals: VisualContext[]): Promise<{ traits: string[], dialect?: string, confidenceScore: number } | null> {
         const combinedInput = `
       AUDIO TRANSCRIPTS:
       ${transcripts.map(t => `[${t.timestamp}] ${t.text}`).join('\n')}
 
       VISUAL CONTEXT:
       ${visuals.map(v => `[${v.timestamp}] ${v.description}`).join('\n')}
-      `;
+      `.slice(0, WINDOW_CHARS);
 
         if (process.env.OPENAI_API_KEY === 'mock-key' || !process.env.OPENAI_API_KEY) {
             console.log("[Style] Using MOCK analysis.");
             return {
                 traits: ["Casual", "Observant", "Energetic"],
-                commonPhrases: ["you know", "basically"],
-                fillerWordFrequency: 0.4,
-                speechRate: "Moderate",
                 dialect: "General American (California influence)",
-                confidenceScore: 0.5,
-                consistencyMetrics: {
-                    totalSessions: 1,
-                    lastUpdated: new Date().toISOString()
-                }
+                confidenceScore: 0.5
             };
         }
 
@@ -34,24 +235,21 @@ export class StyleAnalyzer {
             const response = await openai.chat.completions.create({
                 model: "gpt-5.1",
                 messages: [
-                    { role: "system", content: "You are an expert behavioral analyst. Analyze the provided video transcripts and visual logs to construct a personality profile. Focus on speech patterns (identifying dialects, filler words), recurring physical actions, and general demeanor. Output JSON." },
+                    { role: "system", content: "You are an expert behavioral analyst. Analyze the provided excerpt of video transcripts and visual logs. Focus on dialect or accent, recurring physical actions, and general demeanor. Output JSON." },
                     { role: "user", content: combinedInput }
                 ],
                 functions: [
                     {
                         name: "save_profile",
-                        description: "Save the analyzed personality profile",
+                        description: "Save the analyzed personality traits",
                         parameters: {
                             type: "object",
                             properties: {
-                                traits: { type: "array", items: { type: "string" } },
-                                commonPhrases: { type: "array", items: { type: "string" }, description: "Phrases the person repeats often" },
-                                fillerWordFrequency: { type: "number", description: "0-1 scale of how often they use fillers" },
-                                speechRate: { type: "string", enum: ["Slow", "Moderate", "Fast"] },
+                                traits: { type: "array", items: { type: "string" }, description: "Short personality traits, one or two words each" },
                                 dialect: { type: "string", description: "Detected dialect or accent" },
                                 confidenceScore: { type: "number", description: "0-1 confidence in this analysis" }
                             },
-                            required: ["traits", "commonPhrases", "fillerWordFrequency", "speechRate", "dialect"]
+                            required: ["traits", "dialect"]
                         }
                     }
                 ],
@@ -62,60 +260,18 @@ export class StyleAnalyzer {
             if (fnCall && fnCall.arguments) {
                 const result = JSON.parse(fnCall.arguments);
                 return {
-                    ...result,
-                    confidenceScore: result.confidenceScore || 0.8,
-                    consistencyMetrics: {
-                        totalSessions: 1,
-                        lastUpdated: new Date().toISOString()
-                    }
+                    traits: result.traits || [],
+                    dialect: result.dialect,
+                    confidenceScore: result.confidenceScore || 0.8
                 };
             }
 
             throw new Error("No function call in response");
 
         } catch (e) {
+            // A failed window contributes nothing; local counts still apply
             console.error("Analysis failed:", e);
-            return {
-                traits: ["Unknown"],
-                commonPhrases: [],
-                fillerWordFrequency: 0,
-                speechRate: "Unknown",
-                dialect: "Unknown",
-                confidenceScore: 0,
-                consistencyMetrics: {
-                    totalSessions: 0,
-                    lastUpdated: new Date().toISOString()
-                }
-            };
+            return null;
         }
     }
-
-    mergeProfiles(existing: PersonalityProfile, current: PersonalityProfile): PersonalityProfile {
-        // Logic: Weighted average for numbers, Union for sets, Latest for single values if confidence is higher
-        const totalSessions = (existing.consistencyMetrics?.totalSessions || 0) + 1;
-
-        // Merge unique traits
-        const mergedTraits = Array.from(new Set([...existing.traits, ...current.traits]));
-
-        // Merge unique phrases, keeping mostly the frequent ones (simplified as union here)
-        const mergedPhrases = Array.from(new Set([...existing.commonPhrases, ...current.commonPhrases]));
-
-        // Weighted average for filler frequency
-        const oldFreq = existing.fillerWordFrequency || 0;
-        const newFreq = current.fillerWordFrequency || 0;
-        const avgFreq = ((oldFreq * (totalSessions - 1)) + newFreq) / totalSessions;
-
-        return {
-            traits: mergedTraits,
-            commonPhrases: mergedPhrases,
-            fillerWordFrequency: parseFloat(avgFreq.toFixed(2)),
-            speechRate: current.speechRate, // Assume latest is most reflective of current mood, or could average
-            dialect: existing.dialect, // Dialect shouldn't change often, keep existing unless explicit override? Let's stick to existing.
-            confidenceScore: Math.min((existing.confidenceScore || 0) + 0.1, 1.0), // Increase confidence with more data
-            consistencyMetrics: {
-                totalSessions: totalSessions,
-                lastUpdated: new Date().toISOString()
-            }
-        };
-    }
 }
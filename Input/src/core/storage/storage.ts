@@ -2,37 +2,199 @@ import fs from 'fs';
 import path from 'path';
 import { DailySessionData, PersonalityProfile } from '../types';
 
-const DB_PATH = path.join(process.cwd(), 'db.json');
+const DB_PATH = path.join(process.cwd(), 'db.jsonl');
+const LEGACY_DB_PATH = path.join(process.cwd(), 'db.json');
 const PROFILE_PATH = path.join(process.cwd(), 'profile.json');
 
+// Rewrite the log once superseded records make up this share of it (and there are enough to matter)
+const COMPACT_RATIO = 0.5;
+const COMPACT_MIN_STALE = 1000;
+
+interface RecordLocation {
+    offset: number;
+    length: number; // Bytes, excluding the newline
+}
+
+/**
+ * Writes via a temp file + rename so readers never see a half-written file.
+ */
+async function writeAtomic(filePath: string, data: string): Promise<void> {
+    const tmp = `${filePath}.${process.pid}.tmp`;
+    await fs.promises.writeFile(tmp, data);
+    await fs.promises.rename(tmp, filePath);
+}
+
+/**
+ * Local/offline store. Sessions go to an append-only JSON-lines log; an in-memory
+ * index maps sessionId to the byte range of its latest record, so a write is one
+ * append and a read is one positioned read. Re-saved sessions leave stale records
+ * behind, which compaction drops.
+ */
 export class SimpleStorage {
+    private index = new Map<string, RecordLocation>();
+    private size = 0;        // Bytes in the log
+    private stale = 0;       // Superseded records still in the log
+    private loading: Promise<void> | null = null;
+    private writes: Promise<unknown> = Promise.resolve(); // Serializes file access (appends, reads, compaction)
+
     async saveSession(session: DailySessionData): Promise<void> {
-        let db: DailySessionData[] = [];
-        if (fs.existsSync(DB_PATH)) {
+        await this.load();
+        const line = Buffer.from(JSON.stringify(session) + '\n');
+
+        await this.enqueue(async () => {
+            await fs.promises.appendFile(DB_PATH, line);
+            if (this.index.has(session.sessionId)) this.stale++;
+            this.index.set(session.sessionId, { offset: this.size, length: line.length - 1 });
+            this.size += line.length;
+        });
+        console.log(`[Storage] Saved session ${session.sessionId} to ${DB_PATH}`);
+
+        if (this.stale >= COMPACT_MIN_STALE && this.stale >= (this.stale + this.index.size) * COMPACT_RATIO) {
+            this.compact().catch(e => console.warn(`[Storage] Compaction failed: ${e.message}`));
+        }
+    }
+
+    async getSession(sessionId: string): Promise<DailySessionData | null> {
+        await this.load();
+        // Queued behind writes so compaction can't move the record mid-read
+        return this.enqueue(async () => {
+            const location = this.index.get(sessionId);
+            if (!location) return null;
+
+            const handle = await fs.promises.open(DB_PATH, 'r');
             try {
-                db = JSON.parse(fs.readFileSync(DB_PATH, 'utf-8'));
-            } catch (e) {
-                console.warn("Could not read DB, starting fresh.");
+                const buffer = Buffer.alloc(location.length);
+                await handle.read(buffer, 0, location.length, location.offset);
+                return JSON.parse(buffer.toString('utf-8'));
+            } finally {
+                await handle.close();
             }
-        }
-        db.push(session);
-        fs.writeFileSync(DB_PATH, JSON.stringify(db, null, 2));
-        console.log(`[Storage] Saved session ${session.sessionId} to ${DB_PATH}`);
+        });
     }
 
-    async getProfile(): Promise<PersonalityProfile | null> {
-        if (fs.existsSync(PROFILE_PATH)) {
+    async listSessionIds(): Promise<string[]> {
+        await this.load();
+        return [...this.index.keys()];
+    }
+
+    /**
+     * Rewrites the log with only the latest record per session.
+     */
+    async compact(): Promise<void> {
+        await this.load();
+        await this.enqueue(async () => {
+            const source = await fs.promises.open(DB_PATH, 'r');
+            const tmp = `${DB_PATH}.${process.pid}.tmp`;
+            const target = await fs.promises.open(tmp, 'w');
+            const index = new Map<string, RecordLocation>();
+            let offset = 0;
             try {
-                return JSON.parse(fs.readFileSync(PROFILE_PATH, 'utf-8'));
-            } catch (e) {
-                console.warn("Could not read Profile, returning null.");
+                for (const [sessionId, location] of this.index) {
+                    const buffer = Buffer.alloc(location.length + 1);
+                    await source.read(buffer, 0, location.length, location.offset);
+                    buffer[location.length] = 0x0a; // '\n'
+                    await target.write(buffer);
+                    index.set(sessionId, { offset, length: location.length });
+                    offset += buffer.length;
+                }
+                await target.sync();
+            } finally {
+                await source.close();
+                await target.close();
             }
+            await fs.promises.rename(tmp, DB_PATH);
+
+            console.log(`[Storage] Compacted ${DB_PATH}: ${this.size} -> ${offset} bytes`);
+            this.index = index;
+            this.size = offset;
+            this.stale = 0;
+        });
+    }
+
+    async getProfile(): Promise<PersonalityProfile | null> {
+        try {
+            return JSON.parse(await fs.promises.readFile(PROFILE_PATH, 'utf-8'));
+        } catch (e: any) {
+            if (e.code !== 'ENOENT') console.warn("Could not read Profile, returning null.");
         }
         return null;
     }
 
     async saveProfile(profile: PersonalityProfile): Promise<void> {
-        fs.writeFileSync(PROFILE_PATH, JSON.stringify(profile, null, 2));
+        await writeAtomic(PROFILE_PATH, JSON.stringify(profile, null, 2));
         console.log(`[Storage] Updated global profile in ${PROFILE_PATH}`);
     }
+
+    private enqueue<T>(task: () => Promise<T>): Promise<T> {
+        const run = this.writes.then(task);
+        this.writes = run.catch(() => { });
+        return run;
+    }
+
+    private load(): Promise<void> {
+        if (!this.loading) {
+            this.loading = this.buildIndex().catch(e => {
+                this.loading = null; // Let the next call retry
+                throw e;
+            });
+        }
+        return this.loading;
+    }
+
+    /**
+     * One pass over the log to rebuild the offset index. A torn final line (crash
+     * mid-append) is cut off so the next append starts on a clean line.
+     */
+    private async buildIndex(): Promise<void> {
+        await this.migrateLegacy();
+
+        let data: Buffer;
+        try {
+            data = await fs.promises.readFile(DB_PATH);
+        } catch (e: any) {
+            if (e.code === 'ENOENT') return;
+            throw e;
+        }
+
+        let start = 0;
+        let valid = 0;
+        while (start < data.length) {
+            const end = data.indexOf(0x0a, start);
+            if (end === -1) break; // Unterminated tail
+            try {
+                const { sessionId } = JSON.parse(data.toString('utf-8', start, end));
+                if (this.index.has(sessionId)) this.stale++;
+                this.index.set(sessionId, { offset: start, length: end - start });
+            } catch (e) {
+                console.warn(`[Storage] Skipping unreadable record at byte ${start}`);
+                this.stale++;
+            }
+            start = end + 1;
+            valid = start;
+        }
+
+        if (valid < data.length) {
+            console.warn(`[Storage] Truncating ${data.length - valid} bytes of incomplete record`);
+            await fs.promises.truncate(DB_PATH, valid);
+        }
+        this.size = valid;
+    }
+
+    /**
+     * Converts a db.json from the old whole-file format, once.
+     */
+    private async migrateLegacy(): Promise<void> {
+        if (fs.existsSync(DB_PATH) || !fs.existsSync(LEGACY_DB_PATH)) return;
+
+        let sessions: DailySessionData[] = [];
+        try {
+            sessions = JSON.parse(await fs.promises.readFile(LEGACY_DB_PATH, 'utf-8'));
+        } catch (e) {
+            console.warn("Could not read DB, starting fresh.");
+            return;
+        }
+        await writeAtomic(DB_PATH, sessions.map(s => JSON.stringify(s) + '\n').join(''));
+        await fs.promises.rename(LEGACY_DB_PATH, `${LEGACY_DB_PATH}.migrated`);
+        console.log(`[Storage] Migrated ${sessions.length} sessions from ${LEGACY_DB_PATH}`);
+    }
 }
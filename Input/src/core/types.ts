@@ -6,6 +6,7 @@ export interface VisualContext {
 export interface AudioTranscript {
     timestamp: string;
     text: string;
+    duration?: number; // Seconds of speech in this segment (Whisper's end - start)
     dialect?: string;
     fillerWords?: string[];
     sentiment?: string;
@@ -32,6 +33,24 @@ export interface PersonalityProfile {
         totalSessions: number;
         lastUpdated: string;
     };
+    stats?: StyleStats; // Running counts the fields above are derived from
+}
+
+// Accumulated per-field style statistics (counts keyed by lowercase phrase/trait/dialect)
+export interface StyleStats {
+    wordCount: number;
+    speakingSeconds: number;
+    fillerCounts: Record<string, number>;
+    phraseCounts: Record<string, number>;
+    traitCounts: Record<string, number>;  // Weighted by analysis confidence
+    dialectVotes: Record<string, number>; // Weighted by analysis confidence
+    labels?: Record<string, string>;      // Display form of each trait/dialect key, as first seen
+}
+
+// What one video contributes to a profile (see StyleAnalyzer.mergeDelta)
+export interface StyleDelta extends StyleStats {
+    segments: number;
+    confidenceScore: number;
 }
 
 export interface ChatMessage {
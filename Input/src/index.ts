@@ -4,7 +4,11 @@ import cors from 'cors';
 import dotenv from 'dotenv';
 import apiRoutes from './routes/api';
 import chatRoutes from './routes/chat';
+import { historyBuffer } from './services/historyBuffer';
+import { sessionCache } from './services/sessionCache';
+import { memoryStore } from './services/memoryStore';
 import path from 'path';
+import { fork, ChildProcess } from 'child_process';
 
 dotenv.config();
 
@@ -25,6 +29,40 @@ app.get('/', (req, res) => {
     res.send('Avatar Functionality Platform API is running.');
 });
 
+// Ingestion runs in worker processes so ffmpeg/Puppeteer/LLM work can't stall the API.
+// Set INGEST_WORKERS=0 to run them separately (npm run worker).
+const INGEST_WORKERS = parseInt(process.env.INGEST_WORKERS || '1', 10);
+const ingestionWorkers = new Set<ChildProcess>();
+
+function spawnIngestionWorker() {
+    const ext = path.extname(__filename); // .ts under ts-node, .js from dist
+    const worker = fork(path.join(__dirname, 'workers', `ingestionWorker${ext}`), [], {
+        execArgv: ext === '.ts' ? ['-r', 'ts-node/register'] : []
+    });
+    ingestionWorkers.add(worker);
+    worker.on('message', (message: any) => {
+        if (message?.type === 'avatar-updated') sessionCache.invalidateAvatar(message.avatarId);
+        if (message?.type === 'memories-compacted') memoryStore.invalidateIndex(message.avatarId);
+    });
+    worker.on('exit', (code) => {
+        ingestionWorkers.delete(worker);
+        if (shuttingDown) return;
+        // Its in-flight jobs are picked up again by stale-job recovery
+        console.error(`[Workers] Ingestion worker ${worker.pid} exited (${code}), restarting...`);
+        setTimeout(spawnIngestionWorker, 1000);
+    });
+}
+
+let shuttingDown = false;
+for (const signal of ['SIGINT', 'SIGTERM'] as const) {
+    process.on(signal, () => {
+        shuttingDown = true;
+        ingestionWorkers.forEach(w => w.kill(signal));
+        // Don't drop buffered chat history on the way out
+        historyBuffer.flushAll().finally(() => process.exit(0));
+    });
+}
+
 // Start Server
 if (process.env.MOCK_DB) {
     console.log('[MockDB] Skipping MongoDB connection');
@@ -38,6 +76,7 @@ if (process.env.MOCK_DB) {
             app.listen(PORT, () => {
                 console.log(`[Server] Running on port ${PORT}`);
             });
+            for (let i = 0; i < INGEST_WORKERS; i++) spawnIngestionWorker();
         })
         .catch(err => {
             console.error('[DB] Connection Error:', err);
@@ -15,15 +15,17 @@ const AvatarSchema = new mongoose.Schema({
         consistencyMetrics: {
             totalSessions: Number,
             lastUpdated: Date
-        }
+        },
+        stats: mongoose.Schema.Types.Mixed // Running style counts (StyleStats)
     },
+    // Bumped on every style merge; merges only write over the version they read
+    personalityVersion: { type: Number },
+    // Ingestion jobs whose style delta is already in `personality` (most recent only),
+    // so a job re-run after a crash doesn't count its video twice
+    styleJobIds: [String],
 
-    // Raw Memory (Vector Store simulation for this MVP)
-    // In a production scaling app, this would be stored in Pinecone/Weaviate referencing avatarId.
-    // For MongoDB, we'll store recent context chunks here.
-    // Raw Memory (Vector Store simulation for this MVP)
-    // In a production scaling app, this would be stored in Pinecone/Weaviate referencing avatarId.
-    // For MongoDB, we'll store recent context chunks here.
+    // Legacy embedded memory. New memories live in the Memory collection (see MemoryStore);
+    // run src/scripts/migrateMemory.ts to move existing entries over.
     memory: [{
         timestamp: Date,
         type: { type: String, enum: ['audio', 'vision', 'text'] }, // Added 'text'
@@ -32,8 +34,19 @@ const AvatarSchema = new mongoose.Schema({
         embedding: [Number] // Placeholder for vector
     }],
 
+    // Pointer to the newest vision/audio memory, kept current on append so
+    // "what were you doing" doesn't need a memory scan
+    latestActivity: {
+        timestamp: Date,
+        type: { type: String },
+        content: String
+    },
+
     // State management for live calls
-    activeSessionId: { type: String }
+    activeSessionId: { type: String },
+
+    // Last time the background compactor claimed this avatar (see memoryCompaction)
+    memoryCompactedAt: { type: Date }
 }, { timestamps: true });
 
 export const Avatar = mongoose.model('Avatar', AvatarSchema);
@@ -0,0 +1,23 @@
+import mongoose from 'mongoose';
+
+// Per-content results of the expensive ingestion stages (vision, Whisper, style),
+// keyed by the SHA-256 of the original recording so re-uploads cost nothing.
+// Entries belong to the avatar that produced them; only entries whose hash the
+// server computed itself (verified) are reused for other avatars' uploads of the
+// same bytes. Only runs where every stage succeeded are stored.
+const IngestionCacheSchema = new mongoose.Schema({
+    contentHash: { type: String, required: true },
+    avatarId: { type: String, required: true },
+    verified: { type: Boolean, default: false },
+    creationTime: { type: Date },
+    visuals: [{
+        timestamp: String,
+        description: String
+    }],
+    transcripts: [mongoose.Schema.Types.Mixed],
+    profile: mongoose.Schema.Types.Mixed
+}, { timestamps: true });
+
+IngestionCacheSchema.index({ contentHash: 1, avatarId: 1 }, { unique: true });
+
+export const IngestionCache = mongoose.model('IngestionCache', IngestionCacheSchema);
@@ -3,14 +3,43 @@ import mongoose from 'mongoose';
 const IngestionJobSchema = new mongoose.Schema({
     jobId: { type: String, required: true, unique: true },
     avatarId: { type: String, required: true },
+    contentHash: { type: String },
+    hashVerified: { type: Boolean }, // contentHash matches the uploaded bytes (not just the client's word)
+    // Set while the job blocks re-uploads of the same content: queued, running or completed in full
+    active: { type: Boolean },
+    degraded: { type: Boolean }, // Completed with a failed stage (vision or audio); may be re-ingested
     status: {
         type: String,
         enum: ['pending', 'processing', 'completed', 'failed'],
         default: 'pending'
     },
     error: { type: String },
+
+    // Queue state: uploads stay on disk until a worker claims the job
+    videoPath: { type: String },
+    audioPath: { type: String },
+    priority: { type: Number, default: 0 },
+    attempts: { type: Number, default: 0 },
+    workerId: { type: String },
+    heartbeatAt: { type: Date }, // Stale heartbeats mean the worker died mid-job
+    // Creation time baked into this job's memory _ids; fixed on first use so every attempt
+    // derives the same ids (see ingestionService.memoryIds)
+    memoryIdsAt: { type: Date },
+
     startedAt: { type: Date, default: Date.now },
     completedAt: { type: Date }
 }, { timestamps: true });
 
+// Claim order: highest priority first, then oldest
+IngestionJobSchema.index({ status: 1, priority: -1, createdAt: 1 });
+
+// Duplicate-upload lookups are per avatar + content
+IngestionJobSchema.index({ avatarId: 1, contentHash: 1 });
+
+// At most one active job per avatar + content, so concurrent uploads can't both be queued
+IngestionJobSchema.index(
+    { avatarId: 1, contentHash: 1, active: 1 },
+    { unique: true, partialFilterExpression: { active: true } }
+);
+
 export const IngestionJob = mongoose.model('IngestionJob', IngestionJobSchema);
@@ -0,0 +1,23 @@
+import mongoose from 'mongoose';
+
+// One document per memory, so appends don't rewrite the avatar document and
+// per-turn reads only touch the index range they need.
+const MemorySchema = new mongoose.Schema({
+    avatarId: { type: String, required: true },
+    timestamp: { type: Date, default: Date.now },
+    type: { type: String, enum: ['audio', 'vision', 'text', 'summary'] },
+    sessionId: String, // To group chat messages
+    content: String,
+    compactedCount: Number, // For summaries: how many raw memories were folded in (originals are in MemoryArchive)
+    embedding: [Number],
+    embeddingModel: String // Embedder that produced `embedding`
+});
+
+// Session history: (avatarId, sessionId) ordered by time
+MemorySchema.index({ avatarId: 1, sessionId: 1, timestamp: 1 });
+// Timeline / per-type scans
+MemorySchema.index({ avatarId: 1, type: 1, timestamp: -1 });
+// Vector index loads / incremental refreshes
+MemorySchema.index({ avatarId: 1, embeddingModel: 1, _id: 1 });
+
+export const Memory = mongoose.model('Memory', MemorySchema);
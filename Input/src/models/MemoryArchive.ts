@@ -0,0 +1,20 @@
+import mongoose from 'mongoose';
+
+// Cold storage for raw memories folded into a summary by the compactor.
+// Keeps the original _id, so an interrupted compaction can be re-run safely.
+const MemoryArchiveSchema = new mongoose.Schema({
+    avatarId: { type: String, required: true },
+    timestamp: Date,
+    type: { type: String, enum: ['audio', 'vision', 'text'] },
+    sessionId: String,
+    content: String,
+    embedding: [Number],
+    embeddingModel: String,
+    summaryId: mongoose.Schema.Types.ObjectId, // The Memory summary that replaced this entry
+    archivedAt: { type: Date, default: Date.now }
+});
+
+MemoryArchiveSchema.index({ avatarId: 1, timestamp: 1 });
+MemoryArchiveSchema.index({ summaryId: 1 });
+
+export const MemoryArchive = mongoose.model('MemoryArchive', MemoryArchiveSchema);
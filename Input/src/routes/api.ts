@@ -1,10 +1,14 @@
 import express from 'express';
 import multer from 'multer';
-import { processVideoUpload } from '../services/ingestionService';
+import { hashFile } from '../services/ingestionService';
+import { enqueueIngestion } from '../services/jobQueue';
+import { memoryStore } from '../services/memoryStore';
 import { User } from '../models/User';
 import { Avatar } from '../models/Avatar';
 import { IngestionJob } from '../models/IngestionJob';
+import { IngestionCache } from '../models/IngestionCache';
 import bcrypt from 'bcrypt';
+import fs from 'fs';
 import { v4 as uuidv4 } from 'uuid';
 
 const router = express.Router();
@@ -64,55 +68,97 @@ router.post('/auth/login', async (req, res) => {
 // --- DATA ACCESS (For Avatar Interface) ---
 
 router.get('/avatar/:avatarId', async (req, res) => {
-    const avatar = await Avatar.findOne({ avatarId: req.params.avatarId });
+    const avatar = await Avatar.findOne({ avatarId: req.params.avatarId }).select('-memory');
     if (!avatar) return res.status(404).json({ error: "Avatar not found" });
     res.json(avatar);
 });
 
 router.get('/avatar/:avatarId/memory', async (req, res) => {
-    // Basic search (mock vector search)
+    // Semantic search over the avatar's memories (top-k by embedding similarity)
     const { q } = req.query;
-    const avatar = await Avatar.findOne({ avatarId: req.params.avatarId });
-    if (!avatar) return res.status(404).json({ error: "Avatar not found" });
+    const k = Math.max(1, Math.min(parseInt(req.query.k as string, 10) || 10, 100));
+    if (!(await Avatar.exists({ avatarId: req.params.avatarId }))) return res.status(404).json({ error: "Avatar not found" });
 
-    // Simple text filter for MVP
-    const results = avatar.memory.filter(m => m.content?.includes(q as string));
+    const results = await memoryStore.searchSimilar(req.params.avatarId, q as string, k);
     res.json(results);
 });
 
 // --- VIDEO INGESTION ---
 
-router.post('/ingest/:avatarId', upload.single('video'), async (req, res) => {
-    if (!req.file) return res.status(400).json({ error: "No video file" });
+// Jobs for the same avatar + content that are queued, running or completed in full
+// (failed and degraded ones may be retried)
+function findActiveDuplicate(avatarId: string, contentHash: string) {
+    return IngestionJob.findOne({
+        avatarId,
+        contentHash,
+        $or: [
+            { active: true },
+            // Jobs created before the `active` flag existed
+            { active: { $exists: false }, degraded: { $ne: true }, status: { $in: ['pending', 'processing', 'completed'] } }
+        ]
+    });
+}
+
+// Ask whether a recording (by SHA-256 of the original file) was already ingested
+router.get('/ingest/lookup/:avatarId', async (req, res) => {
+    const contentHash = req.query.hash as string;
+    if (!contentHash) return res.status(400).json({ error: "Missing hash" });
+
+    const job = await findActiveDuplicate(req.params.avatarId, contentHash);
+    if (job) return res.json({ known: true, jobId: job.jobId, status: job.status });
+
+    // Only this avatar's own cache is reported; other avatars' content stays private
+    const cached = await IngestionCache.exists({ avatarId: req.params.avatarId, contentHash });
+    res.json({ known: false, cached: !!cached });
+});
+
+// Clients may pre-reduce and send the audio track separately ('audio' field)
+const ingestUpload = upload.fields([{ name: 'video', maxCount: 1 }, { name: 'audio', maxCount: 1 }]);
+
+router.post('/ingest/:avatarId', ingestUpload, async (req, res) => {
+    const files = req.files as { [field: string]: Express.Multer.File[] } | undefined;
+    const videoFile = files?.video?.[0];
+    if (!videoFile) return res.status(400).json({ error: "No video file" });
 
     const jobId = uuidv4();
     const avatarId = req.params.avatarId as string;
-    const videoPath = req.file.path;
+    const videoPath = videoFile.path;
+    const audioPath = files?.audio?.[0]?.path;
+
+    // Clients hash the original recording (before any pre-reduction), which the server can't
+    // check against a reduced upload. The server always hashes what it received: only a hash
+    // that matches the bytes may share cached results with other avatars.
+    const uploadHash = await hashFile(videoPath);
+    const contentHash = (req.body?.contentHash as string) || uploadHash;
+    const hashVerified = contentHash === uploadHash;
+
+    const discardUpload = () => {
+        for (const tempPath of [videoPath, audioPath]) {
+            if (tempPath) fs.unlink(tempPath, () => { });
+        }
+    };
+    const alreadyIngested = (job: { jobId: string }) =>
+        res.json({ success: true, message: "Already ingested", jobId: job.jobId, duplicate: true });
+
+    const duplicate = await findActiveDuplicate(avatarId, contentHash);
+    if (duplicate) {
+        discardUpload();
+        return alreadyIngested(duplicate);
+    }
 
-    // Create job record
-    await IngestionJob.create({ jobId, avatarId, status: 'pending' });
+    // Queue for the ingestion workers (separate processes) - return immediately
+    const priority = Number(req.body?.priority) || 0;
+    try {
+        await enqueueIngestion({ jobId, avatarId, videoPath, audioPath, contentHash, hashVerified, priority });
+    } catch (e: any) {
+        if (e?.code !== 11000) throw e;
+        // A concurrent upload of the same content got queued first (unique active-job index)
+        discardUpload();
+        const winner = await findActiveDuplicate(avatarId, contentHash);
+        return winner ? alreadyIngested(winner) : res.status(409).json({ error: "Duplicate upload in progress, retry" });
+    }
 
-    // Async processing - return immediately
     res.json({ success: true, message: "Processing started", jobId });
-
-    // Run Internal Pipeline
-    (async () => {
-        try {
-            await IngestionJob.findOneAndUpdate({ jobId }, { status: 'processing' });
-            await processVideoUpload(avatarId, videoPath);
-            await IngestionJob.findOneAndUpdate({ jobId }, {
-                status: 'completed',
-                completedAt: new Date()
-            });
-        } catch (e) {
-            console.error("Ingestion failed:", e);
-            await IngestionJob.findOneAndUpdate({ jobId }, {
-                status: 'failed',
-                error: (e as Error).message,
-                completedAt: new Date()
-            });
-        }
-    })();
 });
 
 // Get job status
@@ -1,6 +1,9 @@
 import express from 'express';
-import { ResponseService } from '../services/responseService';
+import { ResponseService, isTurnId } from '../services/responseService';
 import { Avatar } from '../models/Avatar';
+import { historyBuffer } from '../services/historyBuffer';
+import { sessionCache } from '../services/sessionCache';
+import { operatorQueue } from '../services/operatorQueue';
 import { v4 as uuidv4 } from 'uuid';
 
 const router = express.Router();
@@ -13,7 +16,13 @@ router.post('/session/start', async (req, res) => {
 
     // Ideally update Avatar activeSessionId
     try {
-        await Avatar.findOneAndUpdate({ avatarId }, { activeSessionId: sessionId });
+        const avatar = await Avatar.findOneAndUpdate(
+            { avatarId },
+            { activeSessionId: sessionId },
+            { new: true, projection: { memory: 0 } }
+        ).lean();
+        // Warm the session context so the first turn doesn't read the avatar again
+        if (avatar) sessionCache.start(sessionId, avatar);
         res.json({ success: true, sessionId });
     } catch (e) {
         res.status(500).json({ error: (e as Error).message });
@@ -22,8 +31,12 @@ router.post('/session/start', async (req, res) => {
 
 // End a session
 router.post('/session/end', async (req, res) => {
-    const { avatarId } = req.body;
+    const { avatarId, sessionId } = req.body;
     try {
+        // Persist anything still in the write-behind buffer for this avatar's sessions
+        await historyBuffer.flushAvatar(avatarId);
+        if (sessionId) sessionCache.end(sessionId);
+        else sessionCache.endAvatar(avatarId);
         await Avatar.findOneAndUpdate({ avatarId }, { activeSessionId: null });
         res.json({ success: true, message: "Session ended" });
     } catch (e) {
@@ -35,10 +48,9 @@ router.post('/session/end', async (req, res) => {
 router.post('/history', async (req, res) => {
     const { avatarId, sessionId, role, content } = req.body;
     try {
-        const avatar = await Avatar.findOne({ avatarId });
-        if (!avatar) return res.status(404).json({ error: "Avatar not found" });
+        if (!(await Avatar.exists({ avatarId }))) return res.status(404).json({ error: "Avatar not found" });
 
-        await responseService.addToHistory(avatar, sessionId, role, content);
+        await responseService.addToHistory(avatarId, sessionId, role, content);
         res.json({ success: true });
     } catch (e) {
         res.status(500).json({ error: (e as Error).message });
@@ -46,95 +58,93 @@ router.post('/history', async (req, res) => {
 });
 
 // Generate a response (The Brain)
+// An optional turnId (24-hex ObjectId made by the client) makes the turn's history writes
+// idempotent, so a request hedged to several brains sharing a database is stored once.
 router.post('/generate', async (req, res) => {
-    const { avatarId, sessionId, text, visualContext } = req.body;
+    const { avatarId, sessionId, text, visualContext, turnId } = req.body;
+    if (turnId !== undefined && !isTurnId(turnId)) return res.status(400).json({ error: "turnId must be a 24-character hex id" });
 
     try {
-        const response = await responseService.generateResponse(avatarId, sessionId, text, visualContext);
-        res.json({ success: true, response });
+        const { response, stats } = await responseService.generateTurn(avatarId, sessionId, text, visualContext, turnId);
+        res.json({ success: true, response, stats });
     } catch (e) {
         console.error("Chat Generation Error:", e);
         res.status(500).json({ error: (e as Error).message });
     }
 });
 
-// In-memory store for pending requests: sessionId -> { res, body }
-const pendingRequests = new Map<string, {
-    res: express.Response,
-    context: {
-        avatarId: string,
-        text: string,
-        visualContext?: string,
-        intervention: number
-    }
-}>();
-
 // Stream a guided response (Human-in-the-loop)
 // Step 1: User calls this. It hangs until operator gives input.
 router.post('/generate_with_human', async (req, res) => {
     const { avatarId, sessionId, text, visualContext, intervention } = req.body;
 
-    console.log(`[HumanLoop] Received request for session ${sessionId}. Waiting for operator...`);
+    // Queued behind any earlier request for this session; operators are notified via /operator/feed
+    const pending = operatorQueue.enqueue({
+        res,
+        sessionId,
+        avatarId,
+        text,
+        visualContext,
+        intervention: intervention !== undefined ? Number(intervention) : 1
+    });
+    console.log(`[HumanLoop] Queued request ${pending.requestId} for session ${sessionId}. Waiting for operator...`);
 
     // Set headers for streaming text immediately so client knows it's a stream
     res.setHeader('Content-Type', 'text/plain');
     res.setHeader('Transfer-Encoding', 'chunked');
-    // Optional: Send a keep-alive comment or just wait
-    // res.write(": waiting_for_human\n");
+    res.setHeader('X-Request-Id', pending.requestId);
+    res.flushHeaders();
 
-    // Store the request and hang
-    pendingRequests.set(sessionId, {
-        res,
-        context: {
-            avatarId,
-            text,
-            visualContext,
-            intervention: intervention !== undefined ? Number(intervention) : 1
+    // Handle client disconnect (no-op once an operator has taken the request)
+    res.on('close', () => {
+        if (!res.writableEnded) {
+            operatorQueue.cancel(sessionId, pending.requestId);
         }
     });
+});
 
-    // Handle client disconnect
-    req.on('close', () => {
-        if (pendingRequests.has(sessionId)) {
-            console.log(`[HumanLoop] Client disconnected for session ${sessionId}`);
-            pendingRequests.delete(sessionId);
-        }
-    });
+// Operator feed: Server-Sent Events for new, claimed and cancelled requests
+router.get('/operator/feed', (req, res) => {
+    operatorQueue.subscribe(res);
+});
+
+// Snapshot of waiting requests and recent operator wait times
+router.get('/operator/pending', (req, res) => {
+    res.json({ success: true, pending: operatorQueue.list(), waits: operatorQueue.waitStats() });
 });
 
 // Step 2: Operator calls this. It triggers the response on the hanging connection.
 router.post('/human_response', async (req, res) => {
-    const { sessionId, humanResponse } = req.body;
+    const { sessionId, requestId, humanResponse } = req.body;
 
-    const pending = pendingRequests.get(sessionId);
-    if (!pending) {
+    // Remove from the queue immediately so we don't process twice
+    const taken = operatorQueue.take(sessionId, requestId);
+    if (!taken) {
         return res.status(404).json({ error: "No pending request found for this session ID" });
     }
 
-    // Remove from map immediately so we don't process twice
-    pendingRequests.delete(sessionId);
-
     // Send immediate success to Operator
-    res.json({ success: true, message: "Response sent to user" });
+    const { request, waitMs } = taken;
+    res.json({ success: true, message: "Response sent to user", requestId: request.requestId, waitMs });
 
-    const { res: userRes, context } = pending;
-    console.log(`[HumanLoop] Processing operator response for session ${sessionId}`);
+    const userRes = request.res;
+    console.log(`[HumanLoop] Processing operator response for request ${request.requestId} (waited ${waitMs}ms)`);
 
     try {
         const stream = await responseService.generateStreamWithHuman(
-            context.avatarId,
+            request.avatarId,
             sessionId,
-            context.text,
+            request.text,
             humanResponse,
-            context.visualContext,
-            context.intervention
+            request.visualContext,
+            request.intervention
         );
 
         for await (const chunk of stream) {
             userRes.write(chunk);
         }
         userRes.end();
-        console.log(`[HumanLoop] Completed response for session ${sessionId}`);
+        console.log(`[HumanLoop] Completed response for request ${request.requestId}`);
 
     } catch (e) {
         console.error("Stream Generation Error:", e);
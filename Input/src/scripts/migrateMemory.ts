@@ -0,0 +1,37 @@
+import mongoose from 'mongoose';
+import dotenv from 'dotenv';
+dotenv.config();
+
+import { Avatar } from '../models/Avatar';
+import { memoryStore } from '../services/memoryStore';
+
+// One-off: moves embedded Avatar.memory arrays into the Memory collection. Safe to re-run.
+// Run with: npx ts-node src/scripts/migrateMemory.ts
+const MONGO_URI = process.env.MONGO_URI || 'mongodb://localhost:27017/avatar-platform';
+
+async function migrate() {
+    await mongoose.connect(MONGO_URI);
+    const cursor = Avatar.find({ 'memory.0': { $exists: true } }).cursor();
+
+    for await (const avatar of cursor) {
+        // Keeping each entry's own _id makes a re-run after a crash skip what already moved
+        const entries = avatar.memory.map((m: any) => ({
+            _id: m._id,
+            timestamp: m.timestamp || new Date(0),
+            type: m.type,
+            sessionId: m.sessionId,
+            content: m.content,
+            embedding: m.embedding?.length ? m.embedding : undefined
+        }));
+        await memoryStore.append(avatar.avatarId, entries);
+        await Avatar.updateOne({ _id: avatar._id }, { $set: { memory: [] } });
+        console.log(`[Migrate] Avatar ${avatar.avatarId}: moved ${entries.length} memories`);
+    }
+
+    await mongoose.disconnect();
+}
+
+migrate().catch(err => {
+    console.error('[Migrate] Failed:', err);
+    process.exit(1);
+});
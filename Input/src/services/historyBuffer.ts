@@ -0,0 +1,89 @@
+import mongoose from 'mongoose';
+import { memoryStore, MemoryEntry } from './memoryStore';
+
+// Entries not flushed at turn end go out after at most this long
+const FLUSH_MS = parseInt(process.env.HISTORY_FLUSH_MS || '500', 10);
+
+interface SessionBuffer {
+    avatarId: string;
+    entries: MemoryEntry[];
+    timer: NodeJS.Timeout | null;
+    flushing: Promise<void>; // Flushes for a session run one after another
+}
+
+/**
+ * Write-behind buffer for chat history. Entries are collected per session and
+ * written as one append (one insert, one embedding batch) at turn end or after
+ * FLUSH_MS, instead of a write per message. Each entry gets its _id when buffered,
+ * so re-sending a batch that partly landed doesn't write any row twice.
+ */
+export class HistoryBuffer {
+    private sessions = new Map<string, SessionBuffer>();
+
+    add(avatarId: string, sessionId: string, entry: MemoryEntry) {
+        let buffer = this.sessions.get(sessionId);
+        if (!buffer) {
+            buffer = { avatarId, entries: [], timer: null, flushing: Promise.resolve() };
+            this.sessions.set(sessionId, buffer);
+        }
+        buffer.entries.push({ ...entry, _id: entry._id || new mongoose.Types.ObjectId() });
+        if (!buffer.timer) {
+            buffer.timer = setTimeout(() => { this.flush(sessionId).catch(() => { }); }, FLUSH_MS);
+        }
+    }
+
+    /**
+     * Entries accepted for a session but not yet handed to the store.
+     */
+    pending(sessionId: string): MemoryEntry[] {
+        return [...(this.sessions.get(sessionId)?.entries || [])];
+    }
+
+    /**
+     * Resolves once any in-flight flush for the session has landed, so a following
+     * database read sees it (and pending() covers the rest).
+     */
+    async settled(sessionId: string): Promise<void> {
+        await this.sessions.get(sessionId)?.flushing;
+    }
+
+    async flush(sessionId: string): Promise<void> {
+        const buffer = this.sessions.get(sessionId);
+        if (!buffer) return;
+        if (buffer.timer) {
+            clearTimeout(buffer.timer);
+            buffer.timer = null;
+        }
+
+        const batch = buffer.entries;
+        buffer.entries = [];
+        if (batch.length > 0) {
+            buffer.flushing = buffer.flushing.then(() => memoryStore.append(buffer.avatarId, batch)).catch(e => {
+                // Put the batch back so the next flush retries it; rows that did land are skipped by _id
+                console.error(`[History] Flush failed for session ${sessionId}:`, e.message);
+                buffer.entries.unshift(...batch);
+                if (!buffer.timer) {
+                    buffer.timer = setTimeout(() => { this.flush(sessionId).catch(() => { }); }, FLUSH_MS);
+                }
+            });
+        }
+        await buffer.flushing;
+
+        if (buffer.entries.length === 0 && !buffer.timer && this.sessions.get(sessionId) === buffer) {
+            this.sessions.delete(sessionId);
+        }
+    }
+
+    async flushAvatar(avatarId: string): Promise<void> {
+        const sessionIds = [...this.sessions.entries()]
+            .filter(([, buffer]) => buffer.avatarId === avatarId)
+            .map(([sessionId]) => sessionId);
+        await Promise.all(sessionIds.map(id => this.flush(id)));
+    }
+
+    async flushAll(): Promise<void> {
+        await Promise.all([...this.sessions.keys()].map(id => this.flush(id)));
+    }
+}
+
+export const historyBuffer = new HistoryBuffer();
@@ -2,10 +2,18 @@ import { VisionProcessor } from '../core/processing/vision';
 import { AudioProcessor } from '../core/processing/audio';
 import { StyleAnalyzer } from '../core/processing/style';
 import { Avatar } from '../models/Avatar';
+import { IngestionCache } from '../models/IngestionCache';
+import { IngestionJob } from '../models/IngestionJob';
+import { memoryStore, MemoryEntry } from './memoryStore';
+import { AudioTranscript, VisualContext, StyleDelta } from '../core/types';
 import fs from 'fs';
+import crypto from 'crypto';
+import mongoose from 'mongoose';
 import ffmpeg from 'fluent-ffmpeg';
 
 const API_KEY = process.env.OVERSHOOT_API_KEY || 'mock-key';
+const STYLE_MERGE_ATTEMPTS = 5;
+const STYLE_JOBS_KEPT = 100; // Applied job ids remembered per avatar; retries come within minutes
 
 async function getVideoMetadata(filePath: string): Promise<Date> {
     return new Promise((resolve) => {
@@ -41,82 +49,190 @@ async function getVideoMetadata(filePath: string): Promise<Date> {
     });
 }
 
-export async function processVideoUpload(avatarId: string, filePath: string) {
-    console.log(`[Ingestion] Starting job for Avatar ${avatarId}`);
+/**
+ * Places a stage timestamp on the avatar's timeline: transcripts carry ISO times,
+ * vision results carry video-relative offsets like "12.34s".
+ */
+function memoryTime(creationTime: Date, stamp?: string): Date {
+    if (stamp && /^\d+(\.\d+)?s$/.test(stamp)) {
+        return new Date(creationTime.getTime() + parseFloat(stamp) * 1000);
+    }
+    const parsed = stamp ? new Date(stamp) : null;
+    return parsed && !isNaN(parsed.getTime()) ? parsed : creationTime;
+}
 
-    // 0. Extract Timeline Metadata (creation time)
-    const creationTime = await getVideoMetadata(filePath);
+/**
+ * SHA-256 of a file, streamed so large recordings aren't buffered in memory.
+ */
+export function hashFile(filePath: string): Promise<string> {
+    return new Promise((resolve, reject) => {
+        const hash = crypto.createHash('sha256');
+        fs.createReadStream(filePath)
+            .on('data', chunk => hash.update(chunk))
+            .on('end', () => resolve(hash.digest('hex')))
+            .on('error', reject);
+    });
+}
 
-    // 1. Process in PARALLEL with graceful failure handling
-    const vision = new VisionProcessor(API_KEY);
-    const audio = new AudioProcessor();
-    const style = new StyleAnalyzer();
+/**
+ * Folds a style delta into the avatar's profile. The write only lands if nobody merged
+ * since the profile was read (personalityVersion unchanged); otherwise the merge is redone
+ * on the fresh profile, so concurrent jobs for one avatar don't drop each other's deltas.
+ * The same update records jobId, and a job that is already recorded (a re-run after a
+ * crash, or a second worker on a requeued job) is skipped.
+ * Returns false if the avatar doesn't exist.
+ */
+async function mergeStyle(avatarId: string, delta: StyleDelta, jobId?: string): Promise<boolean> {
+    const analyzer = new StyleAnalyzer();
+    for (let attempt = 1; attempt <= STYLE_MERGE_ATTEMPTS; attempt++) {
+        const avatar = await Avatar.findOne({ avatarId }).select('personality personalityVersion styleJobIds').lean();
+        if (!avatar) return false;
+        if (jobId && avatar.styleJobIds?.includes(jobId)) {
+            console.log(`[Ingestion] Style delta of job ${jobId} already merged, skipping`);
+            return true;
+        }
+
+        // null also matches avatars written before personalityVersion existed
+        const version = avatar.personalityVersion ?? null;
+        const result = await Avatar.updateOne(
+            { avatarId, personalityVersion: version },
+            {
+                $set: { personality: analyzer.mergeDelta(avatar.personality as any, delta) },
+                $inc: { personalityVersion: 1 },
+                ...(jobId ? { $push: { styleJobIds: { $each: [jobId], $slice: -STYLE_JOBS_KEPT } } } : {})
+            }
+        );
+        if (result.matchedCount > 0) return true;
+        console.warn(`[Ingestion] Style profile of ${avatarId} changed during merge, retrying (${attempt}/${STYLE_MERGE_ATTEMPTS})`);
+    }
+    throw new Error(`Style merge for ${avatarId} lost ${STYLE_MERGE_ATTEMPTS} races in a row`);
+}
 
-    // Use Promise.allSettled so one failure doesn't block the other
-    const results = await Promise.allSettled([
-        vision.processVideo(filePath),
-        audio.processAudio(filePath)
-    ]);
+/**
+ * Deterministic _ids for a job's memories (one per index), so an append repeated by a
+ * retried job skips the entries that already landed. The id's time part is when the job
+ * first reached this step, which keeps incremental vector-index refreshes picking them up.
+ */
+async function memoryIds(jobId: string, count: number): Promise<mongoose.Types.ObjectId[]> {
+    const job = await IngestionJob.findOneAndUpdate(
+        { jobId },
+        { $min: { memoryIdsAt: new Date() } }, // Only set by the first attempt
+        { new: true, projection: { memoryIdsAt: 1 } }
+    ).lean();
+    const seconds = Math.floor((job?.memoryIdsAt || new Date()).getTime() / 1000);
+    const time = seconds.toString(16).padStart(8, '0');
+    return Array.from({ length: count }, (_, i) =>
+        new mongoose.Types.ObjectId(time + crypto.createHash('sha1').update(`${jobId}:${i}`).digest('hex').slice(0, 16)));
+}
 
-    // Extract results, using empty arrays for failures
-    const visuals = results[0].status === 'fulfilled' ? results[0].value : [];
-    const transcripts = results[1].status === 'fulfilled' ? results[1].value : [];
+/**
+ * Cache entries this job may reuse: its own avatar's, or (when the server verified the
+ * hash against the uploaded bytes) any verified entry for the same content.
+ */
+function findCached(avatarId: string, contentHash: string, hashVerified: boolean) {
+    const scope = hashVerified ? [{ avatarId }, { verified: true }] : [{ avatarId }];
+    return IngestionCache.findOne({ contentHash, $or: scope }).lean();
+}
 
-    // Log any failures
-    if (results[0].status === 'rejected') {
-        console.error(`[Ingestion] Vision processing failed:`, results[0].reason?.message || results[0].reason);
-    }
-    if (results[1].status === 'rejected') {
-        console.error(`[Ingestion] Audio processing failed:`, results[1].reason?.message || results[1].reason);
-    }
+/**
+ * Runs (or reuses) every stage for one upload and folds the results into the avatar.
+ * `degraded` is true when a stage failed and the avatar only got partial results.
+ * With a jobId, applying the results is idempotent, so a crashed job can be re-run.
+ */
+export async function processVideoUpload(avatarId: string, filePath: string, audioPath?: string,
+    contentHash?: string, hashVerified = false, jobId?: string): Promise<{ degraded: boolean }> {
+    console.log(`[Ingestion] Starting job for Avatar ${avatarId}`);
 
-    // Check if we have any data to work with
-    if (visuals.length === 0 && transcripts.length === 0) {
-        console.error(`[Ingestion] Both vision and audio failed. Cannot generate profile.`);
-        throw new Error('Both vision and audio processing failed');
+    let creationTime: Date;
+    let visuals: VisualContext[];
+    let transcripts: AudioTranscript[];
+    let styleDelta: StyleDelta;
+    let degraded = false;
+
+    const cached = contentHash ? await findCached(avatarId, contentHash, hashVerified) : null;
+    if (cached) {
+        // Same recording was processed before (possibly for another avatar): reuse every stage
+        console.log(`[Ingestion] Cache hit for ${contentHash}, skipping vision/audio/style`);
+        creationTime = cached.creationTime || new Date();
+        visuals = (cached.visuals || []) as VisualContext[];
+        transcripts = (cached.transcripts || []) as AudioTranscript[];
+        styleDelta = cached.profile as StyleDelta;
+        if (typeof styleDelta?.wordCount !== 'number') {
+            // Cached before style deltas existed; only the style stage is redone
+            styleDelta = await new StyleAnalyzer().analyze(transcripts, visuals);
+            await IngestionCache.updateOne({ _id: cached._id }, { $set: { profile: styleDelta } })
+                .catch(e => console.warn(`[Ingestion] Could not cache results: ${e.message}`));
+        }
+    } else {
+        // 0. Extract Timeline Metadata (creation time)
+        creationTime = await getVideoMetadata(filePath);
+
+        // 1. Process in PARALLEL with graceful failure handling
+        const vision = new VisionProcessor(API_KEY);
+        const audio = new AudioProcessor();
+        const style = new StyleAnalyzer();
+
+        // Use Promise.allSettled so one failure doesn't block the other
+        const results = await Promise.allSettled([
+            vision.processVideo(filePath),
+            audio.processAudio(filePath, audioPath, creationTime)
+        ]);
+
+        // Extract results, using empty arrays for failures
+        visuals = results[0].status === 'fulfilled' ? results[0].value : [];
+        transcripts = results[1].status === 'fulfilled' ? results[1].value : [];
+
+        // Log any failures
+        if (results[0].status === 'rejected') {
+            console.error(`[Ingestion] Vision processing failed:`, results[0].reason?.message || results[0].reason);
+        }
+        if (results[1].status === 'rejected') {
+            console.error(`[Ingestion] Audio processing failed:`, results[1].reason?.message || results[1].reason);
+        }
+
+        degraded = results.some(r => r.status === 'rejected');
+
+        // Check if we have any data to work with
+        if (visuals.length === 0 && transcripts.length === 0) {
+            console.error(`[Ingestion] Both vision and audio failed. Cannot generate profile.`);
+            throw new Error('Both vision and audio processing failed');
+        }
+
+        console.log(`[Ingestion] Processing complete. Visuals: ${visuals.length}, Transcripts: ${transcripts.length}`);
+
+        // 2. Analyze (even with partial data)
+        styleDelta = await style.analyze(transcripts, visuals);
+
+        // Only cache complete results so a partial failure can be retried
+        if (contentHash && !degraded) {
+            await IngestionCache.updateOne(
+                { contentHash, avatarId },
+                { $set: { creationTime, visuals, transcripts, profile: styleDelta, verified: hashVerified } },
+                { upsert: true }
+            ).catch(e => console.warn(`[Ingestion] Could not cache results: ${e.message}`));
+        } else if (degraded) {
+            console.warn(`[Ingestion] Partial results for Avatar ${avatarId}; not cached, content may be re-ingested`);
+        }
     }
 
-    console.log(`[Ingestion] Processing complete. Visuals: ${visuals.length}, Transcripts: ${transcripts.length}`);
-
-    // 2. Analyze (even with partial data)
-    const currentProfile = await style.analyze(transcripts, visuals);
-
-    // 3. Update Database (Optimization Loop)
-    const avatar = await Avatar.findOne({ avatarId });
-    if (avatar) {
-        const oldProfile: any = avatar.personality;
-        const newTotalSessions = (oldProfile.consistencyMetrics?.totalSessions || 0) + 1;
-
-        // Update filler word freq (Weighted Avg)
-        const oldFreq = oldProfile.fillerWordFrequency || 0;
-        const newFreq = currentProfile.fillerWordFrequency || 0;
-        const avgFreq = ((oldFreq * (newTotalSessions - 1)) + newFreq) / newTotalSessions;
-
-        // Save Analysis
-        avatar.personality = {
-            ...currentProfile,
-            fillerWordFrequency: avgFreq,
-            consistencyMetrics: {
-                totalSessions: newTotalSessions,
-                lastUpdated: new Date()
-            }
-        };
+    // 3. Update Database (Optimization Loop) - fold this video's delta into the running profile
+    if (await mergeStyle(avatarId, styleDelta, jobId)) {
 
-        // Store Memory (Vector Simulation)
-        const newMemories = [
-            ...transcripts.map(t => ({ timestamp: creationTime, type: 'audio', content: t.text })),
-            ...visuals.map(v => ({ timestamp: creationTime, type: 'vision', content: v.description }))
+        // Store Memory (Vector Simulation) - appended to the indexed memory store
+        const newMemories: MemoryEntry[] = [
+            ...transcripts.map(t => ({ timestamp: memoryTime(creationTime, t.timestamp), type: 'audio' as const, content: t.text })),
+            ...visuals.map(v => ({ timestamp: memoryTime(creationTime, v.timestamp), type: 'vision' as const, content: v.description }))
         ];
-
-        avatar.memory.push(...newMemories as any);
-        await avatar.save();
+        if (jobId) {
+            const ids = await memoryIds(jobId, newMemories.length);
+            newMemories.forEach((m, i) => { m._id = ids[i]; });
+        }
+        await memoryStore.append(avatarId, newMemories);
+        // Forked workers tell the API process so cached chat sessions pick up the new profile
+        process.send?.({ type: 'avatar-updated', avatarId });
         console.log(`[Ingestion] Avatar ${avatarId} updated successfully.`);
     }
-
-    // cleanup
-    try {
-        fs.unlinkSync(filePath);
-    } catch (e) {
-        console.warn(`[Ingestion] Could not delete temp file: ${filePath}`);
-    }
+    // The uploads are left for the caller to delete once the job is recorded as finished,
+    // so a crash before that can still re-run the job from disk
+    return { degraded };
 }
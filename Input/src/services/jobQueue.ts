@@ -0,0 +1,113 @@
+import { IngestionJob } from '../models/IngestionJob';
+
+export const MAX_ATTEMPTS = parseInt(process.env.INGEST_MAX_ATTEMPTS || '3', 10);
+export const HEARTBEAT_MS = 10000;
+// A processing job whose worker hasn't checked in for this long is presumed dead
+const STALE_MS = HEARTBEAT_MS * 6;
+
+export interface IngestionRequest {
+    jobId: string;
+    avatarId: string;
+    videoPath: string;
+    audioPath?: string;
+    contentHash?: string;
+    hashVerified?: boolean;
+    priority?: number;
+}
+
+/**
+ * Persists a job for the worker processes to pick up.
+ * Throws a duplicate-key error (code 11000) if the avatar already has an active
+ * job for the same content.
+ */
+export async function enqueueIngestion(request: IngestionRequest) {
+    return IngestionJob.create({
+        ...request,
+        priority: request.priority || 0,
+        status: 'pending',
+        active: true
+    });
+}
+
+/**
+ * Atomically moves the best pending job to 'processing' for this worker.
+ * Returns null when the queue is empty.
+ */
+export async function claimNextJob(workerId: string) {
+    const now = new Date();
+    return IngestionJob.findOneAndUpdate(
+        { status: 'pending' },
+        {
+            $set: { status: 'processing', workerId, heartbeatAt: now, startedAt: now },
+            $inc: { attempts: 1 }
+        },
+        { sort: { priority: -1, createdAt: 1 }, new: true }
+    );
+}
+
+/**
+ * Identifies one claim of a job: a job requeued by recoverStaleJobs is claimed again with a
+ * higher attempt number, so the earlier (slow, not dead) worker no longer owns it.
+ */
+export interface JobClaim {
+    jobId: string;
+    workerId: string;
+    attempts: number;
+}
+
+function owned(claim: JobClaim) {
+    return { jobId: claim.jobId, workerId: claim.workerId, attempts: claim.attempts, status: 'processing' };
+}
+
+/**
+ * Returns false once the claim has been lost (the job was requeued or failed by recovery).
+ */
+export async function heartbeat(claim: JobClaim): Promise<boolean> {
+    const result = await IngestionJob.updateOne(owned(claim), { heartbeatAt: new Date() });
+    return result.matchedCount > 0;
+}
+
+/**
+ * A degraded job (a stage failed) stops blocking re-uploads so the content can be ingested again.
+ * Only the current claim can finish a job; returns false if it was lost.
+ */
+export async function completeJob(claim: JobClaim, degraded = false): Promise<boolean> {
+    const job = await IngestionJob.findOneAndUpdate(owned(claim), {
+        status: 'completed',
+        completedAt: new Date(),
+        ...(degraded ? { degraded: true, $unset: { active: 1 } } : {})
+    });
+    return !!job;
+}
+
+export async function failJob(claim: JobClaim, error: string): Promise<boolean> {
+    const job = await IngestionJob.findOneAndUpdate(owned(claim), {
+        status: 'failed',
+        error,
+        completedAt: new Date(),
+        $unset: { active: 1 }
+    });
+    return !!job;
+}
+
+/**
+ * Crash recovery: jobs left 'processing' by a dead worker go back to the queue,
+ * or fail once they've used up their attempts (so a poison video can't loop forever).
+ */
+export async function recoverStaleJobs(): Promise<number> {
+    const cutoff = new Date(Date.now() - STALE_MS);
+    const stale = { status: 'processing', heartbeatAt: { $lt: cutoff } };
+
+    const exhausted = await IngestionJob.updateMany(
+        { ...stale, attempts: { $gte: MAX_ATTEMPTS } },
+        {
+            status: 'failed', error: 'Worker died while processing (max attempts reached)', completedAt: new Date(),
+            $unset: { active: 1 }
+        }
+    );
+    const requeued = await IngestionJob.updateMany(
+        { ...stale, attempts: { $lt: MAX_ATTEMPTS } },
+        { status: 'pending', $unset: { workerId: 1, heartbeatAt: 1 } }
+    );
+    return exhausted.modifiedCount + requeued.modifiedCount;
+}
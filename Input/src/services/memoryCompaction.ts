@@ -0,0 +1,210 @@
+import OpenAI from 'openai';
+import mongoose from 'mongoose';
+import { Avatar } from '../models/Avatar';
+import { Memory } from '../models/Memory';
+import { MemoryArchive } from '../models/MemoryArchive';
+import { memoryStore } from './memoryStore';
+
+const openai = new OpenAI({ apiKey: process.env.OPENAI_API_KEY || 'mock-key' });
+
+// Raw memories older than this are folded into summaries
+const COMPACT_AFTER_MS = parseFloat(process.env.MEMORY_COMPACT_AFTER_DAYS || '7') * 24 * 3600 * 1000;
+// Hot (non-summary) memories kept per avatar; past this, the oldest are compacted regardless of age
+const HOT_LIMIT = parseInt(process.env.MEMORY_HOT_LIMIT || '2000', 10);
+// How often each avatar is considered
+export const COMPACTION_INTERVAL_MS = parseInt(process.env.MEMORY_COMPACTION_INTERVAL_MS || '3600000', 10);
+const SUMMARY_MODEL = process.env.MEMORY_SUMMARY_MODEL || 'gpt-4o-mini';
+
+const BATCH_LIMIT = 5000;            // Raw memories compacted per avatar per run
+const BURST_GAP_MS = 30 * 60 * 1000; // Vision/audio entries further apart than this start a new burst
+const MAX_GROUP_SIZE = 200;          // Keeps each summarization prompt bounded
+
+interface MemoryGroup {
+    kind: 'session' | 'activity';
+    docs: any[];
+}
+
+/**
+ * Chat turns group by session; vision/audio entries group into bursts of
+ * closely spaced footage (usually one recording).
+ */
+function groupMemories(docs: any[]): MemoryGroup[] {
+    const sessions = new Map<string, MemoryGroup>();
+    const groups: MemoryGroup[] = [];
+    let burst: MemoryGroup | null = null;
+    let lastActivity = 0;
+
+    for (const doc of docs) {
+        if (doc.type === 'text') {
+            const key = doc.sessionId || 'none';
+            let group = sessions.get(key);
+            if (!group || group.docs.length >= MAX_GROUP_SIZE) {
+                group = { kind: 'session', docs: [] };
+                sessions.set(key, group);
+                groups.push(group);
+            }
+            group.docs.push(doc);
+            continue;
+        }
+
+        const time = new Date(doc.timestamp).getTime();
+        if (!burst || time - lastActivity > BURST_GAP_MS || burst.docs.length >= MAX_GROUP_SIZE) {
+            burst = { kind: 'activity', docs: [] };
+            groups.push(burst);
+        }
+        burst.docs.push(doc);
+        lastActivity = time;
+    }
+    return groups;
+}
+
+async function summarize(group: MemoryGroup): Promise<string> {
+    const lines = group.docs.map(d => `[${new Date(d.timestamp).toISOString()}] ${d.content}`);
+    if (group.docs.length === 1) return group.docs[0].content;
+
+    const label = group.kind === 'session' ? 'Conversation' : 'Activity';
+    if (process.env.OPENAI_API_KEY === 'mock-key' || !process.env.OPENAI_API_KEY) {
+        // Extractive stand-in: the first few entries, trimmed
+        const text = group.docs.slice(0, 5).map(d => d.content).join(' / ');
+        return `${label} summary (${group.docs.length} entries): ${text.slice(0, 600)}`;
+    }
+
+    const instructions = group.kind === 'session'
+        ? "Summarize this conversation between a user and the person speaking as 'Avatar'. Keep names, facts, plans, opinions and anything the user shared about themselves. Write in third person, 3-6 sentences."
+        : "Summarize this log of what a person was doing and saying, from their recorded footage. Keep places, people, objects, activities and notable quotes. Write in third person, 3-6 sentences.";
+
+    const response = await openai.chat.completions.create({
+        model: SUMMARY_MODEL,
+        messages: [
+            { role: 'system', content: instructions },
+            { role: 'user', content: lines.join('\n') }
+        ],
+        max_completion_tokens: 300
+    });
+    const summary = response.choices[0].message?.content?.trim();
+    if (!summary) throw new Error("Empty summary");
+    return `${label} (${lines.length} entries, from ${new Date(group.docs[0].timestamp).toDateString()}): ${summary}`;
+}
+
+/**
+ * Finishes groups a crashed run left half done. Raw memories are archived (tagged with
+ * their summary's pre-assigned id) before the summary is written, so an archived entry
+ * that is still hot either has its summary (only the delete is missing) or doesn't
+ * (the archive copy is dropped and the entry is compacted again).
+ * Returns the docs still to compact.
+ */
+async function resumeInterrupted(docs: any[]): Promise<any[]> {
+    const archived = await MemoryArchive.find({ _id: { $in: docs.map(d => d._id) } }).select('_id summaryId').lean();
+    if (archived.length === 0) return docs;
+
+    const summaryIds = [...new Set(archived.map(a => String(a.summaryId)))];
+    const written = new Set((await Memory.find({ _id: { $in: summaryIds } }).select('_id').lean()).map(s => String(s._id)));
+    const done = archived.filter(a => written.has(String(a.summaryId))).map(a => a._id);
+    const orphaned = archived.filter(a => !written.has(String(a.summaryId))).map(a => a._id);
+
+    if (done.length) await Memory.deleteMany({ _id: { $in: done } });
+    if (orphaned.length) await MemoryArchive.deleteMany({ _id: { $in: orphaned } });
+    console.log(`[Compaction] Resumed interrupted run: ${done.length} memories already summarized, ${orphaned.length} to redo.`);
+
+    const doneIds = new Set(done.map(String));
+    return docs.filter(d => !doneIds.has(String(d._id)));
+}
+
+/**
+ * Folds old raw memories of one avatar into summary memories and moves the raw
+ * entries to MemoryArchive. The live session is never compacted. Safe to re-run
+ * after a crash at any step (see resumeInterrupted).
+ * Summaries themselves are never compacted again: they grow by one per group
+ * (up to MAX_GROUP_SIZE raw entries each) and count towards neither HOT_LIMIT nor
+ * BATCH_LIMIT, so an avatar's summary count is unbounded over its lifetime.
+ * Returns the number of raw memories archived.
+ */
+export async function compactAvatar(avatarId: string, activeSessionId?: string | null): Promise<number> {
+    const hot = { avatarId, type: { $ne: 'summary' } };
+    let cutoff = new Date(Date.now() - COMPACT_AFTER_MS);
+
+    // Over the cap: also compact everything older than the HOT_LIMIT-th newest entry
+    if (await Memory.countDocuments(hot) > HOT_LIMIT) {
+        const boundary = await Memory.findOne(hot).sort({ timestamp: -1 }).skip(HOT_LIMIT).select('timestamp').lean();
+        if (boundary?.timestamp && boundary.timestamp > cutoff) cutoff = boundary.timestamp;
+    }
+
+    const query: any = { ...hot, timestamp: { $lt: cutoff } };
+    if (activeSessionId) query.sessionId = { $ne: activeSessionId };
+    const found = await Memory.find(query).sort({ timestamp: 1 }).limit(BATCH_LIMIT).lean();
+    if (found.length === 0) return 0;
+    const docs = await resumeInterrupted(found);
+
+    let archived = found.length - docs.length; // Finished on behalf of an interrupted run
+    for (const group of groupMemories(docs)) {
+        let content: string;
+        try {
+            content = await summarize(group);
+        } catch (e) {
+            // Leave the group hot; it's retried on the next run
+            console.warn(`[Compaction] Summarizing ${group.docs.length} memories of ${avatarId} failed: ${(e as Error).message}`);
+            continue;
+        }
+
+        // Archive first, tagged with the summary's id, so a crash before the summary or the
+        // delete lands can be told apart on the next run
+        const summaryId = new mongoose.Types.ObjectId();
+        try {
+            await MemoryArchive.insertMany(
+                group.docs.map(d => ({ ...d, summaryId })),
+                { ordered: false }
+            );
+        } catch (e: any) {
+            // Already archived by an earlier, interrupted run
+            if (e.code !== 11000 && !e.writeErrors?.every((w: any) => w.code === 11000)) throw e;
+        }
+
+        await memoryStore.append(avatarId, [{
+            _id: summaryId,
+            timestamp: group.docs[0].timestamp,
+            type: 'summary',
+            sessionId: group.kind === 'session' ? group.docs[0].sessionId : undefined,
+            content,
+            compactedCount: group.docs.length
+        }]);
+        await Memory.deleteMany({ _id: { $in: group.docs.map(d => d._id) } });
+        archived += group.docs.length;
+    }
+
+    if (archived > 0) {
+        // Removed entries stay in a loaded vector index until it's rebuilt
+        memoryStore.invalidateIndex(avatarId);
+        process.send?.({ type: 'memories-compacted', avatarId });
+        console.log(`[Compaction] Avatar ${avatarId}: archived ${archived} memories into summaries.`);
+    }
+    return archived;
+}
+
+/**
+ * Compacts every avatar not compacted within COMPACTION_INTERVAL_MS. Each avatar is
+ * claimed atomically, so several workers can run this concurrently.
+ */
+export async function compactDueAvatars(shouldContinue: () => boolean = () => true): Promise<number> {
+    let total = 0;
+    while (shouldContinue()) {
+        const now = new Date();
+        const avatar = await Avatar.findOneAndUpdate(
+            {
+                $or: [
+                    { memoryCompactedAt: { $exists: false } },
+                    { memoryCompactedAt: { $lt: new Date(now.getTime() - COMPACTION_INTERVAL_MS) } }
+                ]
+            },
+            { $set: { memoryCompactedAt: now } },
+            { projection: { avatarId: 1, activeSessionId: 1 } }
+        ).lean();
+        if (!avatar) break;
+
+        try {
+            total += await compactAvatar(avatar.avatarId, avatar.activeSessionId);
+        } catch (e) {
+            console.error(`[Compaction] Avatar ${avatar.avatarId} failed:`, e);
+        }
+    }
+    return total;
+}
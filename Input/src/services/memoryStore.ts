@@ -0,0 +1,125 @@
+import mongoose from 'mongoose';
+import { Avatar } from '../models/Avatar';
+import { Memory } from '../models/Memory';
+import { createEmbedder, Embedder } from '../core/processing/embedding';
+import { VectorIndexCache } from './vectorIndex';
+
+export interface MemoryEntry {
+    _id?: mongoose.Types.ObjectId; // Set by writers that may retry, so a retried append is idempotent
+    timestamp: Date;
+    type: 'audio' | 'vision' | 'text' | 'summary';
+    sessionId?: string;
+    content: string;
+    embedding?: number[];
+    compactedCount?: number;
+}
+
+/**
+ * Append-only memory store backed by the indexed Memory collection.
+ * Every entry is embedded once on append; similarity search runs against a
+ * cached per-avatar vector index.
+ * Under MOCK_DB there is no database, so writes are dropped and reads are empty.
+ */
+export class MemoryStore {
+    private embedder: Embedder;
+    private vectors: VectorIndexCache;
+
+    constructor(embedder: Embedder = createEmbedder()) {
+        this.embedder = embedder;
+        this.vectors = new VectorIndexCache(embedder.model, embedder.dimensions);
+    }
+
+    async embed(texts: string[]): Promise<number[][]> {
+        return this.embedder.embed(texts);
+    }
+
+    /**
+     * Appends entries. Entries may carry a precomputed embedding (from this store's
+     * embedder); the rest are embedded here in one batch. Returns the inserted documents.
+     * Entries whose _id is already stored (a retry of a partly written batch) are skipped.
+     */
+    async append(avatarId: string, entries: MemoryEntry[]): Promise<any[]> {
+        if (entries.length === 0) return [];
+        if (process.env.MOCK_DB) {
+            console.log(`[MockDB] Dropped ${entries.length} memories.`);
+            return [];
+        }
+
+        const missing = entries.filter(e => !e.embedding?.length);
+        try {
+            const vectors = await this.embedder.embed(missing.map(e => e.content));
+            missing.forEach((e, i) => { e.embedding = vectors[i]; });
+        } catch (e) {
+            // Never lose a memory because embedding failed; it just won't be retrievable by similarity
+            console.warn(`[Memory] Embedding failed, storing without vectors: ${(e as Error).message}`);
+        }
+
+        const rows = entries.map(e => ({
+            ...e,
+            avatarId,
+            embeddingModel: e.embedding?.length ? this.embedder.model : undefined
+        }));
+        let docs: any[];
+        try {
+            docs = await Memory.insertMany(rows, { ordered: false });
+        } catch (e: any) {
+            // Only duplicate _ids (rows that landed on an earlier attempt) count as written
+            const writeErrors: any[] = e?.writeErrors || [];
+            if (!writeErrors.length || writeErrors.some(w => (w.code ?? w.err?.code) !== 11000)) throw e;
+            docs = rows;
+        }
+        this.vectors.addIfLoaded(avatarId, docs);
+
+        // Advance the latest-activity pointer only if these are newer than what it holds
+        const activity = entries
+            .filter(e => e.type === 'vision' || e.type === 'audio')
+            .sort((a, b) => b.timestamp.getTime() - a.timestamp.getTime())[0];
+        if (activity) {
+            await Avatar.updateOne(
+                {
+                    avatarId,
+                    $or: [
+                        { 'latestActivity.timestamp': { $exists: false } },
+                        { 'latestActivity.timestamp': { $lte: activity.timestamp } }
+                    ]
+                },
+                { $set: { latestActivity: { timestamp: activity.timestamp, type: activity.type, content: activity.content } } }
+            );
+        }
+        return docs;
+    }
+
+    /**
+     * Last `limit` text entries of a session, oldest first. `before` excludes entries
+     * written by the turn currently being generated.
+     */
+    async sessionHistory(avatarId: string, sessionId: string, limit = 10, before?: Date) {
+        if (process.env.MOCK_DB) return [];
+        const query: any = { avatarId, sessionId, type: 'text' };
+        if (before) query.timestamp = { $lt: before };
+        const recent = await Memory.find(query).sort({ timestamp: -1 }).limit(limit).lean();
+        return recent.reverse();
+    }
+
+    /**
+     * Top-k memories by embedding similarity (best first), optionally excluding one session
+     * (the live one, whose turns are already in the prompt as history).
+     * Pass queryEmbedding to reuse a vector computed for the same text.
+     */
+    async searchSimilar(avatarId: string, text: string, k = 3, excludeSessionId?: string, queryEmbedding?: number[]) {
+        if (process.env.MOCK_DB || !text) return [];
+        const [vector] = queryEmbedding ? [queryEmbedding] : await this.embedder.embed([text]);
+        const index = await this.vectors.get(avatarId);
+        // The index holds the memory text itself, so no database round-trip per search
+        return index.query(vector, k, excludeSessionId).map(h => ({ _id: h.id, ...h.memory, score: h.score }));
+    }
+
+    /**
+     * Drops a cached vector index (e.g. after memories were removed or rewritten).
+     */
+    invalidateIndex(avatarId: string) {
+        this.vectors.invalidate(avatarId);
+    }
+}
+
+export const memoryStore = new MemoryStore();
@@ -0,0 +1,120 @@
+import express from 'express';
+import { v4 as uuidv4 } from 'uuid';
+
+const KEEPALIVE_MS = 15000;
+const WAIT_SAMPLES = 200; // Recent operator wait times kept for percentiles
+
+export interface PendingRequest {
+    requestId: string;
+    sessionId: string;
+    avatarId: string;
+    text: string;
+    visualContext?: string;
+    intervention: number;
+    receivedAt: number;
+    res: express.Response; // The user's held-open response stream
+}
+
+export type PendingSummary = Omit<PendingRequest, 'res'> & { waitingMs: number };
+
+function summary(request: PendingRequest): PendingSummary {
+    const { res, ...rest } = request;
+    return { ...rest, waitingMs: Date.now() - request.receivedAt };
+}
+
+/**
+ * Human-in-the-loop requests waiting for an operator, queued FIFO per session.
+ * Operators subscribe to a Server-Sent Events feed and are pushed every new,
+ * claimed or cancelled request instead of having to poll.
+ */
+export class OperatorQueue {
+    private sessions = new Map<string, PendingRequest[]>();
+    private subscribers = new Set<express.Response>();
+    private waits: number[] = [];
+
+    enqueue(request: Omit<PendingRequest, 'requestId' | 'receivedAt'>): PendingRequest {
+        const pending: PendingRequest = { ...request, requestId: uuidv4(), receivedAt: Date.now() };
+        const queue = this.sessions.get(pending.sessionId) || [];
+        queue.push(pending);
+        this.sessions.set(pending.sessionId, queue);
+        this.broadcast('request', summary(pending));
+        return pending;
+    }
+
+    /**
+     * Removes a request for an operator to answer: the given one, or the oldest in the session.
+     */
+    take(sessionId: string, requestId?: string): { request: PendingRequest, waitMs: number } | null {
+        const request = this.remove(sessionId, requestId);
+        if (!request) return null;
+
+        const waitMs = Date.now() - request.receivedAt;
+        this.waits.push(waitMs);
+        if (this.waits.length > WAIT_SAMPLES) this.waits.shift();
+        this.broadcast('claimed', { requestId: request.requestId, sessionId, waitMs });
+        return { request, waitMs };
+    }
+
+    /**
+     * The user went away before an operator answered.
+     */
+    cancel(sessionId: string, requestId: string) {
+        const request = this.remove(sessionId, requestId);
+        if (request) {
+            this.broadcast('cancelled', { requestId, sessionId, waitedMs: Date.now() - request.receivedAt });
+        }
+    }
+
+    list(): PendingSummary[] {
+        return [...this.sessions.values()].flat()
+            .sort((a, b) => a.receivedAt - b.receivedAt)
+            .map(summary);
+    }
+
+    waitStats() {
+        const sorted = [...this.waits].sort((a, b) => a - b);
+        const at = (q: number) => sorted.length ? sorted[Math.min(sorted.length - 1, Math.floor(sorted.length * q))] : null;
+        return { pending: this.list().length, answered: sorted.length, p50Ms: at(0.5), p95Ms: at(0.95), maxMs: sorted.length ? sorted[sorted.length - 1] : null };
+    }
+
+    /**
+     * Turns `res` into an SSE stream. The current backlog is sent first, so an
+     * operator who connects late sees requests that are already waiting.
+     */
+    subscribe(res: express.Response) {
+        res.setHeader('Content-Type', 'text/event-stream');
+        res.setHeader('Cache-Control', 'no-cache');
+        res.setHeader('Connection', 'keep-alive');
+        res.flushHeaders();
+
+        this.send(res, 'snapshot', { pending: this.list(), waits: this.waitStats() });
+        this.subscribers.add(res);
+
+        const keepAlive = setInterval(() => res.write(': keep-alive\n\n'), KEEPALIVE_MS);
+        res.on('close', () => {
+            clearInterval(keepAlive);
+            this.subscribers.delete(res);
+        });
+    }
+
+    private remove(sessionId: string, requestId?: string): PendingRequest | null {
+        const queue = this.sessions.get(sessionId);
+        if (!queue?.length) return null;
+
+        const index = requestId ? queue.findIndex(r => r.requestId === requestId) : 0;
+        if (index < 0) return null;
+        const [request] = queue.splice(index, 1);
+        if (queue.length === 0) this.sessions.delete(sessionId);
+        return request;
+    }
+
+    private broadcast(event: string, data: unknown) {
+        for (const res of this.subscribers) this.send(res, event, data);
+    }
+
+    private send(res: express.Response, event: string, data: unknown) {
+        res.write(`event: ${event}\ndata: ${JSON.stringify(data)}\n\n`);
+    }
+}
+
+export const operatorQueue = new OperatorQueue();
@@ -1,10 +1,44 @@
-import { Avatar } from '../models/Avatar';
+import { memoryStore, MemoryEntry } from './memoryStore';
+import { historyBuffer } from './historyBuffer';
+import { sessionCache } from './sessionCache';
 import OpenAI from 'openai';
+import crypto from 'crypto';
+import mongoose from 'mongoose';
 
 const openai = new OpenAI({
     apiKey: process.env.OPENAI_API_KEY || 'mock-key',
 });
 
+// Fixed per-avatar instructions. They sit right after the persona so the
+// leading system message is byte-identical on every turn of a session.
+const RESPONSE_RULES = `
+Your goal is to reply to the user naturally, embodying this persona.
+Do NOT be robotic. Use the filler words and dialect specified.
+`.trim();
+
+/**
+ * _id of the nth history entry of a client-identified turn. turnId is a client-made ObjectId
+ * (hex), so every brain that receives the same turn (a hedged request to a replica on the
+ * same database) writes the same ids, and memoryStore.append keeps only the first copy.
+ */
+function turnEntryId(turnId: string, n: number): mongoose.Types.ObjectId {
+    if (n === 0) return new mongoose.Types.ObjectId(turnId);
+    const suffix = crypto.createHash('sha1').update(`${turnId}:${n}`).digest('hex').slice(0, 16);
+    return new mongoose.Types.ObjectId(turnId.slice(0, 8) + suffix);
+}
+
+export function isTurnId(value: unknown): value is string {
+    return typeof value === 'string' && /^[0-9a-f]{24}$/i.test(value);
+}
+
+export interface TurnStats {
+    promptTokens: number;
+    cachedTokens: number;
+    cachedRatio: number;    // cachedTokens / promptTokens
+    ttftMs: number | null;  // Time from request to the first streamed token
+    totalMs: number;
+}
+
 export class ResponseService {
 
     /**
@@ -19,74 +53,76 @@ export class ResponseService {
         userText: string,
         visualContext?: string
     ): Promise<string> {
+        return (await this.generateTurn(avatarId, sessionId, userText, visualContext)).response;
+    }
 
-        const avatar = await Avatar.findOne({ avatarId });
-        if (!avatar) throw new Error("Avatar not found");
+    /**
+     * generateResponse, plus prompt-cache and latency figures for the turn.
+     * With a turnId (see turnEntryId), the turn's history writes are idempotent.
+     */
+    async generateTurn(
+        avatarId: string,
+        sessionId: string,
+        userText: string,
+        visualContext?: string,
+        turnId?: string
+    ): Promise<{ response: string, stats: TurnStats | null }> {
+
+        const turnStart = new Date();
+
+        // The user's text is embedded once: for retrieval and for storing it as a memory
+        const [queryEmbedding] = await memoryStore.embed([userText]).catch((e): number[][] => {
+            console.warn(`[ResponseService] Query embedding failed: ${e.message}`);
+            return [];
+        });
 
-        // 1. Save User Input to Memory (Short-term)
-        await this.addToHistory(avatar, sessionId, 'user', userText);
+        // Hot session context (persona, history ring, latest activity); only a cache miss reads the database
+        const [context, relevantMemories] = await Promise.all([
+            sessionCache.get(avatarId, sessionId),
+            // B. RAG (Relevant Past) - top-k by embedding similarity from other sessions
+            queryEmbedding
+                ? memoryStore.searchSimilar(avatarId, userText, 3, sessionId, queryEmbedding)
+                : Promise.resolve([])
+        ]);
+        if (!context) throw new Error("Avatar not found");
+        // A. Immediate History (Current Session) - last 10 turns before this one
+        const recentHistory = [...context.history];
+
+        // 1. Save User Input to Memory (Short-term) - buffered, written with the reply at turn end
+        const userEntries: MemoryEntry[] = [
+            { timestamp: turnStart, type: 'text', sessionId, content: `User: ${userText}`, embedding: queryEmbedding }
+        ];
         if (visualContext) {
-            await this.addToHistory(avatar, sessionId, 'user', `[Visual Context]: ${visualContext}`);
+            userEntries.push({
+                timestamp: new Date(turnStart.getTime() + 1), type: 'text', sessionId,
+                content: `User: [Visual Context]: ${visualContext}`
+            });
         }
+        if (turnId) userEntries.forEach((entry, i) => { entry._id = turnEntryId(turnId, i); });
+        userEntries.forEach(entry => this.queueHistory(avatarId, sessionId, entry));
 
         // 2. Prepare Context
-        const personality = avatar.personality || {
-            traits: [],
-            dialect: "General American",
-            commonPhrases: [],
-            fillerWordFrequency: 0,
-            speechRate: "Moderate"
-        };
-
-        // A. Immediate History (Current Session)
-        // Filter memory for this session (Simulating short-term context window)
-        const recentHistory = avatar.memory
-            .filter(m => m.sessionId === sessionId && m.type === 'text')
-            .sort((a, b) => {
-                const tA = new Date(a.timestamp || 0).getTime();
-                const tB = new Date(b.timestamp || 0).getTime();
-                return tA - tB;
-            })
-            .slice(-10); // Last 10 turns
-
-        // B. RAG (Relevant Past)
-        // Simple keyword match for MVP (Simulating Vector Search)
-        // detailed RAG would compare embeddings.
-        const keywords = userText.split(' ').filter(w => w.length > 4);
-        const relevantMemories = avatar.memory
-            .filter(m => m.sessionId !== sessionId && keywords.some(k => m.content?.includes(k)))
-            .slice(0, 3);
-
         // C. CURRENT STATE (Timeline)
-        // What was the avatar "doing" most recently?
-        const latestActivity = avatar.memory
-            .filter((m: any) => (m.type === 'vision' || m.type === 'audio') && m.timestamp)
-            .sort((a: any, b: any) => new Date(b.timestamp).getTime() - new Date(a.timestamp).getTime())[0];
+        // What was the avatar "doing" most recently? (pointer maintained on append)
+        const latestActivity = context.latestActivity;
 
         const recentContext = latestActivity
             ? `Right now (or recently), you were: ${latestActivity.content} (Time: ${latestActivity.timestamp})`
             : "You are currently hanging out.";
 
-        // 3. Construct System Prompt
-        const systemPrompt = `
-You are NOT an AI. You are a human being living your life.
-Never mention you are an AI, a language model, or an avatar.
-If asked what you are doing, refer to your Recent Activity Context.
-
-Traits: ${personality.traits?.join(', ')}
-Dialect: ${personality.dialect}
-Common Phrases: ${personality.commonPhrases?.join(', ')}
-Filler Words Frequency (0-1): ${personality.fillerWordFrequency}
-Speech Rate: ${personality.speechRate}
-
+        // 3. Construct Prompt
+        // Stable prefix first (persona + rules) so the provider can reuse its cached prefix
+        // across turns. The history after it is a sliding window of the last HISTORY_TURNS
+        // entries: it only extends the cached prefix until the window fills, after which it
+        // shifts every turn and only the persona + rules part is served from the cache.
+        // Everything that changes per turn goes last, just before the user's message.
+        const systemPrompt = `${context.personaPrompt}\n\n${RESPONSE_RULES}`;
+        const turnContext = `
 [Recent Activity Context]
 ${recentContext}
 
 [Relevant Past Memories]
 ${relevantMemories.map(m => `- ${m.content}`).join('\n')}
-
-Your goal is to reply to the user naturally, embodying this persona.
-Do NOT be robotic. Use the filler words and dialect specified.
         `.trim();
 
         // 4. Call LLM
@@ -96,26 +132,70 @@ Do NOT be robotic. Use the filler words and dialect specified.
                 role: m.content?.startsWith('[Visual') ? 'system' : (m.content?.startsWith('User:') ? 'user' : 'assistant'),
                 content: m.content
             })),
+            { role: 'system', content: turnContext },
             { role: 'user', content: userText }
         ];
 
         let responseText = "I'm listening."; // Default fallback
+        let stats: TurnStats | null = null;
 
         if (process.env.OPENAI_API_KEY === 'mock-key' || !process.env.OPENAI_API_KEY) {
             responseText = `[Mock Response for ${avatarId}] That sounds interesting! tell me more.`;
         } else {
-            const completion = await openai.chat.completions.create({
-                model: "gpt-5.1",
-                messages: messages,
-                max_completion_tokens: 150
-            });
-            responseText = completion.choices[0].message?.content || responseText;
+            const result = await this.complete(messages);
+            responseText = result.text || responseText;
+            stats = result.stats;
+            console.log(`[ResponseService] Turn ${sessionId}: ttft ${stats.ttftMs ?? '-'}ms, total ${stats.totalMs}ms, ` +
+                `cached ${stats.cachedTokens}/${stats.promptTokens} prompt tokens (${(stats.cachedRatio * 100).toFixed(0)}%)`);
         }
 
-        // 5. Save Avatar Response to Memory
-        await this.addToHistory(avatar, sessionId, 'avatar', responseText);
+        // 5. Save Avatar Response to Memory - one append for the whole turn, off the response path
+        await this.addToHistory(avatarId, sessionId, 'avatar', responseText, turnId ? turnEntryId(turnId, 2) : undefined);
+        historyBuffer.flush(sessionId).catch(console.error);
+
+        return { response: responseText, stats };
+    }
+
+    /**
+     * Streams the completion so time-to-first-token can be measured; the final
+     * chunk carries usage, including how much of the prompt hit the provider's cache.
+     */
+    private async complete(messages: any[]): Promise<{ text: string, stats: TurnStats }> {
+        const start = Date.now();
+        const stream = await openai.chat.completions.create({
+            model: "gpt-5.1",
+            messages: messages,
+            max_completion_tokens: 150,
+            stream: true,
+            stream_options: { include_usage: true }
+        });
+
+        let text = "";
+        let ttftMs: number | null = null;
+        let promptTokens = 0;
+        let cachedTokens = 0;
+        for await (const chunk of stream) {
+            const content = chunk.choices[0]?.delta?.content;
+            if (content) {
+                if (ttftMs === null) ttftMs = Date.now() - start;
+                text += content;
+            }
+            if (chunk.usage) {
+                promptTokens = chunk.usage.prompt_tokens;
+                cachedTokens = chunk.usage.prompt_tokens_details?.cached_tokens || 0;
+            }
+        }
 
-        return responseText;
+        return {
+            text,
+            stats: {
+                promptTokens,
+                cachedTokens,
+                cachedRatio: promptTokens ? cachedTokens / promptTokens : 0,
+                ttftMs,
+                totalMs: Date.now() - start
+            }
+        };
     }
 
     /**
@@ -142,30 +222,29 @@ Do NOT be robotic. Use the filler words and dialect specified.
                     fillerWordFrequency: 0.1,
                     speechRate: "Fast"
                 },
-                memory: [] as any[],
-                save: async () => { console.log("[MockDB] Avatar saved."); }
+                latestActivity: null as any
             };
         } else {
-            avatar = await Avatar.findOne({ avatarId });
+            avatar = await sessionCache.get(avatarId, sessionId);
         }
 
         if (!avatar) throw new Error("Avatar not found");
 
-        // 1. Save inputs (Asynchronous - don't block stream start)
+        // 1. Save inputs (Buffered - don't block stream start; written with the reply)
         // Save the USER'S spoken text to history
         if (userText) {
-            this.addToHistory(avatar, sessionId, 'user', userText).catch(console.error);
+            this.addToHistory(avatarId, sessionId, 'user', userText);
         }
         // Ideally we don't save the "Raw Operator Input" to the public history? 
         // Or maybe we do as a system log? For now, we only save the FINAL output (at the end).
         // The user mentioned "human_response" is what the operator "wants to say".
         if (visualContext) {
-            this.addToHistory(avatar, sessionId, 'user', `[Visual Context]: ${visualContext}`).catch(console.error);
+            this.addToHistory(avatarId, sessionId, 'user', `[Visual Context]: ${visualContext}`);
         }
 
         // 0. INTERVENTION CHECK: If 0, bypass LLM entirely.
         if (intervention === 0) {
-            async function* directStream(this: ResponseService, avatar: any, sessionId: string) {
+            async function* directStream(this: ResponseService, avatarId: string, sessionId: string) {
                 // Simulate token streaming for the raw input? Or just yield the whole thing?
                 // Streaming usually implies chunks. Let's split by words to simulate "stream" or just yield all.
                 // To be compatible with the client expecting a stream, we can yield it in one go or chunks.
@@ -173,15 +252,15 @@ Do NOT be robotic. Use the filler words and dialect specified.
                 yield operatorInput;
 
                 // Save directly
-                await avatar.memory.push({
+                this.queueHistory(avatarId, sessionId, {
                     timestamp: new Date(),
                     type: 'text',
                     sessionId: sessionId,
                     content: `Avatar (Direct Echo): ${operatorInput}`
                 });
-                await avatar.save();
+                historyBuffer.flush(sessionId).catch(console.error);
             }
-            return directStream.call(this, avatar, sessionId);
+            return directStream.call(this, avatarId, sessionId);
         }
 
         const personality = avatar.personality || {
@@ -193,9 +272,7 @@ Do NOT be robotic. Use the filler words and dialect specified.
         };
 
         // Find latest activity for context
-        const latestActivity = avatar.memory
-            .filter((m: any) => (m.type === 'vision' || m.type === 'audio') && m.timestamp)
-            .sort((a: any, b: any) => new Date(b.timestamp).getTime() - new Date(a.timestamp).getTime())[0];
+        const latestActivity = avatar.latestActivity;
 
         const recentContext = latestActivity
             ? `Your recent activity/state: ${latestActivity.content}`
@@ -237,13 +314,13 @@ TASK: Rewrite the OPERATOR GUIDANCE to match your specific Persona, Dialect, and
 
             // Save full response to history after streaming
             const fullResponse = `[Mock Guided Response] ${operatorInput} (transformed)`;
-            await avatar.memory.push({
+            this.queueHistory(avatarId, sessionId, {
                 timestamp: new Date(),
                 type: 'text',
                 sessionId: sessionId,
                 content: `Avatar (Guided): ${fullResponse}`
             });
-            await avatar.save();
+            historyBuffer.flush(sessionId).catch(console.error);
 
             return mockStream();
         }
@@ -259,7 +336,7 @@ TASK: Rewrite the OPERATOR GUIDANCE to match your specific Persona, Dialect, and
         });
 
         // 4. Generator to yield chunks
-        async function* streamGenerator(this: ResponseService, avatar: any, sessionId: string) {
+        async function* streamGenerator(this: ResponseService, avatarId: string, sessionId: string) {
             let fullResponse = "";
             for await (const chunk of stream) {
                 const content = chunk.choices[0]?.delta?.content || "";
@@ -271,25 +348,36 @@ TASK: Rewrite the OPERATOR GUIDANCE to match your specific Persona, Dialect, and
             // Save full response to history after streaming
             // We need a new instance/reference to 'this' or bind it, or just use the passed var
             // reusing the method from the class instance would be cleaner if context is preserved
-            await avatar.memory.push({
+            this.queueHistory(avatarId, sessionId, {
                 timestamp: new Date(),
                 type: 'text',
                 sessionId: sessionId,
                 content: `Avatar (Guided): ${fullResponse}`
             });
-            await avatar.save();
+            historyBuffer.flush(sessionId).catch(console.error);
         }
 
-        return streamGenerator.call(this, avatar, sessionId);
+        return streamGenerator.call(this, avatarId, sessionId);
     }
 
-    async addToHistory(avatar: any, sessionId: string, role: string, content: string) {
-        avatar.memory.push({
+    /**
+     * Queues a history entry in the session's write-behind buffer.
+     */
+    async addToHistory(avatarId: string, sessionId: string, role: string, content: string, _id?: mongoose.Types.ObjectId) {
+        this.queueHistory(avatarId, sessionId, {
+            _id,
             timestamp: new Date(),
             type: 'text',
             sessionId: sessionId,
             content: `${role === 'user' ? 'User' : 'Avatar'}: ${content}`
         });
-        await avatar.save();
+    }
+
+    /**
+     * Buffers an entry for persistence and keeps the session's cached history ring current.
+     */
+    private queueHistory(avatarId: string, sessionId: string, entry: MemoryEntry) {
+        historyBuffer.add(avatarId, sessionId, entry);
+        sessionCache.recordHistory(sessionId, { timestamp: entry.timestamp, content: entry.content });
     }
 }
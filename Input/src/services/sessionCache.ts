@@ -0,0 +1,150 @@
+import { Avatar } from '../models/Avatar';
+import { memoryStore } from './memoryStore';
+import { historyBuffer } from './historyBuffer';
+
+const MAX_SESSIONS = parseInt(process.env.SESSION_CACHE_SIZE || '1000', 10);
+// Backstop for profile changes made by processes that can't notify us (standalone workers)
+const PROFILE_TTL_MS = parseInt(process.env.SESSION_PROFILE_TTL_MS || '60000', 10);
+const HISTORY_TURNS = 10;
+
+const DEFAULT_PERSONALITY = {
+    traits: [] as string[],
+    dialect: "General American",
+    commonPhrases: [] as string[],
+    fillerWordFrequency: 0,
+    speechRate: "Moderate"
+};
+
+export interface HistoryLine {
+    timestamp: Date;
+    content: string;
+}
+
+export interface SessionContext {
+    avatarId: string;
+    sessionId: string;
+    personality: any;
+    personaPrompt: string; // Per-avatar part of the system prompt, built once
+    latestActivity: { timestamp?: Date | null, type?: string | null, content?: string | null } | null;
+    history: HistoryLine[]; // Ring buffer of the last HISTORY_TURNS text entries
+    loadedAt: number;
+    stale: boolean;
+}
+
+export function buildPersonaPrompt(personality: any): string {
+    return `
+You are NOT an AI. You are a human being living your life.
+Never mention you are an AI, a language model, or an avatar.
+If asked what you are doing, refer to your Recent Activity Context.
+
+Traits: ${personality.traits?.join(', ')}
+Dialect: ${personality.dialect}
+Common Phrases: ${personality.commonPhrases?.join(', ')}
+Filler Words Frequency (0-1): ${personality.fillerWordFrequency}
+Speech Rate: ${personality.speechRate}
+`.trim();
+}
+
+/**
+ * In-process LRU of per-session conversation context, so a chat turn doesn't
+ * need to read the avatar or its history from the database.
+ * Created at /session/start, updated in place every turn, marked stale when
+ * ingestion updates the avatar's profile, dropped at /session/end.
+ */
+export class SessionCache {
+    private sessions = new Map<string, SessionContext>();
+
+    /**
+     * Seeds a fresh session from an already-loaded avatar document (no history yet).
+     */
+    start(sessionId: string, avatar: any): SessionContext {
+        return this.put(this.fromAvatar(sessionId, avatar, []));
+    }
+
+    /**
+     * Hot path: the cached context, reloaded from the database only on a miss
+     * (e.g. after a restart or eviction) or when the profile went stale.
+     */
+    async get(avatarId: string, sessionId: string): Promise<SessionContext | null> {
+        const context = this.sessions.get(sessionId);
+        if (context && context.avatarId === avatarId && !context.stale && Date.now() - context.loadedAt < PROFILE_TTL_MS) {
+            // Re-insert to mark as most recently used
+            this.sessions.delete(sessionId);
+            this.sessions.set(sessionId, context);
+            return context;
+        }
+        return this.load(avatarId, sessionId, context);
+    }
+
+    /**
+     * Appends a text entry to the session's history ring (no-op if not cached).
+     */
+    recordHistory(sessionId: string, line: HistoryLine) {
+        const context = this.sessions.get(sessionId);
+        if (!context) return;
+        context.history.push(line);
+        if (context.history.length > HISTORY_TURNS) context.history.shift();
+    }
+
+    /**
+     * The avatar's profile or memories changed; cached sessions reload the
+     * profile on their next turn but keep their history.
+     */
+    invalidateAvatar(avatarId: string) {
+        for (const context of this.sessions.values()) {
+            if (context.avatarId === avatarId) context.stale = true;
+        }
+    }
+
+    end(sessionId: string) {
+        this.sessions.delete(sessionId);
+    }
+
+    endAvatar(avatarId: string) {
+        for (const [sessionId, context] of this.sessions) {
+            if (context.avatarId === avatarId) this.sessions.delete(sessionId);
+        }
+    }
+
+    private async load(avatarId: string, sessionId: string, previous?: SessionContext): Promise<SessionContext | null> {
+        const avatar = await Avatar.findOne({ avatarId }).select('-memory').lean();
+        if (!avatar) return null;
+
+        let history = previous?.avatarId === avatarId ? previous.history : null;
+        if (!history) {
+            await historyBuffer.settled(sessionId);
+            const stored = await memoryStore.sessionHistory(avatarId, sessionId, HISTORY_TURNS);
+            history = [...stored, ...historyBuffer.pending(sessionId)]
+                .map(m => ({ timestamp: m.timestamp as Date, content: m.content as string }))
+                .slice(-HISTORY_TURNS);
+        }
+        return this.put(this.fromAvatar(sessionId, avatar, history));
+    }
+
+    private fromAvatar(sessionId: string, avatar: any, history: HistoryLine[]): SessionContext {
+        const personality = avatar.personality || DEFAULT_PERSONALITY;
+        return {
+            avatarId: avatar.avatarId,
+            sessionId,
+            personality,
+            personaPrompt: buildPersonaPrompt(personality),
+            latestActivity: avatar.latestActivity || null,
+            history,
+            loadedAt: Date.now(),
+            stale: false
+        };
+    }
+
+    private put(context: SessionContext): SessionContext {
+        this.sessions.delete(context.sessionId);
+        while (this.sessions.size >= MAX_SESSIONS) {
+            const oldest = this.sessions.keys().next().value;
+            if (oldest === undefined) break;
+            this.sessions.delete(oldest);
+        }
+        this.sessions.set(context.sessionId, context);
+        return context;
+    }
+}
+
+export const sessionCache = new SessionCache();
@@ -0,0 +1,213 @@
+import mongoose from 'mongoose';
+import { Memory } from '../models/Memory';
+
+// Below this size an exact scan is already sub-millisecond, so LSH isn't worth it
+const EXACT_SCAN_LIMIT = 2000;
+const LSH_TABLES = 16;
+const LSH_BITS = 6;
+// Trust LSH only when it yields a reasonable pool to re-rank
+const MIN_CANDIDATES_PER_RESULT = 20;
+// Pull in entries written by other processes (ingestion workers) at most this often
+const REFRESH_MS = 5000;
+// ObjectIds from different processes are only ordered to the second; re-read a margin
+const REFRESH_OVERLAP_SECONDS = 60;
+const MAX_CACHED_AVATARS = parseInt(process.env.VECTOR_INDEX_AVATARS || '200', 10);
+// Refreshes only see new memories; a periodic rebuild drops ones compacted away elsewhere
+const REBUILD_MS = parseInt(process.env.VECTOR_INDEX_REBUILD_MS || '600000', 10);
+
+// Enough of the memory to use it in a prompt without going back to the database
+export interface IndexedMemory {
+    sessionId?: string;
+    type?: string;
+    timestamp?: Date;
+    content?: string;
+}
+
+export interface VectorHit {
+    id: string;
+    score: number;
+    memory: IndexedMemory;
+}
+
+interface IndexedVector {
+    id: string;
+    memory: IndexedMemory;
+    vector: Float32Array;
+}
+
+function dot(a: Float32Array, b: Float32Array): number {
+    let sum = 0;
+    for (let i = 0; i < a.length; i++) sum += a[i] * b[i];
+    return sum;
+}
+
+// Deterministic PRNG so every process builds identical hyperplanes
+function mulberry32(seed: number) {
+    return () => {
+        seed |= 0; seed = seed + 0x6D2B79F5 | 0;
+        let t = Math.imul(seed ^ seed >>> 15, 1 | seed);
+        t = t + Math.imul(t ^ t >>> 7, 61 | t) ^ t;
+        return ((t ^ t >>> 14) >>> 0) / 4294967296;
+    };
+}
+
+/**
+ * Approximate nearest-neighbour index over one avatar's memory vectors
+ * (unit length, so dot product = cosine similarity). Random-hyperplane LSH
+ * narrows the candidates; candidates are then re-ranked exactly.
+ */
+export class AvatarVectorIndex {
+    private entries: IndexedVector[] = [];
+    private ids = new Set<string>();
+    private planes: Float32Array[][];
+    private tables: Map<number, number[]>[];
+    lastSeenSeconds = 0; // Creation time of the newest ObjectId read from the database
+    lastRefresh = 0;
+    readonly builtAt = Date.now();
+
+    constructor(readonly dimensions: number) {
+        const random = mulberry32(dimensions);
+        this.planes = Array.from({ length: LSH_TABLES }, () =>
+            Array.from({ length: LSH_BITS }, () =>
+                Float32Array.from({ length: dimensions }, () => random() * 2 - 1)));
+        this.tables = Array.from({ length: LSH_TABLES }, () => new Map());
+    }
+
+    get size(): number {
+        return this.entries.length;
+    }
+
+    add(id: string, vector: number[], memory: IndexedMemory) {
+        if (vector.length !== this.dimensions || this.ids.has(id)) return;
+        this.ids.add(id);
+        const entry = { id, memory, vector: Float32Array.from(vector) };
+        const position = this.entries.push(entry) - 1;
+        this.tables.forEach((table, t) => {
+            const key = this.bucket(entry.vector, t);
+            const bucket = table.get(key);
+            if (bucket) bucket.push(position);
+            else table.set(key, [position]);
+        });
+    }
+
+    query(vector: number[], k: number, excludeSessionId?: string): VectorHit[] {
+        const query = Float32Array.from(vector);
+        let candidates: Iterable<number>;
+
+        if (this.entries.length <= EXACT_SCAN_LIMIT) {
+            candidates = this.entries.keys();
+        } else {
+            const found = new Set<number>();
+            this.tables.forEach((table, t) => {
+                for (const position of table.get(this.bucket(query, t)) || []) found.add(position);
+            });
+            // Sparse buckets (unusual query): fall back to an exact scan rather than return too little
+            candidates = found.size >= k * MIN_CANDIDATES_PER_RESULT ? found : this.entries.keys();
+        }
+
+        // Keep a small sorted top-k instead of sorting every candidate
+        const hits: VectorHit[] = [];
+        for (const position of candidates) {
+            const entry = this.entries[position];
+            if (excludeSessionId && entry.memory.sessionId === excludeSessionId) continue;
+            const score = dot(query, entry.vector);
+            // Unrelated (orthogonal or opposite) memories are never "relevant"
+            if (score <= 0 || (hits.length === k && score <= hits[k - 1].score)) continue;
+            let i = hits.length < k ? hits.length : k - 1;
+            while (i > 0 && hits[i - 1].score < score) {
+                if (i < k) hits[i] = hits[i - 1];
+                i--;
+            }
+            hits[i] = { id: entry.id, score, memory: entry.memory };
+        }
+        return hits;
+    }
+
+    private bucket(vector: Float32Array, table: number): number {
+        let key = 0;
+        this.planes[table].forEach((plane, bit) => {
+            if (dot(vector, plane) >= 0) key |= 1 << bit;
+        });
+        return key;
+    }
+}
+
+function toIndexed(doc: any): IndexedMemory {
+    return {
+        sessionId: doc.sessionId || undefined,
+        type: doc.type || undefined,
+        timestamp: doc.timestamp || undefined,
+        content: doc.content || undefined
+    };
+}
+
+/**
+ * LRU of per-avatar indexes. Indexes are built lazily from the Memory collection
+ * and then kept current by appends in this process plus a throttled incremental
+ * refresh for entries written elsewhere.
+ */
+export class VectorIndexCache {
+    private indexes = new Map<string, AvatarVectorIndex>();
+
+    constructor(private model: string, private dimensions: number) { }
+
+    async get(avatarId: string): Promise<AvatarVectorIndex> {
+        let index = this.indexes.get(avatarId);
+        if (index && Date.now() - index.builtAt > REBUILD_MS) {
+            this.indexes.delete(avatarId);
+            index = undefined;
+        }
+        if (index) {
+            // Re-insert to mark as most recently used
+            this.indexes.delete(avatarId);
+        } else {
+            index = new AvatarVectorIndex(this.dimensions);
+            this.evict();
+        }
+        this.indexes.set(avatarId, index);
+
+        if (Date.now() - index.lastRefresh > REFRESH_MS) {
+            await this.refresh(avatarId, index);
+        }
+        return index;
+    }
+
+    /**
+     * Adds freshly written entries to an already-loaded index (no-op otherwise;
+     * the next load will read them from the database).
+     */
+    addIfLoaded(avatarId: string, docs: any[]) {
+        const index = this.indexes.get(avatarId);
+        if (!index) return;
+        for (const doc of docs) {
+            if (doc.embedding?.length) index.add(String(doc._id), doc.embedding, toIndexed(doc));
+        }
+    }
+
+    invalidate(avatarId: string) {
+        this.indexes.delete(avatarId);
+    }
+
+    private async refresh(avatarId: string, index: AvatarVectorIndex) {
+        index.lastRefresh = Date.now();
+        const query: any = { avatarId, embeddingModel: this.model };
+        if (index.lastSeenSeconds) {
+            query._id = { $gt: mongoose.Types.ObjectId.createFromTime(index.lastSeenSeconds - REFRESH_OVERLAP_SECONDS) };
+        }
+
+        const docs = await Memory.find(query).select('_id sessionId type timestamp content embedding').lean();
+        for (const doc of docs) {
+            // add() skips ids already indexed (the overlap window, local appends)
+            index.add(String(doc._id), doc.embedding as number[], toIndexed(doc));
+            index.lastSeenSeconds = Math.max(index.lastSeenSeconds, Math.floor(doc._id.getTimestamp().getTime() / 1000));
+        }
+    }
+
+    private evict() {
+        while (this.indexes.size >= MAX_CACHED_AVATARS) {
+            const oldest = this.indexes.keys().next().value;
+            if (oldest === undefined) break;
+            this.indexes.delete(oldest);
+        }
+    }
+}
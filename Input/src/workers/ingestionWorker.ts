@@ -0,0 +1,110 @@
+import mongoose from 'mongoose';
+import dotenv from 'dotenv';
+dotenv.config();
+
+import os from 'os';
+import fs from 'fs';
+import { processVideoUpload } from '../services/ingestionService';
+import { claimNextJob, heartbeat, completeJob, failJob, recoverStaleJobs, HEARTBEAT_MS } from '../services/jobQueue';
+import { compactDueAvatars, COMPACTION_INTERVAL_MS } from '../services/memoryCompaction';
+
+const MONGO_URI = process.env.MONGO_URI || 'mongodb://localhost:27017/avatar-platform';
+// Jobs run concurrently inside one worker process (vision pages, Whisper calls are I/O bound)
+const JOB_CONCURRENCY = parseInt(process.env.INGEST_JOB_CONCURRENCY || '2', 10);
+const IDLE_POLL_MS = 1000;
+const RECOVERY_INTERVAL_MS = 30000;
+// How often to look for avatars due for memory compaction (MEMORY_COMPACTION_INTERVAL_MS=0 disables it)
+const COMPACTION_CHECK_MS = 60000;
+
+const workerId = `${os.hostname()}:${process.pid}`;
+let running = true;
+let inFlight = 0;
+let compaction: Promise<unknown> | null = null;
+
+function removeUploads(job: any) {
+    for (const tempPath of [job.videoPath, job.audioPath]) {
+        if (tempPath) fs.unlink(tempPath, () => { });
+    }
+}
+
+async function runJob(job: any) {
+    const claim = { jobId: job.jobId, workerId, attempts: job.attempts };
+    const timer = setInterval(() => {
+        heartbeat(claim)
+            .then(ok => { if (!ok) console.warn(`[Worker ${workerId}] Lost job ${job.jobId} (requeued after missed heartbeats)`); })
+            .catch(e => console.warn(`[Worker] Heartbeat failed: ${e.message}`));
+    }, HEARTBEAT_MS);
+
+    console.log(`[Worker ${workerId}] Processing job ${job.jobId} (attempt ${job.attempts}, priority ${job.priority})`);
+    try {
+        const { degraded } = await processVideoUpload(job.avatarId, job.videoPath, job.audioPath,
+            job.contentHash, job.hashVerified, job.jobId);
+        // Applying results is idempotent per job, so a lost claim only means another worker finishes it.
+        // Uploads go only once the job is recorded complete: until then a re-run needs them.
+        if (await completeJob(claim, degraded)) {
+            removeUploads(job);
+        } else {
+            console.warn(`[Worker ${workerId}] Job ${job.jobId} was reclaimed; leaving completion to its new worker`);
+        }
+    } catch (e) {
+        console.error("Ingestion failed:", e);
+        // Failed uploads aren't retried from disk; the client re-uploads
+        if (await failJob(claim, (e as Error).message)) removeUploads(job);
+    } finally {
+        clearInterval(timer);
+    }
+}
+
+async function loop() {
+    let lastRecovery = 0;
+    let lastCompactionCheck = 0;
+    while (running) {
+        if (Date.now() - lastRecovery > RECOVERY_INTERVAL_MS) {
+            lastRecovery = Date.now();
+            const recovered = await recoverStaleJobs().catch(() => 0);
+            if (recovered) console.log(`[Worker ${workerId}] Recovered ${recovered} stale job(s)`);
+        }
+
+        // Background memory compaction runs alongside jobs, one pass at a time
+        if (COMPACTION_INTERVAL_MS > 0 && !compaction && Date.now() - lastCompactionCheck > COMPACTION_CHECK_MS) {
+            lastCompactionCheck = Date.now();
+            compaction = compactDueAvatars(() => running)
+                .catch(e => console.error(`[Worker ${workerId}] Compaction failed:`, e))
+                .finally(() => { compaction = null; });
+        }
+
+        const job = inFlight < JOB_CONCURRENCY ? await claimNextJob(workerId) : null;
+        if (!job) {
+            await new Promise(resolve => setTimeout(resolve, IDLE_POLL_MS));
+            continue;
+        }
+
+        inFlight++;
+        runJob(job).finally(() => { inFlight--; });
+    }
+
+    // Let in-flight jobs finish so they don't have to be recovered
+    while (inFlight > 0) {
+        await new Promise(resolve => setTimeout(resolve, IDLE_POLL_MS));
+    }
+    await compaction;
+    await mongoose.disconnect();
+    process.exit(0);
+}
+
+for (const signal of ['SIGINT', 'SIGTERM']) {
+    process.on(signal, () => {
+        console.log(`[Worker ${workerId}] ${signal} received, draining ${inFlight} job(s)...`);
+        running = false;
+    });
+}
+
+mongoose.connect(MONGO_URI)
+    .then(() => {
+        console.log(`[Worker ${workerId}] Connected to MongoDB, concurrency ${JOB_CONCURRENCY}`);
+        return loop();
+    })
+    .catch(err => {
+        console.error(`[Worker ${workerId}] Fatal error:`, err);
+        process.exit(1);
+    });
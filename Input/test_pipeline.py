@@ -4,6 +4,8 @@ import time
 import os
 import json
 import subprocess
+import hashlib
+from prereduce import reduce_video, cleanup as cleanup_reduced
 
 # Configuration
 BASE_URL = "https://avatarinput.onrender.com/api"
@@ -31,6 +33,21 @@ def get_video_duration(file_path):
         print(f"    Using default timeout of 300s")
         return None
 
+def file_hash(file_path):
+    """SHA-256 of the original recording, used by the server to skip duplicate ingestion."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def lookup_video(avatar_id, content_hash):
+    """Asks the server whether this content was already ingested for the avatar."""
+    response = requests.get(f"{BASE_URL}/ingest/lookup/{avatar_id}", params={"hash": content_hash}, timeout=(10, 30))
+    if response.status_code == 200:
+        return response.json()
+    return {"known": False}
+
 def register_user():
     """Creates a new user and returns the avatar_id."""
     url = f"{BASE_URL}/auth/register"
@@ -50,8 +67,8 @@ def register_user():
         print(f"    ERROR: {response.text}")
         return None
 
-def upload_video(avatar_id, file_path):
-    """Uploads the MP4 file for ingestion."""
+def upload_video(avatar_id, file_path, audio_path=None, content_hash=None):
+    """Uploads the MP4 file (and optionally a separately extracted MP3) for ingestion."""
     url = f"{BASE_URL}/ingest/{avatar_id}"
     
     if not os.path.exists(file_path):
@@ -61,11 +78,22 @@ def upload_video(avatar_id, file_path):
     print(f"[*] Uploading video: {file_path}...")
     with open(file_path, 'rb') as f:
         files = {'video': (os.path.basename(file_path), f, 'video/mp4')}
-        response = requests.post(url, files=files)
+        if audio_path:
+            files['audio'] = (os.path.basename(audio_path), open(audio_path, 'rb'), 'audio/mpeg')
+        data = {'contentHash': content_hash} if content_hash else None
+        try:
+            response = requests.post(url, files=files, data=data)
+        finally:
+            if audio_path:
+                files['audio'][1].close()
     
     if response.status_code == 200:
-        job_id = response.json().get('jobId')
-        print(f"    SUCCESS: Ingestion started. Job ID: {job_id}")
+        body = response.json()
+        job_id = body.get('jobId')
+        if body.get('duplicate'):
+            print(f"    SUCCESS: Already ingested. Job ID: {job_id}")
+        else:
+            print(f"    SUCCESS: Ingestion started. Job ID: {job_id}")
         return job_id
     else:
         print(f"    ERROR: Upload failed: {response.text}")
@@ -149,6 +177,8 @@ def test_conversation(avatar_id):
 def main():
     parser = argparse.ArgumentParser(description="Test Avatar Pipeline")
     parser.add_argument("video_path", help="Path to the .mp4 file")
+    parser.add_argument("--reduce", action="store_true", help="Downscale and drop frame rate with ffmpeg before uploading")
+    parser.add_argument("--split-streams", action="store_true", help="With --reduce, upload video-only and audio-only streams separately")
     args = parser.parse_args()
 
     # 0. Get video duration for timeout calculation
@@ -165,8 +195,20 @@ def main():
     if not avatar_id:
         return
 
-    # 2. Upload Video
-    job_id = upload_video(avatar_id, args.video_path)
+    # 2. Upload Video (optionally reduced to what the pipeline consumes)
+    content_hash = file_hash(args.video_path)
+    upload_path, audio_path, reduced = args.video_path, None, None
+    if args.reduce:
+        original_bytes = os.path.getsize(args.video_path)
+        reduced = reduce_video(args.video_path, split_streams=args.split_streams)
+        upload_path, audio_path = reduced["video"], reduced["audio"]
+        print(f"[*] Reduced upload: {original_bytes / 1e6:.1f} MB -> {reduced['bytes'] / 1e6:.1f} MB")
+
+    try:
+        job_id = upload_video(avatar_id, upload_path, audio_path, content_hash)
+    finally:
+        if reduced:
+            cleanup_reduced(reduced)
     if not job_id:
         return
 
@@ -5,7 +5,10 @@ Single agent supporting seamless live switching between:
 - AI Mode: GPT-4o STT+LLM -> Deepgram TTS -> BitHuman avatar
 - Human Mode: Deepgram STT -> Deepgram TTS -> BitHuman (LLM bypassed)
 
+The avatar provider is chosen per session (see avatar_backends.py).
+
 Run with: python agent.py dev
+Import-time profile: python test_import_budget.py --report 25
 """
 
 import os
@@ -19,6 +22,7 @@ from dotenv import load_dotenv
 from livekit.agents import (
     AutoSubscribe,
     JobContext,
+    JobProcess,
     WorkerOptions,
     cli,
     Agent,
@@ -26,10 +30,19 @@ from livekit.agents import (
 )
 from livekit.agents.stt import SpeechEventType
 from livekit import rtc
-from livekit.plugins import openai, deepgram, bithuman
 
 load_dotenv()
-import config
+from session_stats import SessionStats, compute_load, LOAD_THRESHOLD
+from worker_metrics import metrics
+from backchannel import Backchannel
+import backchannel
+from brain_client import BrainClient
+from session_recorder import SessionRecorder
+import vision_sampler
+import avatar_backends
+import shared_models
+import tts_pipeline
+import plugins
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("unified-agent")
@@ -37,16 +50,30 @@ logger = logging.getLogger("unified-agent")
 # =============================================================================
 # Configuration
 # =============================================================================
-BITHUMAN_API_SECRET = os.getenv("BITHUMAN_API_SECRET", config.BITHUMAN_API_SECRET)
-BITHUMAN_AVATAR_ID = os.getenv("BITHUMAN_AVATAR_ID", config.BITHUMAN_AVATAR_ID)
-DEEPGRAM_API_KEY = os.getenv("DEEPGRAM_API_KEY", config.DEEPGRAM_API_KEY)
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", config.OPENAI_API_KEY)
-LIVEKIT_URL = os.getenv("LIVEKIT_URL", config.LIVEKIT_URL)
-LIVEKIT_API_KEY = os.getenv("LIVEKIT_API_KEY", config.LIVEKIT_API_KEY)
-LIVEKIT_API_SECRET = os.getenv("LIVEKIT_API_SECRET", config.LIVEKIT_API_SECRET)
+def _setting(name: str) -> str:
+    """Environment first; config.py (untracked, optional) is only imported when a value is missing there"""
+    value = os.getenv(name)
+    if value is not None:
+        return value
+    try:
+        import config
+    except ImportError:
+        return ""
+    return getattr(config, name, "")
+
+
+BITHUMAN_API_SECRET = _setting("BITHUMAN_API_SECRET")
+BITHUMAN_AVATAR_ID = _setting("BITHUMAN_AVATAR_ID")
+DEEPGRAM_API_KEY = _setting("DEEPGRAM_API_KEY")
+OPENAI_API_KEY = _setting("OPENAI_API_KEY")
+LIVEKIT_URL = _setting("LIVEKIT_URL")
+LIVEKIT_API_KEY = _setting("LIVEKIT_API_KEY")
+LIVEKIT_API_SECRET = _setting("LIVEKIT_API_SECRET")
 API_AVATAR_ID = "d34498af-061e-4c40-b02a-620530081ba9"
+TTS_VOICE = "aura-angus-en"
 
 os.environ["BITHUMAN_API_SECRET"] = BITHUMAN_API_SECRET
+os.environ["BITHUMAN_AVATAR_ID"] = BITHUMAN_AVATAR_ID
 os.environ["DEEPGRAM_API_KEY"] = DEEPGRAM_API_KEY
 os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
 os.environ["LIVEKIT_URL"] = LIVEKIT_URL
@@ -69,44 +96,69 @@ class UnifiedAvatarAgent:
         self._ctx = ctx
         self._mode = AgentMode.AI
         self._session: AgentSession = None
-        self._avatar = None
+        self._avatar: avatar_backends.AvatarBackend = None
         self._participant = None
         self._running = True
         self._api_session_id = None
         self._latest_vision_context = ""
         self._stt_task = None
+        self._vision_task = None  # Agent-side camera sampling (AGENT_VISION=1)
+        self._stats: SessionStats = None
+        self._counted = False           # Whether metrics counts this session (undone in cleanup)
+        self._closed = asyncio.Event()  # Set by room/participant disconnect events
+        self._text_inputs = set()       # Text-input replies waiting on the brain
+        self._backchannel: Backchannel = None
+        self._tts_pipeline: tts_pipeline.SentencePipeline = None
+        self._recorder: SessionRecorder = None  # Writes a replayable log when AGENT_RECORD_DIR is set
+        self._brain = BrainClient(self.API_BASE_URL)  # Deadline, hedging and local fallback
 
     async def start(self):
         """Initialize and start the unified agent"""
         start_time = time.time()
 
-        # Connect to room
+        # Connect to room (the vision loop subscribes to the user's camera itself, never to other video)
         await self._ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
         self._setup_room_monitors()
+        # Everything from here on is undone by _cleanup, which also releases the job
+        try:
+            metrics.start()
+            metrics.session_started(self._mode.value)
+            self._counted = True
+            metrics.register_queue(f"{self._ctx.room.name}:text_inputs", lambda: len(self._text_inputs))
+            self._stats = SessionStats(self._ctx.room.name, metrics_port=metrics.port)
+            self._recorder = SessionRecorder(self._ctx.room.name)
+            await self._run(start_time)
+        finally:
+            await self._cleanup()
 
+    async def _run(self, start_time: float):
+        """Session body; returns once the session has ended"""
         self._participant = await self._ctx.wait_for_participant()
         logger.info(f"⏱️ INIT: Agent startup took {(time.time() - start_time)*1000:.1f}ms")
 
         # Start API Session
         await self._start_api_session()
 
-        # Create Agent with JUST TTS (no LLM, we drive it manually)
+        # Create Agent with JUST TTS (no LLM, we drive it manually); the prewarmed VAD lets the user interrupt
+        tts = plugins.load("deepgram").TTS(model=TTS_VOICE)
         self._session = AgentSession(
-            tts=deepgram.TTS(model="aura-angus-en"),
+            tts=tts,
+            vad=shared_models.vad(self._ctx.proc),
         )
+        # Optional "mm-hm" clips while the brain is slow (BACKCHANNEL_ENABLED=1)
+        self._backchannel = Backchannel(self._session, tts, voice=TTS_VOICE)
+        # Multi-sentence replies are synthesized sentence by sentence (TTS_PIPELINE=0 to disable)
+        self._tts_pipeline = tts_pipeline.SentencePipeline(tts)
 
-        # Create BitHuman avatar
-        self._avatar = bithuman.AvatarSession(
-            avatar_id=BITHUMAN_AVATAR_ID,
-        )
+        # Create the avatar this session asked for (participant attribute), else the default
+        backend = avatar_backends.select(self._participant.attributes.get("avatar_backend"))
+        self._avatar = avatar_backends.create(backend)
 
         # Start avatar
-        avatar_start = time.time()
         try:
             await self._avatar.start(self._session, room=self._ctx.room)
-            logger.info(f"⏱️ INIT: Avatar start took {(time.time() - avatar_start)*1000:.1f}ms")
         except Exception as e:
-            logger.error(f"❌ BitHuman avatar failed to start: {e}")
+            logger.error(f"❌ {backend} avatar failed to start: {e}")
             return
 
         # Start the session
@@ -124,16 +176,16 @@ class UnifiedAvatarAgent:
 
         # Initial Greeting
         if self._mode == AgentMode.AI:
-            await self._session.say("Hello! I am ready to chat.", allow_interruptions=True)
+            await self._say("Hello! I am ready to chat.")
 
         # Start the Main Interaction Loop (STT -> Logic -> TTS)
         self._stt_task = asyncio.create_task(self._main_interaction_loop())
+        if vision_sampler.ENABLED:
+            self._vision_task = asyncio.create_task(self._vision_loop())
 
-        # Keep running
-        while self._running and self._ctx.room.connection_state == rtc.ConnectionState.CONN_CONNECTED:
-            await asyncio.sleep(1)
-
-        await self._cleanup()
+        # Keep running until a disconnect event ends the session
+        if self._ctx.room.connection_state == rtc.ConnectionState.CONN_CONNECTED:
+            await self._closed.wait()
 
     async def _start_api_session(self):
         """Start a session with the external API"""
@@ -154,39 +206,48 @@ class UnifiedAvatarAgent:
             logger.error(f"❌ Failed to start API session: {e}")
 
     async def _generate_response(self, text: str) -> str:
-        """Generate response from external API"""
-        import requests
+        """Generate response from external API (counted as in flight for load reporting)"""
+        with self._stats.generation(), metrics.track("brain"):
+            return await self._request_reply(text)
+
+    async def _say(self, text: str):
+        """Speak through TTS -> avatar, counted as TTS work in flight until playout ends"""
+        segments = tts_pipeline.split_segments(text) if tts_pipeline.ENABLED else []
+        started = self._recorder.elapsed()
+        with metrics.track("tts"):
+            try:
+                if len(segments) > 1:
+                    # Audio starts after the first sentence; interruption closes the stream and cancels the rest
+                    await self._session.say(text, audio=self._tts_pipeline.frames(segments), allow_interruptions=True)
+                else:
+                    await self._session.say(text, allow_interruptions=True)
+            finally:
+                self._recorder.tts(text, max(len(segments), 1), started, self._recorder.elapsed() - started)
+
+    async def _request_reply(self, text: str) -> str:
         if not self._api_session_id:
             logger.warning("⚠️ No API Session ID, skipping generation")
             return "I am having trouble connecting to my brain."
-        
-        try:
-            payload = {
-                "avatarId": API_AVATAR_ID,
-                "sessionId": self._api_session_id,
-                "text": text,
-                "visualContext": self._latest_vision_context
-            }
-            logger.info(f"📤 Sending to API: {text} (Vision: {len(self._latest_vision_context)} chars)")
-            
-            # Use asyncio.to_thread for blocking request
-            response = await asyncio.to_thread(requests.post, f"{self.API_BASE_URL}/generate", json=payload)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("success"):
-                    reply = data.get("response", "")
-                    logger.info(f"📥 API Reply: {reply}")
-                    return reply
-                else:
-                    logger.error(f"❌ API Logic failed: {data}")
-                    return "I didn't quite understand that."
-            else:
-                logger.error(f"❌ API Request failed: {response.status_code} - {response.text}")
-                return "I am experiencing a network error."
-        except Exception as e:
-            logger.error(f"❌ Generative error: {e}")
-            return "Something went wrong processing your request."
+
+        payload = {
+            "avatarId": API_AVATAR_ID,
+            "sessionId": self._api_session_id,
+            "text": text,
+            "visualContext": self._latest_vision_context
+        }
+        logger.info(f"📤 Sending to API: {text} (Vision: {len(self._latest_vision_context)} chars)")
+
+        # Never raises: past the deadline (or if every brain fails) the local responder answers
+        self._recorder.brain_request(payload)
+        requested = time.monotonic()
+        reply, data, source = await self._brain.generate(payload)
+        logger.info(f"📥 API Reply ({source}): {reply}")
+        stats = (data or {}).get("stats")
+        self._recorder.brain_response(text, reply, source, time.monotonic() - requested, stats)
+        if stats:
+            logger.info(f"⏱️ BRAIN: ttft {stats.get('ttftMs')}ms, total {stats.get('totalMs')}ms, "
+                        f"cached {stats.get('cachedTokens')}/{stats.get('promptTokens')} prompt tokens")
+        return reply
 
     async def _main_interaction_loop(self):
         """
@@ -203,7 +264,7 @@ class UnifiedAvatarAgent:
 
         # Create Deepgram STT
         try:
-            stt_instance = deepgram.STT(model="nova-2")
+            stt_instance = plugins.load("deepgram").STT(model="nova-2")
         except Exception as e:
             await self._report_error(f"Deepgram STT init failed: {e}")
             return
@@ -218,6 +279,7 @@ class UnifiedAvatarAgent:
                 async for event in audio_stream:
                     if not self._running:
                         break
+                    self._recorder.audio(event.frame)
                     stt_stream.push_frame(event.frame)
 
             async def process_transcripts():
@@ -227,34 +289,19 @@ class UnifiedAvatarAgent:
                     
                     if hasattr(event, 'alternatives') and event.alternatives:
                         text = event.alternatives[0].text
+                        self._recorder.stt(event.type, text)
                         if event.type == SpeechEventType.FINAL_TRANSCRIPT and text.strip():
-                            text = text.strip()
-                            logger.info(f"🗣️ User said: {text}")
-                            
-                            # Decide what to do based on mode
-                            if self._mode == AgentMode.AI:
-                                # AI Mode: Send to API -> Get Reply -> Speak
-                                reply = await self._generate_response(text)
-                                if reply:
-                                    try:
-                                        await self._session.say(reply, allow_interruptions=True)
-                                    except Exception as e:
-                                        logger.error(f"TTS Error: {e}")
-
-                            elif self._mode == AgentMode.HUMAN:
-                                # Human Mode: Echo directly -> Speak
-                                try:
-                                    await self._session.say(text, allow_interruptions=True)
-                                except Exception as e:
-                                    logger.error(f"TTS Error: {e}")
+                            await self._handle_transcript(text.strip())
 
             audio_task = asyncio.create_task(push_audio())
             transcript_task = asyncio.create_task(process_transcripts())
 
-            done, pending = await asyncio.wait(
-                [audio_task, transcript_task],
-                return_when=asyncio.FIRST_COMPLETED
-            )
+            # Counted as one open STT stream for as long as the session listens
+            with metrics.track("stt"):
+                done, pending = await asyncio.wait(
+                    [audio_task, transcript_task],
+                    return_when=asyncio.FIRST_COMPLETED
+                )
             for task in pending:
                 task.cancel()
 
@@ -267,25 +314,44 @@ class UnifiedAvatarAgent:
                 await stt_stream.aclose()
             logger.info("🎤 STT Loop ended")
 
+    async def _handle_transcript(self, text: str):
+        """Final transcript from STT: reply (AI mode) or repeat it (Human mode)"""
+        logger.info(f"🗣️ User said: {text}")
+
+        # Decide what to do based on mode
+        if self._mode == AgentMode.AI:
+            # AI Mode: Send to API -> Get Reply -> Speak
+            reply = await self._backchannel.cover(self._generate_response(text))
+            if reply:
+                try:
+                    await self._say(reply)
+                except Exception as e:
+                    logger.error(f"TTS Error: {e}")
+
+        elif self._mode == AgentMode.HUMAN:
+            # Human Mode: Echo directly -> Speak
+            try:
+                await self._say(text)
+            except Exception as e:
+                logger.error(f"TTS Error: {e}")
+
     def _setup_room_monitors(self):
         """Monitor room events"""
         @self._ctx.room.on("disconnected")
         def on_disconnected(reason):
-             # End logic handled by main loop check
-             pass
+            logger.info(f"🔌 Room disconnected ({reason}), ending session")
+            self._end_session()
 
         @self._ctx.room.on("participant_disconnected")
         def on_participant_left(participant):
-            if participant.identity == self._participant.identity:
+            if self._participant and participant.identity == self._participant.identity:
                 logger.info(f"👤 User {participant.identity} disconnected, ending session")
-                self._running = False
-                # Also notify custom API of session end
-                if self._api_session_id:
-                     import requests
-                     try:
-                        requests.post(f"{self.API_BASE_URL}/session/end", 
-                                      json={"avatarId": API_AVATAR_ID}, timeout=2)
-                     except: pass
+                self._end_session()
+
+    def _end_session(self):
+        """Wakes start() so cleanup runs (and the worker slot frees) right away"""
+        self._running = False
+        self._closed.set()
 
     def _setup_data_listener(self):
         """Listen for mode switch and text input via data channel"""
@@ -293,59 +359,112 @@ class UnifiedAvatarAgent:
         def on_data(data: rtc.DataPacket):
             try:
                 payload = json.loads(data.data.decode("utf-8"))
-                msg_type = payload.get("type")
-
-                if msg_type == "mode_switch":
-                    new_mode = payload.get("mode", "ai")
-                    self._mode = AgentMode.HUMAN if new_mode == "human" else AgentMode.AI
-                    asyncio.create_task(self._send_data({"type": "mode_changed", "mode": self._mode.value}))
-                    logger.info(f"🔄 Mode switched to: {self._mode.value}")
-
-                elif msg_type == "text_input":
-                    text = payload.get("text", "")
-                    if text and self._mode == AgentMode.AI:
-                        asyncio.create_task(self._handle_text_input(text))
-                
-                elif msg_type == "vision":
-                    self._latest_vision_context = payload.get("description", "")
-                    # logger.info(f"👁️ Vision context updated: {self._latest_vision_context[:50]}...")
-
+                self._recorder.data(payload)
+                self._handle_data(payload)
             except Exception as e:
                 pass
 
+    def _handle_data(self, payload: dict):
+        """Dispatch one data-channel message"""
+        msg_type = payload.get("type")
+
+        if msg_type == "mode_switch":
+            new_mode = payload.get("mode", "ai")
+            old_mode = self._mode
+            self._mode = AgentMode.HUMAN if new_mode == "human" else AgentMode.AI
+            metrics.mode_changed(old_mode.value, self._mode.value)
+            asyncio.create_task(self._send_data({"type": "mode_changed", "mode": self._mode.value}))
+            logger.info(f"🔄 Mode switched to: {self._mode.value}")
+
+        elif msg_type == "text_input":
+            text = payload.get("text", "")
+            if text and self._mode == AgentMode.AI:
+                task = asyncio.create_task(self._handle_text_input(text))
+                self._text_inputs.add(task)
+                task.add_done_callback(self._text_inputs.discard)
+
+        elif msg_type == "vision":
+            self._latest_vision_context = payload.get("description", "")
+            # logger.info(f"👁️ Vision context updated: {self._latest_vision_context[:50]}...")
+
     async def _handle_text_input(self, text: str):
         """Handle text input from frontend"""
         if self._mode == AgentMode.AI:
-            reply = await self._generate_response(text)
+            reply = await self._backchannel.cover(self._generate_response(text))
             if reply:
-                await self._session.say(reply, allow_interruptions=True)
+                await self._say(reply)
         else:
-             await self._session.say(text, allow_interruptions=True)
+             await self._say(text)
 
     async def _wait_for_audio_track(self) -> rtc.Track:
         """Wait for participant's audio track"""
+        track = await self._wait_for_track(rtc.TrackKind.KIND_AUDIO, timeout=30.0)
+        if not track:
+            logger.warning("🎤 Timeout waiting for audio track")
+        return track
+
+    async def _wait_for_track(self, kind, timeout: float = None) -> rtc.Track:
+        """Wait for a participant track of `kind` (None on timeout)"""
         # Check existing tracks
         for pub in self._participant.track_publications.values():
-            if pub.track and pub.track.kind == rtc.TrackKind.KIND_AUDIO:
+            if pub.track and pub.track.kind == kind:
                 return pub.track
 
         # Wait for track subscription
         track_ready = asyncio.Event()
-        audio_track = None
+        found_track = None
 
         @self._ctx.room.on("track_subscribed")
         def on_track(track: rtc.Track, pub: rtc.TrackPublication, participant: rtc.RemoteParticipant):
-            nonlocal audio_track
-            if track.kind == rtc.TrackKind.KIND_AUDIO and participant.identity == self._participant.identity:
-                audio_track = track
+            nonlocal found_track
+            if track.kind == kind and participant.identity == self._participant.identity:
+                found_track = track
                 track_ready.set()
 
         try:
-            await asyncio.wait_for(track_ready.wait(), timeout=30.0)
+            await asyncio.wait_for(track_ready.wait(), timeout=timeout)
         except asyncio.TimeoutError:
-            logger.warning("🎤 Timeout waiting for audio track")
+            pass
+
+        return found_track
+
+    def _subscribe_camera(self):
+        """Subscribe to the participant's camera track only (not the avatar's video or screen shares)"""
+        def is_camera(pub: rtc.TrackPublication) -> bool:
+            return pub.kind == rtc.TrackKind.KIND_VIDEO and pub.source == rtc.TrackSource.SOURCE_CAMERA
+
+        for pub in self._participant.track_publications.values():
+            if is_camera(pub):
+                pub.set_subscribed(True)
+
+        @self._ctx.room.on("track_published")
+        def on_published(pub: rtc.RemoteTrackPublication, participant: rtc.RemoteParticipant):
+            if participant.identity == self._participant.identity and is_camera(pub):
+                pub.set_subscribed(True)
+
+    async def _vision_loop(self):
+        """Sample the participant's camera and keep the vision context current"""
+        # The camera may be switched on at any point in the session, so no timeout
+        self._subscribe_camera()
+        track = await self._wait_for_track(rtc.TrackKind.KIND_VIDEO)
+        try:
+            describer = vision_sampler.make_describer()
+        except Exception as e:
+            logger.error(f"❌ Vision describer init failed: {e}")
+            return
+        sampler = vision_sampler.VisionSampler(describer, self._on_vision_description)
+        try:
+            await sampler.run(track)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"❌ Vision loop error: {e}")
 
-        return audio_track
+    def _on_vision_description(self, description: str):
+        """Same path as a browser `vision` packet, so recordings replay it too"""
+        payload = {"type": "vision", "description": description, "source": "agent"}
+        self._recorder.data(payload)
+        self._handle_data(payload)
 
     async def _send_data(self, payload: dict):
         """Send data to frontend via data channel"""
@@ -368,24 +487,60 @@ class UnifiedAvatarAgent:
         
         if self._stt_task:
             self._stt_task.cancel()
+        if self._vision_task:
+            self._vision_task.cancel()
+        if self._avatar:
+            await self._avatar.aclose()
+        if self._stats:
+            self._stats.close()
+        if self._recorder:
+            self._recorder.close()
+        await self._brain.aclose()
+        if self._counted:
+            metrics.session_ended(self._mode.value)
+        metrics.unregister_queue(f"{self._ctx.room.name}:text_inputs")
         
         # End API Session
         if self._api_session_id:
              try:
                  import requests
-                 requests.post(f"{self.API_BASE_URL}/session/end", 
-                              json={"avatarId": API_AVATAR_ID}, timeout=2)
+                 await asyncio.to_thread(requests.post, f"{self.API_BASE_URL}/session/end",
+                                         json={"avatarId": API_AVATAR_ID, "sessionId": self._api_session_id}, timeout=2)
              except: pass
 
+        # Release the job (and this worker's slot) without waiting for the room to close
+        self._ctx.shutdown(reason="session ended")
+
 
 # =============================================================================
 # Entrypoint
 # =============================================================================
+def prewarm(proc: JobProcess):
+    """Runs in each job process before it's assigned a job: import the pipeline's plugins, load the VAD and cached clips now"""
+    plugins.load_pipeline()
+    shared_models.load(proc)
+    backchannel.preload(TTS_VOICE)
+
+
 async def entrypoint(ctx: JobContext):
     """Single unified entrypoint"""
+    if os.getenv("AVATAR_BENCHMARK", "0") == "1":
+        # Measure the AVATAR_BACKEND avatar instead of holding a conversation. Imported here so
+        # conversation workers never pay for psutil and the benchmark module
+        import avatar_benchmark
+        await avatar_benchmark.AvatarBenchmark(ctx).run()
+        return
+
     agent = UnifiedAvatarAgent(ctx)
     await agent.start()
 
 
 if __name__ == "__main__":
-    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint))
+    shared_models.share_with_job_processes()
+    cli.run_app(WorkerOptions(
+        entrypoint_fnc=entrypoint,
+        prewarm_fnc=prewarm,
+        load_fnc=compute_load,
+        load_threshold=LOAD_THRESHOLD,
+        multiprocessing_context=shared_models.MP_CONTEXT,
+    ))
@@ -13,7 +13,7 @@ Run agent with: python agent.py dev
 import os
 from datetime import datetime
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from livekit.api import AccessToken, VideoGrants
@@ -28,6 +28,10 @@ LIVEKIT_URL = os.getenv("LIVEKIT_URL", config.LIVEKIT_URL)
 LIVEKIT_API_KEY = os.getenv("LIVEKIT_API_KEY", config.LIVEKIT_API_KEY)
 LIVEKIT_API_SECRET = os.getenv("LIVEKIT_API_SECRET", config.LIVEKIT_API_SECRET)
 BITHUMAN_AVATAR_ID = os.getenv("BITHUMAN_AVATAR_ID", config.BITHUMAN_AVATAR_ID)
+# Avatar backends a client may request with ?avatar=; 'local' is a benchmark stand-in, so not by default
+AVATAR_BACKENDS_ENABLED = {
+    name.strip() for name in os.getenv("AVATAR_BACKENDS_ENABLED", "bithuman,bey").split(",") if name.strip()
+}
 
 app = FastAPI(title="BitHuman Avatar Chat")
 
@@ -48,7 +52,7 @@ async def get_config():
 
 
 @app.get("/api/token")
-async def get_token(room: str = "avatar-room", identity: str = None, mode: str = "ai"):
+async def get_token(room: str = "avatar-room", identity: str = None, mode: str = "ai", avatar: str = None):
     """
     Generate LiveKit access token and dispatch agent to the room.
 
@@ -56,7 +60,12 @@ async def get_token(room: str = "avatar-room", identity: str = None, mode: str =
         room: Room name to join
         identity: User identity (auto-generated if not provided)
         mode: Initial mode preference ('ai' or 'human') - can switch live via data channel
+        avatar: Avatar backend for this session (one of AVATAR_BACKENDS_ENABLED); agent default if omitted
     """
+    if avatar and avatar not in AVATAR_BACKENDS_ENABLED:
+        raise HTTPException(status_code=400, detail=f"Avatar backend '{avatar}' is not enabled "
+                                                    f"(expected one of {', '.join(sorted(AVATAR_BACKENDS_ENABLED))})")
+
     if identity is None:
         identity = f"user-{datetime.now().strftime('%H%M%S')}"
 
@@ -79,6 +88,9 @@ async def get_token(room: str = "avatar-room", identity: str = None, mode: str =
             can_publish_data=True,
             agent=True,  # Allow agent interactions
         ))
+    if avatar:
+        # Read by the agent when it picks the avatar backend for this session
+        token = token.with_attributes({"avatar_backend": avatar})
     
     # Agent is auto-dispatched by LiveKit when participant joins (no manual dispatch needed)
 
@@ -88,6 +100,7 @@ async def get_token(room: str = "avatar-room", identity: str = None, mode: str =
         "room": room_name,
         "identity": identity,
         "mode": mode,
+        "avatar": avatar,
     }
 
 
@@ -0,0 +1,163 @@
+"""
+Avatar backends
+===============
+One interface over the avatar providers, so UnifiedAvatarAgent's STT -> brain
+-> TTS loop can drive any of them:
+
+- bithuman: BitHuman (livekit-plugins-bithuman)
+- bey: Beyond Presence (livekit-plugins-bey)
+- local: a synthetic stand-in that publishes its own video and "talks" a fixed
+  delay after the agent starts speaking; no credentials, used to calibrate
+  avatar_benchmark.py
+
+The backend is picked per session from the participant's `avatar_backend`
+attribute (set by app.py's /api/token?avatar=..., which only accepts the
+backends in AVATAR_BACKENDS_ENABLED), falling back to
+AVATAR_BACKEND. Provider plugins load lazily via plugins.py; add them to
+AGENT_PLUGINS to import them in prewarm instead.
+"""
+
+import os
+import time
+import asyncio
+import logging
+
+from livekit import rtc
+
+import plugins
+
+logger = logging.getLogger("avatar-backends")
+
+DEFAULT_BACKEND = os.getenv("AVATAR_BACKEND", "bithuman")
+BEY_AVATAR_ID = os.getenv("BEY_AVATAR_ID", "b63ba4e6-d346-45d0-ad28-5ddffaac0bd0_v2")
+LOCAL_LIPSYNC_DELAY = float(os.getenv("LOCAL_AVATAR_LIPSYNC_MS", "80")) / 1000
+LOCAL_START_DELAY = float(os.getenv("LOCAL_AVATAR_START_MS", "0")) / 1000
+LOCAL_FPS = 25
+LOCAL_SIZE = (320, 240)
+
+
+class AvatarBackend:
+    """Renders the session's speech as a video participant in the room."""
+
+    name = ""
+    in_process = False  # Publishes its video as this agent instead of joining as its own participant
+
+    def __init__(self):
+        self.start_seconds = None  # How long start() took
+
+    async def start(self, session, room: rtc.Room):
+        started = time.perf_counter()
+        await self._start(session, room)
+        self.start_seconds = time.perf_counter() - started
+        logger.info(f"⏱️ INIT: {self.name} avatar start took {self.start_seconds * 1000:.1f}ms")
+
+    async def _start(self, session, room: rtc.Room):
+        raise NotImplementedError
+
+    async def aclose(self):
+        """Provider sessions end with the AgentSession; only local resources need closing."""
+
+
+class BitHumanBackend(AvatarBackend):
+    name = "bithuman"
+
+    def __init__(self, avatar_id: str = None):
+        super().__init__()
+        self.avatar_id = avatar_id or os.getenv("BITHUMAN_AVATAR_ID")
+
+    async def _start(self, session, room: rtc.Room):
+        self._avatar = plugins.load("bithuman").AvatarSession(avatar_id=self.avatar_id)
+        await self._avatar.start(session, room=room)
+
+
+class BeyondPresenceBackend(AvatarBackend):
+    name = "bey"
+
+    def __init__(self, avatar_id: str = BEY_AVATAR_ID):
+        super().__init__()
+        self.avatar_id = avatar_id
+
+    async def _start(self, session, room: rtc.Room):
+        # The plugin reads BEY_API_KEY from the environment
+        self._avatar = plugins.load("bey").AvatarSession(avatar_id=self.avatar_id)
+        await self._avatar.start(session, room=room)
+
+
+class LocalAvatarBackend(AvatarBackend):
+    """Stand-in avatar: an idle frame, switching to a flickering "mouth" while the agent speaks."""
+
+    name = "local"
+    in_process = True
+
+    def __init__(self, lipsync_delay: float = LOCAL_LIPSYNC_DELAY, start_delay: float = LOCAL_START_DELAY):
+        super().__init__()
+        self.lipsync_delay = lipsync_delay
+        self.start_delay = start_delay
+        self._speaking_since = None
+        self._task = None
+
+    async def _start(self, session, room: rtc.Room):
+        await asyncio.sleep(self.start_delay)
+        width, height = LOCAL_SIZE
+        self._source = rtc.VideoSource(width, height)
+        track = rtc.LocalVideoTrack.create_video_track("avatar", self._source)
+        await room.local_participant.publish_track(
+            track, rtc.TrackPublishOptions(source=rtc.TrackSource.SOURCE_CAMERA)
+        )
+
+        @session.on("agent_state_changed")
+        def on_state(event):
+            self._speaking_since = time.monotonic() if event.new_state == "speaking" else None
+
+        self._task = asyncio.create_task(self._render())
+
+    async def _render(self):
+        width, height = LOCAL_SIZE
+        idle = _frame(width, height, mouth=None)
+        mouths = [_frame(width, height, mouth=level) for level in (60, 230)]
+        tick = 0
+        while True:
+            talking = self._speaking_since is not None and time.monotonic() - self._speaking_since >= self.lipsync_delay
+            self._source.capture_frame(mouths[tick % 2] if talking else idle)
+            tick += 1
+            await asyncio.sleep(1 / LOCAL_FPS)
+
+    async def aclose(self):
+        if self._task:
+            self._task.cancel()
+
+
+def _frame(width: int, height: int, mouth) -> rtc.VideoFrame:
+    """Horizontal gradient "face"; `mouth` fills the lower-middle block with that grey level."""
+    data = bytearray(width * height * 4)
+    for y in range(height):
+        for x in range(width):
+            value = (x * 255) // width
+            if mouth is not None and width // 4 <= x < 3 * width // 4 and height // 2 <= y < 5 * height // 6:
+                value = mouth if (x // 16) % 2 else 255 - mouth
+            i = (y * width + x) * 4
+            data[i] = data[i + 1] = data[i + 2] = value
+            data[i + 3] = 255
+    return rtc.VideoFrame(width, height, rtc.VideoBufferType.RGBA, bytes(data))
+
+
+BACKENDS = {
+    "bithuman": BitHumanBackend,
+    "bey": BeyondPresenceBackend,
+    "local": LocalAvatarBackend,
+}
+
+
+def select(requested: str = None) -> str:
+    """The backend to use for a session: `requested` if known, else AVATAR_BACKEND."""
+    if requested and requested in BACKENDS:
+        return requested
+    if requested:
+        logger.warning(f"Unknown avatar backend '{requested}', using {DEFAULT_BACKEND}")
+    return DEFAULT_BACKEND
+
+
+def create(name: str, **kwargs) -> AvatarBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown avatar backend '{name}' (expected one of {', '.join(BACKENDS)})")
+    return BACKENDS[name](**kwargs)
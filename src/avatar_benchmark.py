@@ -0,0 +1,301 @@
+"""
+Avatar backend benchmark
+========================
+Measures one avatar backend per job with local stand-ins for the rest of the
+pipeline: no STT, no brain, and synthetic voiced audio in place of TTS. The
+avatar is the only thing that varies between runs.
+
+Per run it records:
+- avatar start time (backend.start())
+- audio-to-lip-sync delay: from the first audio frame handed to the session
+  until the avatar's mouth region visibly changes in the room
+- resource use of the job process and its children (CPU, peak and added RSS)
+
+Run one job per backend (appends to AVATAR_BENCHMARK_OUT):
+    AVATAR_BENCHMARK=1 AVATAR_BACKEND=local python agent.py connect --room avatar-bench
+    AVATAR_BENCHMARK=1 AVATAR_BACKEND=bithuman python agent.py connect --room avatar-bench
+    AVATAR_BENCHMARK=1 AVATAR_BACKEND=bey python agent.py connect --room avatar-bench
+Then compare:
+    python avatar_benchmark.py [avatar_benchmark.jsonl]
+
+The `local` backend has a known lip-sync delay (LOCAL_AVATAR_LIPSYNC_MS), so its
+numbers show how much the measurement itself adds.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import logging
+from array import array
+from collections import deque, defaultdict
+
+import psutil
+from livekit import rtc
+
+import avatar_backends
+from vision_sampler import dhash, hash_distance
+
+logger = logging.getLogger("avatar-benchmark")
+
+ENABLED = os.getenv("AVATAR_BENCHMARK", "0") == "1"
+OUTPUT = os.getenv("AVATAR_BENCHMARK_OUT", "avatar_benchmark.jsonl")
+UTTERANCES = int(os.getenv("AVATAR_BENCHMARK_UTTERANCES", "10"))
+SAMPLE_RATE = 24000
+FRAME_SAMPLES = 480         # 20ms
+SPEECH_SECONDS = 1.5
+IDLE_SECONDS = 2.0          # Silence before each utterance; also measures idle motion
+ONSET_TIMEOUT = 3.0
+AUDIO_START_TIMEOUT = 10.0  # Until the session pulls the first frame of an utterance
+TRACK_TIMEOUT = 20.0
+MOUTH_BOX = (0.25, 0.45, 0.75, 0.9)  # Lower-middle of a portrait framing
+MIN_CHANGE_BITS = 6
+RESOURCE_INTERVAL = 0.5
+# Set by avatar workers (livekit-agents' AvatarSession) to the agent they publish for
+PUBLISH_ON_BEHALF = "lk.publish_on_behalf"
+
+
+def speech_frames() -> list:
+    """Voiced stand-in for TTS: a 140Hz buzz with harmonics and a 4Hz syllable envelope."""
+    frames = []
+    total = int(SPEECH_SECONDS * SAMPLE_RATE)
+    for start in range(0, total, FRAME_SAMPLES):
+        samples = array("h")
+        for n in range(start, start + FRAME_SAMPLES):
+            t = n / SAMPLE_RATE
+            envelope = 0.5 * (1 - math.cos(2 * math.pi * 4 * t))
+            voice = sum(math.sin(2 * math.pi * 140 * k * t) / k for k in range(1, 6))
+            samples.append(int(9000 * envelope * voice / 2.3))
+        frames.append(rtc.AudioFrame(
+            data=samples.tobytes(), sample_rate=SAMPLE_RATE, num_channels=1, samples_per_channel=FRAME_SAMPLES,
+        ))
+    return frames
+
+
+def _percentile(values: list, p: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
+
+
+class ResourceSampler:
+    """CPU and RSS of this job process and its children, sampled in the background."""
+
+    def __init__(self):
+        self._process = psutil.Process()
+        self.baseline_rss = self._rss()
+        self.cpu = []
+        self.rss = []
+        self._task = None
+
+    def _processes(self):
+        return [self._process] + self._process.children(recursive=True)
+
+    def _rss(self) -> int:
+        total = 0
+        for process in self._processes():
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+
+    def start(self):
+        for process in self._processes():
+            try:
+                process.cpu_percent(None)
+            except psutil.Error:
+                pass
+        self._task = asyncio.create_task(self._sample())
+
+    async def _sample(self):
+        while True:
+            await asyncio.sleep(RESOURCE_INTERVAL)
+            cpu = 0.0
+            for process in self._processes():
+                try:
+                    cpu += process.cpu_percent(None)
+                except psutil.Error:
+                    pass
+            self.cpu.append(cpu)
+            self.rss.append(self._rss())
+
+    def stop(self) -> dict:
+        if self._task:
+            self._task.cancel()
+        peak = max(self.rss, default=self.baseline_rss)
+        return {
+            "cpu_avg_percent": round(sum(self.cpu) / len(self.cpu), 1) if self.cpu else None,
+            "cpu_peak_percent": round(max(self.cpu), 1) if self.cpu else None,
+            "rss_peak_mb": round(peak / 1e6, 1),
+            "rss_added_mb": round((peak - self.baseline_rss) / 1e6, 1),
+        }
+
+
+class VideoWatcher:
+    """Hashes the mouth region of every avatar frame, for spotting when it starts moving."""
+
+    def __init__(self, track: rtc.Track):
+        self._track = track
+        self.frames = deque(maxlen=600)  # (monotonic time, hash)
+        self._task = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        stream = rtc.VideoStream(self._track)
+        try:
+            async for event in stream:
+                frame = event.frame.convert(rtc.VideoBufferType.RGBA)
+                self.frames.append((time.monotonic(), dhash(frame, MOUTH_BOX)))
+        finally:
+            await stream.aclose()
+
+    def idle_state(self, since: float):
+        """(baseline hash, motion noise in bits) over frames since `since`."""
+        idle = [h for t, h in self.frames if t >= since]
+        if not idle:
+            return None, 0
+        baseline = idle[-1]
+        return baseline, max(hash_distance(h, baseline) for h in idle)
+
+    async def first_change(self, after: float, baseline: int, threshold: int, timeout: float = ONSET_TIMEOUT):
+        """Time of the first frame after `after` that differs from `baseline` by more than `threshold` bits."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            for t, h in self.frames:
+                if t >= after and hash_distance(h, baseline) > threshold:
+                    return t
+            await asyncio.sleep(0.01)
+        return None
+
+    def close(self):
+        self._task.cancel()
+
+
+class AvatarBenchmark:
+    def __init__(self, ctx, backend: str = None):
+        self._ctx = ctx
+        self.backend = avatar_backends.select(backend)
+
+    async def run(self) -> dict:
+        from livekit.agents import Agent, AgentSession, AutoSubscribe
+
+        resources = ResourceSampler()
+        resources.start()
+        await self._ctx.connect(auto_subscribe=AutoSubscribe.SUBSCRIBE_ALL)
+
+        # No TTS: every utterance brings its own audio
+        session = AgentSession()
+        avatar = avatar_backends.create(self.backend)
+        watcher = None
+        result = {"backend": self.backend, "room": self._ctx.room.name, "at": time.time()}
+        try:
+            await avatar.start(session, room=self._ctx.room)
+            result["start_ms"] = round(avatar.start_seconds * 1000, 1)
+            await session.start(Agent(instructions=""), room=self._ctx.room)
+
+            track = await self._avatar_track(avatar)
+            if not track:
+                raise RuntimeError(f"no video track from the {self.backend} avatar after {TRACK_TIMEOUT:.0f}s")
+            watcher = VideoWatcher(track)
+            result["lipsync_ms"] = await self._measure_lipsync(session, watcher)
+        except Exception as e:
+            logger.error(f"❌ Benchmark failed: {e}")
+            result["error"] = str(e)
+        finally:
+            if watcher:
+                watcher.close()
+            await avatar.aclose()
+            result.update(resources.stop())
+
+        with open(OUTPUT, "a") as f:
+            f.write(json.dumps(result) + "\n")
+        logger.info(f"📊 BENCHMARK: {json.dumps(result)}")
+        self._ctx.shutdown(reason="benchmark done")
+        return result
+
+    async def _measure_lipsync(self, session, watcher: VideoWatcher) -> list:
+        audio = speech_frames()
+        delays = []
+        for i in range(UTTERANCES):
+            idle_from = time.monotonic()
+            await asyncio.sleep(IDLE_SECONDS)
+            baseline, noise = watcher.idle_state(idle_from)
+            if baseline is None:
+                logger.warning("No avatar frames during idle, skipping utterance")
+                delays.append(None)
+                continue
+
+            onset = asyncio.get_running_loop().create_future()
+
+            async def frames():
+                for frame in audio:
+                    if not onset.done():
+                        onset.set_result(time.monotonic())
+                    yield frame
+
+            handle = session.say("benchmark", audio=frames(), allow_interruptions=False, add_to_chat_ctx=False)
+            try:
+                started = await asyncio.wait_for(onset, AUDIO_START_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise RuntimeError(f"utterance {i + 1}: session didn't start playing audio "
+                                   f"within {AUDIO_START_TIMEOUT:.0f}s") from None
+            moved = await watcher.first_change(started, baseline, max(MIN_CHANGE_BITS, noise + 2))
+            delays.append(None if moved is None else round((moved - started) * 1000, 1))
+            logger.info(f"📊 BENCHMARK: utterance {i + 1}/{UTTERANCES} lip-sync {delays[-1]}ms (idle noise {noise} bits)")
+            await handle
+        return delays
+
+    async def _avatar_track(self, avatar: avatar_backends.AvatarBackend) -> rtc.Track:
+        """The avatar's video: published by this agent (in-process) or by the avatar worker
+        publishing on its behalf (cloud). Anyone else's camera, e.g. the user's, is ignored."""
+        deadline = time.monotonic() + TRACK_TIMEOUT
+        room = self._ctx.room
+        while time.monotonic() < deadline:
+            if avatar.in_process:
+                participants = [room.local_participant]
+            else:
+                participants = [p for p in room.remote_participants.values()
+                                if p.attributes.get(PUBLISH_ON_BEHALF) == room.local_participant.identity]
+            for participant in participants:
+                for pub in participant.track_publications.values():
+                    if pub.track and pub.kind == rtc.TrackKind.KIND_VIDEO:
+                        return pub.track
+            await asyncio.sleep(0.1)
+        return None
+
+
+def summarize(path: str):
+    runs = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                run = json.loads(line)
+                runs[run["backend"]].append(run)
+
+    print(f"{'backend':<10} {'runs':>4} {'start':>9} {'lip p50':>9} {'lip p95':>9} {'missed':>7} "
+          f"{'cpu avg':>8} {'rss peak':>9} {'rss +':>8}")
+    for backend, results in sorted(runs.items()):
+        ok = [r for r in results if "error" not in r]
+        delays = [d for r in ok for d in r.get("lipsync_ms", []) if d is not None]
+        missed = sum(1 for r in ok for d in r.get("lipsync_ms", []) if d is None)
+
+        def median(key):
+            return _percentile([r[key] for r in ok if r.get(key) is not None], 0.5)
+
+        def fmt(value, unit):
+            return "-" if value is None else f"{value:.0f}{unit}"
+
+        print(f"{backend:<10} {len(results):>4} {fmt(median('start_ms'), 'ms'):>9} "
+              f"{fmt(_percentile(delays, 0.5), 'ms'):>9} {fmt(_percentile(delays, 0.95), 'ms'):>9} {missed:>7} "
+              f"{fmt(median('cpu_avg_percent'), '%'):>8} {fmt(median('rss_peak_mb'), 'MB'):>9} "
+              f"{fmt(median('rss_added_mb'), 'MB'):>8}")
+        failed = [r for r in results if "error" in r]
+        if failed:
+            print(f"{'':<10} {len(failed)} run(s) failed, last: {failed[-1]['error']}")
+
+
+if __name__ == "__main__":
+    summarize(sys.argv[1] if len(sys.argv) > 1 else OUTPUT)
@@ -0,0 +1,205 @@
+"""
+Backchannel clips
+=================
+Short acknowledgements ("mm-hm", "let me think") played while the brain is
+still working on a reply, so the avatar doesn't sit silent for the whole API
+round-trip. A clip only plays when the reply hasn't arrived within
+BACKCHANNEL_DELAY_MS, and it fades out as soon as the reply is ready, so the
+real TTS follows it without a hard cut.
+
+LiveKit runs one job per process, so clips are cached on disk per voice
+(BACKCHANNEL_CACHE_DIR, one WAV per phrase) and loaded in prewarm. Only the
+first session to use a voice synthesizes them; every later process starts
+with the clips ready.
+"""
+
+import os
+import re
+import wave
+import random
+import asyncio
+import logging
+from array import array
+
+from livekit import rtc
+
+logger = logging.getLogger("backchannel")
+
+ENABLED = os.getenv("BACKCHANNEL_ENABLED", "0") == "1"
+DELAY = float(os.getenv("BACKCHANNEL_DELAY_MS", "700")) / 1000
+FADE_SECONDS = 0.15
+PHRASES = ["Mm-hm.", "Hmm.", "Let me think.", "Okay, so...", "Right."]
+CACHE_DIR = os.getenv("BACKCHANNEL_CACHE_DIR", "backchannel_cache")
+FRAME_MS = 20  # Cached clips are replayed in frames this long so fade() can ramp them
+
+_banks = {}  # voice -> ClipBank, shared by all sessions in this process
+
+
+class ClipBank:
+    """Pre-synthesized audio for PHRASES in one voice."""
+
+    def __init__(self, voice: str):
+        self.voice = voice
+        self.clips = {}  # phrase -> [rtc.AudioFrame]
+        self._loading = None
+        self._load_cached()
+
+    @classmethod
+    def for_voice(cls, voice: str) -> "ClipBank":
+        if voice not in _banks:
+            _banks[voice] = cls(voice)
+        return _banks[voice]
+
+    def _path(self, phrase: str) -> str:
+        return os.path.join(CACHE_DIR, _slug(self.voice), f"{_slug(phrase)}.wav")
+
+    def _load_cached(self):
+        for phrase in PHRASES:
+            try:
+                with wave.open(self._path(phrase), "rb") as f:
+                    self.clips[phrase] = _split(f.readframes(f.getnframes()), f.getframerate(), f.getnchannels())
+            except FileNotFoundError:
+                continue
+            except (OSError, EOFError, wave.Error) as e:
+                logger.warning(f"Ignoring unreadable backchannel clip for '{phrase}': {e}")
+
+    def _save(self, phrase: str, frames):
+        path = self._path(phrase)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with wave.open(tmp, "wb") as f:
+                f.setnchannels(frames[0].num_channels)
+                f.setsampwidth(2)
+                f.setframerate(frames[0].sample_rate)
+                for frame in frames:
+                    f.writeframes(bytes(frame.data.cast("B")))
+            os.replace(tmp, path)  # Other job processes may be writing the same clip
+        except OSError as e:
+            logger.warning(f"Could not cache backchannel clip '{phrase}': {e}")
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.clips)
+
+    def ensure(self, tts):
+        """Starts synthesizing the clips in the background (once)."""
+        if self._loading is None and len(self.clips) < len(PHRASES):
+            self._loading = asyncio.create_task(self._synthesize(tts))
+        return self._loading
+
+    async def _synthesize(self, tts):
+        for phrase in PHRASES:
+            if phrase in self.clips:
+                continue
+            try:
+                frames = []
+                async with tts.synthesize(phrase) as stream:
+                    async for audio in stream:
+                        frames.append(audio.frame)
+                if frames:
+                    self.clips[phrase] = frames
+                    self._save(phrase, frames)
+            except Exception as e:
+                logger.warning(f"Could not synthesize backchannel clip '{phrase}': {e}")
+        logger.info(f"🔈 BACKCHANNEL: {len(self.clips)} clips ready for voice {self.voice}")
+
+    def pick(self):
+        phrase = random.choice(list(self.clips))
+        return phrase, self.clips[phrase]
+
+
+def preload(voice: str):
+    """prewarm hook: loads the cached clips for voice before the process takes a job."""
+    if ENABLED:
+        bank = ClipBank.for_voice(voice)
+        logger.info(f"🔈 BACKCHANNEL: {len(bank.clips)}/{len(PHRASES)} cached clips for voice {voice}")
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+
+
+def _split(pcm: bytes, sample_rate: int, num_channels: int):
+    """16-bit PCM -> FRAME_MS frames."""
+    step = sample_rate * FRAME_MS // 1000 * num_channels * 2
+    return [
+        rtc.AudioFrame(
+            data=pcm[i:i + step],
+            sample_rate=sample_rate,
+            num_channels=num_channels,
+            samples_per_channel=len(pcm[i:i + step]) // (2 * num_channels),
+        )
+        for i in range(0, len(pcm), step)
+    ]
+
+
+def _scaled(frame: rtc.AudioFrame, gain: float) -> rtc.AudioFrame:
+    samples = array("h", bytes(frame.data.cast("B")))
+    for i in range(len(samples)):
+        samples[i] = int(samples[i] * gain)
+    return rtc.AudioFrame(
+        data=samples.tobytes(),
+        sample_rate=frame.sample_rate,
+        num_channels=frame.num_channels,
+        samples_per_channel=frame.samples_per_channel,
+    )
+
+
+class _ClipPlayback:
+    """Feeds a clip's frames to the session; fade() ramps it to silence and ends it early."""
+
+    def __init__(self, frames):
+        self._frames = frames
+        self._fading = False
+
+    def fade(self):
+        self._fading = True
+
+    async def frames(self):
+        faded = 0.0
+        for frame in self._frames:
+            if self._fading:
+                duration = frame.samples_per_channel / frame.sample_rate
+                faded += duration
+                gain = max(0.0, 1.0 - faded / FADE_SECONDS)
+                if gain <= 0.0:
+                    return
+                yield _scaled(frame, gain)
+            else:
+                yield frame
+
+
+class Backchannel:
+    """Per-session wrapper around the process-wide clip bank."""
+
+    def __init__(self, session, tts, voice: str):
+        self._session = session
+        self._bank = ClipBank.for_voice(voice)
+        self.enabled = ENABLED
+        if self.enabled:
+            self._bank.ensure(tts)
+
+    async def cover(self, reply_coro):
+        """Awaits reply_coro, playing a clip if it takes longer than DELAY."""
+        task = asyncio.ensure_future(reply_coro)
+        if not self.enabled:
+            return await task
+
+        done, _ = await asyncio.wait({task}, timeout=DELAY)
+        if done or not self._bank.ready or getattr(self._session, "current_speech", None):
+            return await task
+
+        phrase, frames = self._bank.pick()
+        playback = _ClipPlayback(frames)
+        try:
+            self._session.say(phrase, audio=playback.frames(), allow_interruptions=True, add_to_chat_ctx=False)
+        except Exception as e:
+            logger.warning(f"Backchannel playback failed: {e}")
+            return await task
+
+        try:
+            return await task
+        finally:
+            # The reply is queued behind the clip; fading shortens the gap
+            playback.fade()
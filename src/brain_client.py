@@ -0,0 +1,145 @@
+"""
+Brain client
+============
+Calls the brain's /generate endpoint under a per-turn deadline.
+
+- If the primary hasn't answered after BRAIN_HEDGE_MS, the same request is sent
+  to BRAIN_ALT_URL (when set) and whichever answers first wins; the other is
+  cancelled.
+- If nothing has answered by BRAIN_DEADLINE_MS (or every endpoint failed), a
+  local responder answers from the session's recent transcript so the turn
+  never stalls.
+
+Each turn carries a client-made `turnId`, so when both brains complete the same
+turn against a shared database, its history is written once. BRAIN_ALT_URL must
+point at a brain that honors turnId; an older one ignores it and stores the turn
+a second time.
+"""
+
+import os
+import re
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+
+import httpx
+
+logger = logging.getLogger("brain-client")
+
+DEADLINE = float(os.getenv("BRAIN_DEADLINE_MS", "6000")) / 1000
+HEDGE_DELAY = float(os.getenv("BRAIN_HEDGE_MS", "1500")) / 1000
+ALT_URL = os.getenv("BRAIN_ALT_URL")  # e.g. https://backup.example.com/api/chat
+TRANSCRIPT_LINES = 10
+
+
+class BrainError(Exception):
+    pass
+
+
+def new_turn_id() -> str:
+    """ObjectId-shaped (24 hex) id for one turn: creation time, then random bytes."""
+    return f"{int(time.time()):08x}{os.urandom(8).hex()}"
+
+
+class LocalResponder:
+    """Keeps the last few lines of the conversation and produces a holding reply from them."""
+
+    QUESTION_REPLIES = [
+        "Ooh, good question. Give me a second on that one.",
+        "Hmm, let me think about that for a sec.",
+    ]
+    STATEMENT_REPLIES = [
+        "Wait, {topic}? Tell me a bit more about that.",
+        "Yeah, {topic}... go on, I'm listening.",
+    ]
+    DEFAULT_REPLIES = [
+        "Sorry, I lost my train of thought for a second. What were you saying?",
+        "Hmm, say that again?",
+    ]
+
+    def __init__(self):
+        self.transcript = deque(maxlen=TRANSCRIPT_LINES)
+
+    def record(self, role: str, text: str):
+        if text:
+            self.transcript.append((role, text))
+
+    def respond(self) -> str:
+        last_user = next((text for role, text in reversed(self.transcript) if role == "user"), "")
+        if not last_user:
+            return random.choice(self.DEFAULT_REPLIES)
+        if last_user.rstrip().endswith("?") or re.match(r"(?i)^(what|why|how|when|where|who|do|does|can|could|would|are|is)\b", last_user):
+            return random.choice(self.QUESTION_REPLIES)
+
+        # Echo the tail of what they said so the reply sounds engaged
+        words = re.findall(r"[\w']+", last_user)
+        topic = " ".join(words[-3:]) if words else ""
+        return random.choice(self.STATEMENT_REPLIES).format(topic=topic) if topic else random.choice(self.DEFAULT_REPLIES)
+
+
+class BrainClient:
+    def __init__(self, base_url: str, alt_url: str = ALT_URL, deadline: float = DEADLINE, hedge_delay: float = HEDGE_DELAY):
+        self.base_url = base_url
+        self.alt_url = alt_url
+        self.deadline = deadline
+        self.hedge_delay = hedge_delay
+        self.fallback = LocalResponder()
+        self._http = httpx.AsyncClient(timeout=httpx.Timeout(deadline, connect=min(deadline, 3.0)))
+
+    async def generate(self, payload: dict) -> tuple:
+        """Returns (reply, data, source) where source is 'primary', 'alternate' or 'local'."""
+        self.fallback.record("user", payload.get("text", ""))
+        payload = {**payload, "turnId": payload.get("turnId") or new_turn_id()}
+        start = time.monotonic()
+        tasks = {asyncio.create_task(self._post(self.base_url, payload)): "primary"}
+        hedged = not self.alt_url
+
+        try:
+            while True:
+                elapsed = time.monotonic() - start
+                # Hedge once the delay passes, or right away if the primary already failed
+                if not hedged and (elapsed >= self.hedge_delay or not tasks):
+                    hedged = True
+                    logger.info(f"⏱️ BRAIN: no answer after {elapsed * 1000:.0f}ms, hedging to alternate")
+                    tasks[asyncio.create_task(self._post(self.alt_url, payload))] = "alternate"
+
+                remaining = self.deadline - elapsed
+                if remaining <= 0 or not tasks:
+                    break
+                timeout = remaining if hedged else min(remaining, self.hedge_delay - elapsed)
+
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    source = tasks.pop(task)
+                    try:
+                        reply, data = task.result()
+                    except Exception as e:
+                        logger.warning(f"⚠️ BRAIN: {source} failed: {e}")
+                        continue
+                    self.fallback.record("avatar", reply)
+                    logger.info(f"⏱️ BRAIN: {source} answered in {(time.monotonic() - start) * 1000:.0f}ms")
+                    return reply, data, source
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        reason = "deadline" if tasks else "all endpoints failed"
+        logger.warning(f"⚠️ BRAIN: no reply ({reason}, {(time.monotonic() - start) * 1000:.0f}ms), using local responder")
+        reply = self.fallback.respond()
+        self.fallback.record("avatar", reply)
+        return reply, None, "local"
+
+    async def _post(self, base_url: str, payload: dict):
+        response = await self._http.post(f"{base_url}/generate", json=payload)
+        if response.status_code != 200:
+            raise BrainError(f"{response.status_code} - {response.text[:200]}")
+        data = response.json()
+        if not data.get("success"):
+            raise BrainError(f"API Logic failed: {data}")
+        return data.get("response", ""), data
+
+    async def aclose(self):
+        await self._http.aclose()
+
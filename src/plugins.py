@@ -0,0 +1,42 @@
+"""
+Provider plugins, loaded on demand
+==================================
+`livekit.plugins.*` modules are expensive to import, and every job subprocess
+pays for whatever agent.py imports at module level. Plugins are imported here
+the first time they're needed instead; `load_pipeline()` (called from the
+worker's prewarm) imports only the configured ones, before a job is assigned.
+
+LiveKit requires plugins to be registered from the main thread, which holds
+for both prewarm and the job entrypoint.
+"""
+
+import os
+import time
+import logging
+import importlib
+
+logger = logging.getLogger("plugins")
+
+# Plugins this worker's pipeline uses; nothing else is imported
+PIPELINE = [name.strip() for name in os.getenv("AGENT_PLUGINS", "deepgram,bithuman").split(",") if name.strip()]
+
+_loaded = {}
+import_times = {}  # plugin -> seconds spent importing it
+
+
+def load(name: str):
+    """Returns livekit.plugins.<name>, importing it on first use."""
+    module = _loaded.get(name)
+    if module is None:
+        start = time.perf_counter()
+        module = importlib.import_module(f"livekit.plugins.{name}")
+        import_times[name] = time.perf_counter() - start
+        _loaded[name] = module
+        logger.info(f"⏱️ IMPORT: livekit.plugins.{name} took {import_times[name] * 1000:.1f}ms")
+    return module
+
+
+def load_pipeline():
+    """Imports every configured plugin (call from prewarm, off the job's critical path)."""
+    for name in PIPELINE:
+        load(name)
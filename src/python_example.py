@@ -8,11 +8,11 @@ from livekit.plugins import bey, openai, silero
 from livekit.agents import (
     AutoSubscribe,
     JobContext,
+    JobProcess,
     WorkerOptions,
     cli,
     llm,
     tts,
-    vad,
     voice_assistant,
 )
 
@@ -21,13 +21,18 @@ BEY_API_KEY = "sk-WqWFLJ7Jf_AWCFTgH-L_Pg11jifisvwC4IJaQ2v41SE"
 AVATAR_ID = "b63ba4e6-d346-45d0-ad28-5ddffaac0bd0_v2"
 
 
+def prewarm(proc: JobProcess):
+    """Load the VAD once per job process, before a job is assigned"""
+    proc.userdata["vad"] = silero.VAD.load()
+
+
 async def entrypoint(ctx: JobContext):
     """Main entrypoint for the voice assistant with avatar"""
     await ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
     
     # Initialize the voice assistant
     assistant = voice_assistant.VoiceAssistant(
-        vad=vad.VAD.load(),
+        vad=ctx.proc.userdata["vad"],
         stt=openai.STT(),
         llm=llm.LLM.load(),
         tts=tts.TTS.load(),
@@ -54,4 +59,4 @@ async def entrypoint(ctx: JobContext):
 
 
 if __name__ == "__main__":
-    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint))
+    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint, prewarm_fnc=prewarm))
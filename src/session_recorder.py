@@ -0,0 +1,112 @@
+"""
+Session recorder
+================
+Opt-in, timestamped log of everything a session reacted to, so a slow
+production session can be replayed offline (see session_replay.py).
+
+Set AGENT_RECORD_DIR to enable. Each session writes
+<dir>/<room>-<unix time>.jsonl.gz, one event per line:
+
+    {"t": 12.345, "k": "stt", "type": "final_transcript", "text": "..."}
+
+t is seconds since the recording started. Event kinds: meta, audio, stt, data,
+brain_request, brain_response, tts. Inbound audio is logged as frame timing
+only; AGENT_RECORD_AUDIO=1 also stores the PCM (large, but lets STT be re-run).
+"""
+
+import os
+import json
+import gzip
+import time
+import base64
+import logging
+
+logger = logging.getLogger("session-recorder")
+
+RECORD_DIR = os.getenv("AGENT_RECORD_DIR")  # Unset = recording off
+RECORD_AUDIO = os.getenv("AGENT_RECORD_AUDIO", "0") == "1"
+FORMAT_VERSION = 1
+
+
+class SessionRecorder:
+    def __init__(self, session_name: str, directory: str = RECORD_DIR, audio: bool = RECORD_AUDIO):
+        self.enabled = bool(directory)
+        self.path = None
+        self._audio = audio
+        self._start = time.monotonic()
+        self._file = None
+        if not self.enabled:
+            return
+
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{session_name}-{int(time.time())}.jsonl.gz")
+        self._file = gzip.open(self.path, "wt", encoding="utf-8")
+        self._write("meta", version=FORMAT_VERSION, session=session_name, started=time.time(), audio=audio)
+        logger.info(f"⏺️ RECORD: session -> {self.path}")
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._start
+
+    def _write(self, kind: str, t: float = None, **fields):
+        if not self._file:
+            return
+        event = {"t": round(self.elapsed() if t is None else t, 4), "k": kind, **fields}
+        self._file.write(json.dumps(event, separators=(",", ":")) + "\n")
+        if kind != "audio":
+            # Keep what's on disk usable if the job process is killed mid-session
+            self._file.flush()
+
+    # --- Inputs -----------------------------------------------------------
+
+    def audio(self, frame):
+        if not self._file:
+            return
+        fields = {"sr": frame.sample_rate, "ch": frame.num_channels, "n": frame.samples_per_channel}
+        if self._audio:
+            fields["pcm"] = base64.b64encode(bytes(frame.data.cast("B"))).decode("ascii")
+        self._write("audio", **fields)
+
+    def stt(self, event_type, text: str):
+        self._write("stt", type=getattr(event_type, "value", str(event_type)), text=text)
+
+    def data(self, payload: dict):
+        self._write("data", payload=payload)
+
+    # --- External services ------------------------------------------------
+
+    def brain_request(self, payload: dict):
+        self._write("brain_request", payload=payload)
+
+    def brain_response(self, text: str, reply: str, source: str, elapsed: float, stats: dict = None):
+        self._write("brain_response", text=text, reply=reply, source=source, ms=round(elapsed * 1000, 1), stats=stats)
+
+    def tts(self, text: str, segments: int, started: float, elapsed: float):
+        """One utterance, from the say() call until playout finished."""
+        self._write("tts", t=started, text=text, segments=segments, ms=round(elapsed * 1000, 1))
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+            logger.info(f"⏺️ RECORD: saved {self.path}")
+
+
+def load(path: str) -> list:
+    """Reads a recording back as a list of events, in time order."""
+    opener = gzip.open if path.endswith(".gz") else open
+    events = []
+    with opener(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A session killed mid-write leaves a torn last line
+                    logger.warning(f"Skipping unreadable line in {path}")
+        except EOFError:
+            logger.warning(f"{path} is truncated; replaying what was flushed")
+    events.sort(key=lambda e: e["t"])
+    return events
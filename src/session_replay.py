@@ -0,0 +1,269 @@
+"""
+Session replay
+==============
+Feeds a recording from session_recorder.py back through UnifiedAvatarAgent
+offline. Transcripts and data-channel packets are delivered at their recorded
+times; the brain and TTS are stubbed from the log (same replies, same
+latencies), so what changes between two runs is the agent's own handling.
+
+Run with: python session_replay.py <recording.jsonl.gz> [--speed 4] [--json out.json]
+
+Replay latencies are scaled back by the speed factor so they line up with the
+recorded ones. --speed 0 skips every recorded wait and delivers each input once
+the previous turn has finished, which isolates the agent's own overhead. To
+bisect a latency regression, replay the same recording at the same speed on
+each commit and compare the per-turn numbers (--json makes them easy to diff).
+"""
+
+import sys
+import json
+import asyncio
+import logging
+import argparse
+from collections import defaultdict, deque
+
+from livekit.agents.stt import SpeechEventType
+
+import session_recorder
+import tts_pipeline
+from session_recorder import SessionRecorder
+from session_stats import SessionStats
+from agent import UnifiedAvatarAgent, AgentMode
+
+logger = logging.getLogger("session-replay")
+
+CHARS_PER_SECOND = 15  # Speech length estimate for text the recording never spoke
+
+
+class _ReplayRoom:
+    """Stands in for ctx.room: a name, and a data channel that just collects packets."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.local_participant = self
+        self.sent = []
+
+    async def publish_data(self, data: bytes, reliable: bool = True):
+        self.sent.append(json.loads(data))
+
+
+class _ReplayContext:
+    def __init__(self, name: str):
+        self.room = _ReplayRoom(name)
+
+
+class _NoBackchannel:
+    """Clips need real TTS; replay measures the reply path without them."""
+
+    async def cover(self, reply_coro):
+        return await reply_coro
+
+
+class ReplayBrain:
+    """Answers each request with the recorded reply for the same text, after the recorded latency."""
+
+    def __init__(self, events: list, speed: float):
+        self._speed = speed
+        self._replies = defaultdict(deque)
+        for event in events:
+            if event["k"] == "brain_response":
+                self._replies[event["text"]].append(event)
+
+    async def generate(self, payload: dict) -> tuple:
+        recorded = self._replies.get(payload.get("text", ""))
+        if not recorded:
+            logger.warning(f"No recorded reply for '{payload.get('text', '')[:40]}'")
+            return "", None, "local"
+        event = recorded.popleft()
+        if self._speed:
+            await asyncio.sleep(event["ms"] / 1000 / self._speed)
+        return event["reply"], {"stats": event.get("stats")}, event["source"]
+
+    async def aclose(self):
+        pass
+
+
+class ReplaySession:
+    """Stands in for AgentSession: say() plays for the recorded duration, one utterance at a time."""
+
+    current_speech = None
+
+    def __init__(self, events: list, speed: float, clock):
+        self._speed = speed
+        self._clock = clock
+        self._durations = defaultdict(deque)
+        for event in events:
+            if event["k"] == "tts":
+                self._durations[event["text"]].append(event["ms"] / 1000)
+        self._playing = None
+        self.spoken = []  # (replay time of say(), text)
+
+    def say(self, text: str, audio=None, allow_interruptions: bool = True, add_to_chat_ctx: bool = True):
+        self.spoken.append((self._clock(), text))
+        recorded = self._durations.get(text)
+        duration = recorded.popleft() if recorded else len(text) / CHARS_PER_SECOND
+        self._playing = asyncio.ensure_future(self._play(self._playing, duration, audio))
+        return self._playing
+
+    async def _play(self, previous, duration: float, audio):
+        # Like the real session, speech is queued behind whatever is still playing
+        if previous:
+            await asyncio.shield(previous)
+        if self._speed:
+            await asyncio.sleep(duration / self._speed)
+        if audio is not None:
+            await audio.aclose()
+
+    async def drain(self):
+        if self._playing:
+            await self._playing
+
+
+class Replay:
+    def __init__(self, events: list, speed: float = 1.0):
+        self.events = events
+        self.speed = speed
+        self.audio_frames = 0
+        self.audio_seconds = 0.0
+        self.turns = []
+
+    async def run(self) -> list:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        clock = lambda: loop.time() - start
+
+        meta = next((e for e in self.events if e["k"] == "meta"), {})
+        name = f"replay-{meta.get('session', 'session')}"
+        agent = UnifiedAvatarAgent(_ReplayContext(name))
+        await agent._brain.aclose()
+        agent._brain = ReplayBrain(self.events, self.speed)
+        agent._session = ReplaySession(self.events, self.speed, clock)
+        agent._backchannel = _NoBackchannel()
+        agent._tts_pipeline = tts_pipeline.SentencePipeline(None)
+        agent._recorder = SessionRecorder(name, directory=None)
+        agent._stats = SessionStats(name)
+        agent._api_session_id = "replay"
+
+        # Transcripts are handled one at a time, as in the agent's STT loop
+        transcripts = asyncio.Queue()
+
+        async def handle_transcripts():
+            while (text := await transcripts.get()) is not None:
+                try:
+                    await agent._handle_transcript(text)
+                finally:
+                    transcripts.task_done()
+
+        consumer = asyncio.create_task(handle_transcripts())
+        try:
+            for event in self.events:
+                if event["k"] not in ("audio", "stt", "data"):
+                    continue
+                if self.speed:
+                    await asyncio.sleep(max(0.0, event["t"] / self.speed - clock()))
+                elif event["k"] != "audio":
+                    # No timeline to follow: keep turns from overtaking each other
+                    await transcripts.join()
+                    if agent._text_inputs:
+                        await asyncio.gather(*agent._text_inputs)
+
+                if event["k"] == "audio":
+                    self.audio_frames += 1
+                    self.audio_seconds += event["n"] / event["sr"]
+                elif event["k"] == "stt":
+                    text = event["text"].strip()
+                    if event["type"] == SpeechEventType.FINAL_TRANSCRIPT.value and text:
+                        self._add_turn("stt", text, event["t"], clock(), agent._mode)
+                        transcripts.put_nowait(text)
+                else:
+                    payload = event["payload"]
+                    if payload.get("type") == "text_input" and payload.get("text"):
+                        self._add_turn("text", payload["text"], event["t"], clock(), agent._mode)
+                    agent._handle_data(payload)
+
+            transcripts.put_nowait(None)
+            await consumer
+            if agent._text_inputs:
+                await asyncio.gather(*agent._text_inputs)
+            await agent._session.drain()
+        finally:
+            consumer.cancel()
+            agent._stats.close()
+
+        self._match_speech(agent._session.spoken)
+        return self.turns
+
+    def _add_turn(self, kind: str, text: str, recorded_at: float, replayed_at: float, mode: AgentMode):
+        if mode == AgentMode.HUMAN:
+            reply = text  # Human mode repeats the input
+        else:
+            reply = next((e["reply"] for e in self.events
+                          if e["k"] == "brain_response" and e["text"] == text and e["t"] >= recorded_at), None)
+        recorded_speech = next((e["t"] for e in self.events
+                                if e["k"] == "tts" and e["text"] == reply and e["t"] >= recorded_at), None)
+        self.turns.append({
+            "input": kind,
+            "text": text,
+            "reply": reply,
+            "recorded_ms": None if recorded_speech is None else round((recorded_speech - recorded_at) * 1000, 1),
+            "replayed_at": replayed_at,
+            "replay_ms": None,
+        })
+
+    def _match_speech(self, spoken: list):
+        """Latency of a turn = input until say() of its reply."""
+        unclaimed = list(spoken)
+        for turn in self.turns:
+            match = next((s for s in unclaimed if s[1] == turn["reply"] and s[0] >= turn["replayed_at"]), None)
+            if match:
+                unclaimed.remove(match)
+                turn["replay_ms"] = round((match[0] - turn["replayed_at"]) * (self.speed or 1) * 1000, 1)
+
+
+def _percentile(values: list, p: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
+
+
+def report(replay: Replay):
+    print(f"{'#':>3}  {'input':<5} {'text':<40} {'recorded':>10} {'replay':>10} {'delta':>9}")
+    for i, turn in enumerate(replay.turns, 1):
+        recorded, replayed = turn["recorded_ms"], turn["replay_ms"]
+        delta = f"{replayed - recorded:+.0f}ms" if recorded is not None and replayed is not None else "-"
+        print(f"{i:>3}  {turn['input']:<5} {turn['text'][:40]:<40} "
+              f"{'-' if recorded is None else f'{recorded:.0f}ms':>10} "
+              f"{'-' if replayed is None else f'{replayed:.0f}ms':>10} {delta:>9}")
+
+    replayed = [t["replay_ms"] for t in replay.turns if t["replay_ms"] is not None]
+    recorded = [t["recorded_ms"] for t in replay.turns if t["recorded_ms"] is not None]
+    for label, values in (("recorded", recorded), ("replay", replayed)):
+        if values:
+            print(f"{label:>9}: p50 {_percentile(values, 0.5):.0f}ms, p95 {_percentile(values, 0.95):.0f}ms")
+    print(f"{replay.audio_frames} audio frames ({replay.audio_seconds:.1f}s) fed, speed x{replay.speed or 'max'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded avatar session offline")
+    parser.add_argument("recording", help="File written by session_recorder (AGENT_RECORD_DIR)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Playback speed; 0 = no waits")
+    parser.add_argument("--json", help="Also write the per-turn results here")
+    args = parser.parse_args()
+
+    events = session_recorder.load(args.recording)
+    if not events:
+        print(f"✗ No events in {args.recording}")
+        sys.exit(1)
+
+    replay = Replay(events, speed=args.speed)
+    asyncio.run(replay.run())
+    report(replay)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"recording": args.recording, "speed": args.speed, "turns": replay.turns}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
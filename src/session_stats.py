@@ -0,0 +1,189 @@
+"""
+Worker load reporting
+=====================
+LiveKit dispatches a new session to a worker only while its reported load is
+below `load_threshold`. The default load figure is host CPU alone, which lags
+behind new sessions and ignores memory and brain requests in flight, so busy
+hosts get overpacked.
+
+Each job process publishes its own counters (in-flight generations) to a small
+JSON file; `compute_load` runs in the main worker process and combines them with
+per-session CPU and memory of the job processes. The files live in a directory
+per worker (keyed by the main worker's pid), so workers sharing a host don't
+count each other's requests.
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+from contextlib import contextmanager
+
+import psutil
+
+logger = logging.getLogger("session-stats")
+
+MAX_SESSIONS = int(os.getenv("AGENT_MAX_SESSIONS", "4"))  # 0 = no session cap
+LOAD_THRESHOLD = float(os.getenv("AGENT_LOAD_THRESHOLD", "0.75"))
+# Brain requests one session can reasonably have outstanding (a reply + a text input)
+GENERATIONS_PER_SESSION = 2
+# Set on import in the main worker process; job processes inherit it through the environment
+WORKER_PID = os.environ.setdefault("AGENT_WORKER_PID", str(os.getpid()))
+STATS_DIR = os.path.join(os.getenv("AGENT_STATS_DIR", os.path.join(tempfile.gettempdir(), "avatar-agent-stats")),
+                         f"worker-{WORKER_PID}")
+LOG_INTERVAL = 30  # Seconds between load log lines
+
+_processes = {}  # pid -> psutil.Process, kept so cpu_percent() measures since the last call
+_last_log = 0.0
+
+
+class SessionStats:
+    """Counters for the session running in this job process."""
+
+    def __init__(self, session_name: str, metrics_port: int = None):
+        self.session_name = session_name
+        self.metrics_port = metrics_port  # worker_metrics endpoint of this job process
+        self.pid = os.getpid()
+        self.started_at = time.time()
+        self.in_flight = 0
+        self.generations = 0
+        self._path = os.path.join(STATS_DIR, f"{self.pid}.json")
+        os.makedirs(STATS_DIR, exist_ok=True)
+        self._publish()
+
+    @contextmanager
+    def generation(self):
+        """Wraps one brain request so the worker can see it in flight."""
+        self.in_flight += 1
+        self.generations += 1
+        self._publish()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._publish()
+
+    def close(self):
+        """Session ended: stop counting towards this worker's load."""
+        try:
+            os.remove(self._path)
+        except OSError:
+            pass
+
+    def _publish(self):
+        tmp = f"{self._path}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({
+                    "session": self.session_name,
+                    "pid": self.pid,
+                    "started_at": self.started_at,
+                    "in_flight": self.in_flight,
+                    "generations": self.generations,
+                    "metrics_port": self.metrics_port,
+                }, f)
+            os.replace(tmp, self._path)
+        except OSError as e:
+            logger.debug(f"Could not publish session stats: {e}")
+
+
+def _job_processes():
+    """Live job processes under this worker, with primed CPU counters."""
+    current = {}
+    for child in psutil.Process().children(recursive=True):
+        proc = _processes.get(child.pid) or child
+        if child.pid not in _processes:
+            proc.cpu_percent(None)  # First call only primes the counter
+        current[child.pid] = proc
+    _processes.clear()
+    _processes.update(current)
+    return current
+
+
+def _read_published():
+    """Counters published by job processes that are still alive."""
+    published = []
+    try:
+        names = os.listdir(STATS_DIR)
+    except OSError:
+        return published
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(STATS_DIR, name)
+        try:
+            with open(path) as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if psutil.pid_exists(stats.get("pid", -1)):
+            published.append(stats)
+        else:
+            # Job process died without cleaning up
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return published
+
+
+def memory_sharing(processes) -> dict:
+    """
+    RSS counts pages shared between job processes (forkserver copy-on-write,
+    shared libraries) once per process; PSS splits them between the sharers.
+    The difference is memory the host would need if nothing were shared.
+    """
+    rss = pss = 0
+    for proc in processes:
+        try:
+            info = proc.memory_full_info()
+        except psutil.Error:
+            continue
+        rss += info.rss
+        pss += getattr(info, "pss", info.rss)  # PSS is Linux-only
+    return {"rss": rss, "pss": pss, "saved": rss - pss}
+
+
+def compute_load(worker=None) -> float:
+    """
+    load_fnc for WorkerOptions: the highest of session slots used, job CPU share,
+    host memory use and in-flight brain requests, each as a 0-1 fraction.
+    A worker at its session cap (if AGENT_MAX_SESSIONS sets one) always reports 1.0.
+    """
+    global _last_log
+
+    if worker is not None and hasattr(worker, "active_jobs"):
+        sessions = len(worker.active_jobs)
+    else:
+        sessions = len(_read_published())
+
+    cpu = 0.0
+    processes = _job_processes().values()
+    for proc in processes:
+        try:
+            cpu += proc.cpu_percent(None)
+        except psutil.Error:
+            continue
+    cpu_share = cpu / (100.0 * (psutil.cpu_count() or 1))
+    memory = psutil.virtual_memory()
+    in_flight = sum(s.get("in_flight", 0) for s in _read_published())
+
+    components = {
+        "sessions": sessions / MAX_SESSIONS if MAX_SESSIONS else 0.0,
+        "cpu": cpu_share,
+        "memory": memory.percent / 100.0,
+        "generations": in_flight / (MAX_SESSIONS * GENERATIONS_PER_SESSION) if MAX_SESSIONS else 0.0,
+    }
+    load = 1.0 if MAX_SESSIONS and sessions >= MAX_SESSIONS else min(1.0, max(components.values()))
+
+    if time.time() - _last_log > LOG_INTERVAL:
+        _last_log = time.time()
+        # smaps is slow to read, so memory sharing is only measured for the log line
+        shared = memory_sharing(processes)
+        per_session = (f"{cpu / sessions:.0f}% cpu, {shared['pss'] / sessions / 1e6:.0f}MB pss "
+                       f"({shared['rss'] / sessions / 1e6:.0f}MB rss)") if sessions else "idle"
+        logger.info(f"📊 LOAD: {load:.2f} ({sessions}/{MAX_SESSIONS} sessions, {in_flight} in flight, "
+                    f"per session {per_session}, shared across jobs {shared['saved'] / 1e6:.0f}MB, "
+                    f"host mem {memory.percent:.0f}%)")
+    return load
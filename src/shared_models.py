@@ -0,0 +1,52 @@
+"""
+Shared local models
+===================
+Local audio models (Silero VAD) are loaded once per worker, not once per
+session:
+
+- The main worker process tells the multiprocessing forkserver to import the
+  model runtimes (onnxruntime, numpy, the Silero plugin) before it forks
+  anything. Every job process forks from that server, so those pages are
+  shared copy-on-write instead of being loaded again by each job.
+- prewarm() then builds the VAD in each job process while it waits in the idle
+  pool, so a new session doesn't wait for it. ONNX sessions don't survive a
+  fork, so the inference session itself is per process.
+- Inference state is per session: AgentSession opens its own stream on the
+  shared VAD.
+
+session_stats.py reports how much memory the job processes share (RSS - PSS).
+Set AGENT_VAD=0 to run without a local VAD.
+"""
+
+import os
+import time
+import logging
+import multiprocessing
+
+import plugins
+
+logger = logging.getLogger("shared-models")
+
+VAD_ENABLED = os.getenv("AGENT_VAD", "1") == "1"
+MP_CONTEXT = "forkserver"  # Job processes fork from a server that already holds PRELOAD_MODULES
+PRELOAD_MODULES = ["numpy", "onnxruntime", "livekit.plugins.silero"]
+
+
+def share_with_job_processes():
+    """Call in the main worker process, before cli.run_app starts the forkserver."""
+    if VAD_ENABLED:
+        multiprocessing.set_forkserver_preload(PRELOAD_MODULES)
+
+
+def load(proc):
+    """prewarm hook: builds this job process's VAD and keeps it in proc.userdata."""
+    if not VAD_ENABLED:
+        return
+    start = time.perf_counter()
+    proc.userdata["vad"] = plugins.load("silero").VAD.load()
+    logger.info(f"⏱️ PREWARM: Silero VAD ready in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+
+def vad(proc):
+    """The prewarmed VAD (None if disabled); each session streams from it with its own state."""
+    return proc.userdata.get("vad") if VAD_ENABLED else None
@@ -0,0 +1,74 @@
+"""
+Worker import-time budget
+=========================
+Every job subprocess imports agent.py before it can take a session, so import
+time adds directly to cold-start latency. This imports the agent module in a
+fresh interpreter with `-X importtime` and fails when the total goes over the
+budget.
+
+Run with: python test_import_budget.py [--budget-ms 1500] [--report 25]
+(or via pytest). --report prints the slowest modules by cumulative time.
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+
+BUDGET_MS = float(os.getenv("AGENT_IMPORT_BUDGET_MS", "1500"))
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def profile_imports(module: str = "agent"):
+    """Returns [(module, self_us, cumulative_us)] for a cold import of `module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def total_ms(rows, module: str = "agent") -> float:
+    # The module's own row (listed last, once its imports finish) holds the cumulative total
+    return next(cumulative for name, _, cumulative in reversed(rows) if name.strip() == module) / 1000
+
+
+def report(rows, limit: int):
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda r: r[2], reverse=True)[:limit]:
+        print(f"{cumulative_us / 1000:10.1f}ms {self_us / 1000:8.1f}ms  {name.strip()}")
+
+
+def test_worker_import_budget():
+    elapsed = total_ms(profile_imports())
+    assert elapsed <= BUDGET_MS, f"agent import took {elapsed:.0f}ms (budget {BUDGET_MS:.0f}ms)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check agent worker import time against a budget")
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument("--report", type=int, default=0, help="Print the N slowest modules")
+    args = parser.parse_args()
+
+    rows = profile_imports()
+    elapsed = total_ms(rows)
+    if args.report:
+        report(rows, args.report)
+
+    if elapsed > args.budget_ms:
+        print(f"✗ Agent import took {elapsed:.0f}ms (budget {args.budget_ms:.0f}ms)")
+        sys.exit(1)
+    print(f"✓ Agent import took {elapsed:.0f}ms (budget {args.budget_ms:.0f}ms)")
+
+
+if __name__ == "__main__":
+    main()
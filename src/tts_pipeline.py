@@ -0,0 +1,106 @@
+"""
+Sentence-pipelined TTS
+======================
+Sending a whole reply to TTS as one request means no audio until the service
+has processed all of it. Here the reply is split into sentences (long ones at
+clause boundaries) and up to TTS_LOOKAHEAD segments are synthesized ahead of
+the one playing. Frames are streamed to the session strictly in order, so the
+first audio only waits for the first sentence.
+
+When the speech is interrupted the session closes the frame iterator, which
+cancels every segment still being synthesized.
+"""
+
+import os
+import re
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger("tts-pipeline")
+
+ENABLED = os.getenv("TTS_PIPELINE", "1") == "1"
+LOOKAHEAD = int(os.getenv("TTS_LOOKAHEAD", "2"))
+MIN_SEGMENT_CHARS = 20   # Shorter sentences are merged into the next one
+MAX_SEGMENT_CHARS = 200  # Longer sentences are split at clause boundaries
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+_CLAUSE_END = re.compile(r"(?<=[,;:—])\s+")
+
+
+def split_segments(text: str) -> list:
+    """Splits a reply into speakable segments, in order."""
+    pieces = []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        if len(sentence) <= MAX_SEGMENT_CHARS:
+            pieces.append(sentence)
+            continue
+        current = ""
+        for clause in _CLAUSE_END.split(sentence):
+            if current and len(current) + len(clause) + 1 > MAX_SEGMENT_CHARS:
+                pieces.append(current)
+                current = clause
+            else:
+                current = f"{current} {clause}".strip()
+        if current:
+            pieces.append(current)
+
+    segments = []
+    carry = ""
+    for piece in pieces:
+        carry = f"{carry} {piece}".strip()
+        if len(carry) >= MIN_SEGMENT_CHARS:
+            segments.append(carry)
+            carry = ""
+    if carry:
+        if segments:
+            segments[-1] = f"{segments[-1]} {carry}"
+        else:
+            segments.append(carry)
+    return segments
+
+
+class SentencePipeline:
+    def __init__(self, tts, lookahead: int = LOOKAHEAD):
+        self._tts = tts
+        self._lookahead = max(0, lookahead)
+
+    async def frames(self, segments: list):
+        """Async iterator of audio frames for `segments`, synthesized ahead, yielded in order."""
+        pending = iter(segments)
+        in_flight = deque()  # (task, queue) per segment, oldest first
+
+        def fill():
+            while len(in_flight) <= self._lookahead:
+                segment = next(pending, None)
+                if segment is None:
+                    return
+                queue = asyncio.Queue()
+                in_flight.append((asyncio.create_task(self._synthesize(segment, queue)), queue))
+
+        try:
+            fill()
+            while in_flight:
+                _, queue = in_flight[0]
+                # Stream the head segment as it arrives; later ones keep synthesizing meanwhile
+                while (frame := await queue.get()) is not None:
+                    yield frame
+                in_flight.popleft()
+                fill()
+        finally:
+            # Interrupted (iterator closed) or done: stop any look-ahead still running
+            for task, _ in in_flight:
+                task.cancel()
+
+    async def _synthesize(self, segment: str, queue: asyncio.Queue):
+        try:
+            async with self._tts.synthesize(segment) as stream:
+                async for audio in stream:
+                    queue.put_nowait(audio.frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Skip the segment rather than stalling the rest of the reply
+            logger.warning(f"TTS failed for segment '{segment[:40]}': {e}")
+        finally:
+            queue.put_nowait(None)
@@ -0,0 +1,209 @@
+"""
+Agent-side vision sampling
+==========================
+Optional replacement for the browser's `vision` data packets: the agent
+subscribes to the participant's camera itself and samples frames at a low,
+adaptive rate. Each sample is reduced to a 64-bit difference hash (dHash);
+frames within VISION_CHANGE_BITS of the last described one are skipped, so the
+describer only runs on scene changes.
+
+The sampling interval starts at VISION_MIN_INTERVAL_MS, backs off towards
+VISION_MAX_INTERVAL_MS while the scene stays still, and drops back to the
+minimum as soon as it changes.
+
+Describers are pluggable (`async describe(frame) -> str`):
+- openai: a small vision model call on a downscaled JPEG
+- stub: local and deterministic, for tests and offline runs
+
+Set AGENT_VISION=1 to enable. Browser vision packets are still accepted.
+"""
+
+import os
+import io
+import time
+import base64
+import asyncio
+import logging
+
+from livekit import rtc
+
+from worker_metrics import metrics
+
+logger = logging.getLogger("vision-sampler")
+
+ENABLED = os.getenv("AGENT_VISION", "0") == "1"
+DESCRIBER = os.getenv("VISION_DESCRIBER", "openai")  # openai | stub
+VISION_MODEL = os.getenv("VISION_MODEL", "gpt-4o-mini")
+MIN_INTERVAL = float(os.getenv("VISION_MIN_INTERVAL_MS", "1000")) / 1000
+MAX_INTERVAL = float(os.getenv("VISION_MAX_INTERVAL_MS", "8000")) / 1000
+CHANGE_BITS = int(os.getenv("VISION_CHANGE_BITS", "10"))  # Of 64; higher = fewer describer calls
+BACKOFF = 1.5
+HASH_SAMPLES = 4        # Pixels read per side of each hash cell
+DESCRIBE_MAX_SIDE = 512  # JPEG size sent to the describer
+
+PROMPT = ("Describe what the camera shows in one or two short sentences: the person, "
+          "what they're doing or holding, and anything notable in the background.")
+
+
+# =============================================================================
+# Frame hashing
+# =============================================================================
+def dhash(frame: rtc.VideoFrame, box=(0.0, 0.0, 1.0, 1.0)) -> int:
+    """64-bit difference hash of an RGBA frame: brightness gradients over a 9x8 grid.
+
+    `box` (left, top, right, bottom as fractions) limits the hash to part of the frame.
+    """
+    width, height, data = frame.width, frame.height, frame.data
+    cols, rows = 9, 8
+    left, top = box[0] * width, box[1] * height
+    cell_w, cell_h = (box[2] - box[0]) * width / cols, (box[3] - box[1]) * height / rows
+    grid = []
+    for row in range(rows):
+        for col in range(cols):
+            total = 0
+            for sy in range(HASH_SAMPLES):
+                y = int(top + (row + (sy + 0.5) / HASH_SAMPLES) * cell_h)
+                for sx in range(HASH_SAMPLES):
+                    x = int(left + (col + (sx + 0.5) / HASH_SAMPLES) * cell_w)
+                    i = (y * width + x) * 4
+                    # Integer luma approximation (0.299 R + 0.587 G + 0.114 B)
+                    total += (77 * data[i] + 150 * data[i + 1] + 29 * data[i + 2]) >> 8
+            grid.append(total)
+
+    bits = 0
+    for row in range(rows):
+        for col in range(cols - 1):
+            bits = (bits << 1) | (grid[row * cols + col] > grid[row * cols + col + 1])
+    return bits
+
+
+def hash_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def to_jpeg(frame: rtc.VideoFrame, max_side: int = DESCRIBE_MAX_SIDE) -> bytes:
+    from PIL import Image  # Only needed by describers that send images
+
+    image = Image.frombytes("RGBA", (frame.width, frame.height), bytes(frame.data)).convert("RGB")
+    image.thumbnail((max_side, max_side))
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=70)
+    return out.getvalue()
+
+
+# =============================================================================
+# Describers
+# =============================================================================
+class StubDescriber:
+    """Local describer: a deterministic line from frame size and brightness."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def describe(self, frame: rtc.VideoFrame) -> str:
+        self.calls += 1
+        data = frame.data
+        step = max(4, (len(data) // 4 // 256) * 4)
+        samples = [data[i] for i in range(0, len(data) - 3, step)]
+        brightness = sum(samples) / max(len(samples), 1)
+        tone = "a bright" if brightness > 160 else "a dim" if brightness < 70 else "an evenly lit"
+        return f"Scene {self.calls}: {tone} {frame.width}x{frame.height} camera view."
+
+
+class OpenAIDescriber:
+    def __init__(self, model: str = VISION_MODEL):
+        from openai import AsyncOpenAI  # Installed with livekit-plugins-openai
+
+        self.model = model
+        self._client = AsyncOpenAI()
+
+    async def describe(self, frame: rtc.VideoFrame) -> str:
+        jpeg = await asyncio.to_thread(to_jpeg, frame)
+        image_url = "data:image/jpeg;base64," + base64.b64encode(jpeg).decode("ascii")
+        response = await self._client.chat.completions.create(
+            model=self.model,
+            max_tokens=80,
+            messages=[{"role": "user", "content": [
+                {"type": "text", "text": PROMPT},
+                {"type": "image_url", "image_url": {"url": image_url, "detail": "low"}},
+            ]}],
+        )
+        return (response.choices[0].message.content or "").strip()
+
+
+DESCRIBERS = {
+    "openai": OpenAIDescriber,
+    "stub": StubDescriber,
+}
+
+
+def make_describer(name: str = DESCRIBER):
+    if name not in DESCRIBERS:
+        raise ValueError(f"Unknown vision describer '{name}' (expected one of {', '.join(DESCRIBERS)})")
+    return DESCRIBERS[name]()
+
+
+# =============================================================================
+# Sampler
+# =============================================================================
+class VisionSampler:
+    def __init__(self, describer, on_description, min_interval: float = MIN_INTERVAL,
+                 max_interval: float = MAX_INTERVAL, change_bits: int = CHANGE_BITS):
+        self._describer = describer
+        self._on_description = on_description  # Called with each new description
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.change_bits = change_bits
+        self.interval = min_interval
+        self._last_hash = None
+        self._describing = None
+        self.sampled = 0
+        self.skipped = 0
+        self.described = 0
+
+    async def run(self, track: rtc.Track):
+        """Samples `track` until it ends or the task is cancelled."""
+        # Frames reach us already decoded; capacity=1 keeps only the newest one queued instead of a backlog
+        stream = rtc.VideoStream(track, capacity=1)
+        next_sample = 0.0
+        logger.info(f"👁️ VISION: sampling every {self.min_interval:.1f}-{self.max_interval:.1f}s")
+        try:
+            async for event in stream:
+                now = time.monotonic()
+                if now < next_sample:
+                    continue  # Skipped before the RGBA conversion and hashing; the camera runs far faster than we sample
+                self.sample(event.frame.convert(rtc.VideoBufferType.RGBA))
+                next_sample = now + self.interval
+        finally:
+            await stream.aclose()
+            if self._describing:
+                self._describing.cancel()
+            logger.info(f"👁️ VISION: {self.sampled} frames sampled, {self.skipped} unchanged, "
+                        f"{self.described} described")
+
+    def sample(self, frame: rtc.VideoFrame):
+        """Hashes one RGBA frame, adapts the interval and describes it if the scene changed."""
+        self.sampled += 1
+        frame_hash = dhash(frame)
+        changed = self._last_hash is None or hash_distance(frame_hash, self._last_hash) > self.change_bits
+        if not changed:
+            self.skipped += 1
+            self.interval = min(self.max_interval, self.interval * BACKOFF)
+            return
+        self.interval = self.min_interval
+        if self._describing and not self._describing.done():
+            return  # Still describing the previous change; this frame gets compared again next sample
+        self._last_hash = frame_hash
+        self._describing = asyncio.create_task(self._describe(frame))
+
+    async def _describe(self, frame: rtc.VideoFrame):
+        try:
+            with metrics.track("vision"):
+                description = await self._describer.describe(frame)
+        except Exception as e:
+            logger.warning(f"Vision describer failed: {e}")
+            self._last_hash = None  # Try again on the next sample
+            return
+        self.described += 1
+        if description:
+            self._on_description(description)
@@ -0,0 +1,187 @@
+"""
+Worker metrics
+==============
+Per-process metrics for the avatar agent, served as JSON on a local HTTP port:
+active sessions, sessions per mode, STT/brain/TTS work in flight, queue depths,
+and a histogram of asyncio event-loop lag.
+
+A watchdog task measures loop lag every LAG_INTERVAL seconds. A stalled loop
+can't run that task, so a separate thread notices the missing heartbeat and
+records the loop thread's stack while the stall is still happening.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import Counter, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("worker-metrics")
+
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = int(os.getenv("AGENT_METRICS_PORT", "0"))  # 0 = any free port (one per job process);
+                                                          # a fixed port only binds in the first job process
+LAG_INTERVAL = 0.1                                        # Seconds between watchdog ticks
+STALL_THRESHOLD = float(os.getenv("AGENT_STALL_MS", "200")) / 1000
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+STALLS_KEPT = 10
+
+
+class WorkerMetrics:
+    def __init__(self):
+        self.sessions = 0
+        self.modes = Counter()
+        self.in_flight = Counter()
+        self.completed = Counter()
+        self.port = None
+        self._queues = {}
+        self._lag_counts = [0] * (len(LAG_BUCKETS_MS) + 1)
+        self._lag_max = 0.0
+        self._stalls = deque(maxlen=STALLS_KEPT)
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = None
+        self._started = False
+
+    def start(self):
+        """Starts the HTTP endpoint and the watchdog (once per process, from inside the event loop)."""
+        if self._started:
+            return
+        self._started = True
+
+        try:
+            server = ThreadingHTTPServer((METRICS_HOST, METRICS_PORT), _handler(self))
+        except OSError as e:
+            if not METRICS_PORT:
+                raise
+            # Every job process on the worker serves its own metrics; only one can have the fixed port
+            logger.warning(f"Metrics port {METRICS_PORT} unavailable ({e}), using a free port")
+            server = ThreadingHTTPServer((METRICS_HOST, 0), _handler(self))
+        self.port = server.server_address[1]
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+
+        self._loop_thread_id = threading.get_ident()
+        asyncio.get_running_loop().create_task(self._watch_loop())
+        threading.Thread(target=self._watch_stalls, name="loop-watchdog", daemon=True).start()
+        logger.info(f"📈 METRICS: http://{METRICS_HOST}:{self.port}/metrics")
+
+    # --- Sessions ---------------------------------------------------------
+
+    def session_started(self, mode: str):
+        self.sessions += 1
+        self.modes[mode] += 1
+
+    def mode_changed(self, old: str, new: str):
+        self.modes[old] -= 1
+        self.modes[new] += 1
+
+    def session_ended(self, mode: str):
+        self.sessions -= 1
+        self.modes[mode] -= 1
+
+    # --- Work in flight / queues -----------------------------------------
+
+    @contextmanager
+    def track(self, stage: str):
+        """Counts one unit of work (an STT stream, a brain request, a TTS utterance) while it runs."""
+        self.in_flight[stage] += 1
+        try:
+            yield
+        finally:
+            self.in_flight[stage] -= 1
+            self.completed[stage] += 1
+
+    def register_queue(self, name: str, depth_fn):
+        """depth_fn() -> int is sampled on every snapshot."""
+        self._queues[name] = depth_fn
+
+    def unregister_queue(self, name: str):
+        self._queues.pop(name, None)
+
+    # --- Snapshot ---------------------------------------------------------
+
+    def snapshot(self) -> dict:
+        queues = {}
+        for name, depth_fn in list(self._queues.items()):
+            try:
+                queues[name] = depth_fn()
+            except Exception:
+                queues[name] = None
+        buckets = {f"le_{b}ms": n for b, n in zip(LAG_BUCKETS_MS, self._lag_counts)}
+        buckets["inf"] = self._lag_counts[-1]
+        return {
+            "pid": os.getpid(),
+            "sessions": self.sessions,
+            "modes": {m: n for m, n in self.modes.items() if n},
+            "in_flight": dict(self.in_flight),
+            "completed": dict(self.completed),
+            "queues": queues,
+            "loop_lag": {
+                "buckets": buckets,
+                "max_ms": round(self._lag_max * 1000, 1),
+                "stall_threshold_ms": STALL_THRESHOLD * 1000,
+            },
+            "stalls": list(self._stalls),
+        }
+
+    # --- Watchdog ---------------------------------------------------------
+
+    async def _watch_loop(self):
+        while True:
+            expected = time.monotonic() + LAG_INTERVAL
+            await asyncio.sleep(LAG_INTERVAL)
+            now = time.monotonic()
+            self._heartbeat = now
+            self._record_lag(max(0.0, now - expected))
+
+    def _record_lag(self, lag: float):
+        self._lag_max = max(self._lag_max, lag)
+        lag_ms = lag * 1000
+        for i, bound in enumerate(LAG_BUCKETS_MS):
+            if lag_ms <= bound:
+                self._lag_counts[i] += 1
+                return
+        self._lag_counts[-1] += 1
+
+    def _watch_stalls(self):
+        """Runs in its own thread: dumps the loop thread's stack once per stall."""
+        dumped_for = None
+        while True:
+            time.sleep(LAG_INTERVAL)
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - LAG_INTERVAL
+            if stalled < STALL_THRESHOLD or dumped_for == heartbeat:
+                continue
+            dumped_for = heartbeat
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "(loop thread not found)"
+            self._stalls.append({"at": time.time(), "stalled_ms": round(stalled * 1000), "stack": stack})
+            logger.warning(f"🐢 LOOP STALL: event loop blocked for {stalled * 1000:.0f}ms+\n{stack}")
+
+
+def _handler(metrics: WorkerMetrics):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = json.dumps(metrics.snapshot(), indent=2).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Keep scrapes out of the agent log
+
+    return MetricsHandler
+
+
+metrics = WorkerMetrics()